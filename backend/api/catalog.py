@@ -0,0 +1,127 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+
+from foodgram.compression import (available_encodings, choose_encoding,
+                                  compress)
+from recipes.models import Ingredient, IngredientChange, Tag
+from .renderers import FastJSONRenderer
+from .serializers import IngredientSerializer, TagSerializer
+
+CATALOG_CACHE_KEY = 'ingredients:catalog'
+SNAPSHOT_CACHE_KEY = 'ingredients:snapshot'
+TAGS_CACHE_KEY = 'tags:list'
+
+
+def encode(data):
+    """Rendered JSON and its compressed variants by encoding."""
+    data = FastJSONRenderer().render(data)
+    blob = {None: data}
+    for encoding in available_encodings():
+        blob[encoding] = compress(data, encoding)
+    return blob
+
+
+def build_catalog():
+    return encode(
+        IngredientSerializer(Ingredient.objects.all(), many=True).data
+    )
+
+
+def get_catalog():
+    catalog = cache.get(CATALOG_CACHE_KEY)
+    if catalog is None:
+        catalog = build_catalog()
+        cache.set(
+            CATALOG_CACHE_KEY, catalog, settings.CATALOG_CACHE_TIMEOUT
+        )
+    return catalog
+
+
+def invalidate_catalog():
+    cache.delete(CATALOG_CACHE_KEY)
+
+
+def encoded_response(request, blob):
+    encoding = choose_encoding(request)
+    response = HttpResponse(blob[encoding], content_type='application/json')
+    if encoding is not None:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def catalog_response(request):
+    return encoded_response(request, get_catalog())
+
+
+def get_revision():
+    """Latest catalog revision older than INGREDIENT_SYNC_OVERLAP. Later
+    changes may still have transactions with lower ids in flight, so
+    clients receive them again on the next sync instead of missing one."""
+    settled = timezone.now() - timedelta(
+        seconds=settings.INGREDIENT_SYNC_OVERLAP
+    )
+    return IngredientChange.objects.filter(created__lte=settled).order_by(
+        '-id'
+    ).values_list('id', flat=True).first() or 0
+
+
+def get_snapshot(revision):
+    snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+    if snapshot is None or snapshot['revision'] != revision:
+        snapshot = encode({
+            'revision': revision,
+            'full': True,
+            'ingredients': IngredientSerializer(
+                Ingredient.objects.all(), many=True
+            ).data,
+        })
+        snapshot['revision'] = revision
+        cache.set(
+            SNAPSHOT_CACHE_KEY, snapshot, settings.CATALOG_CACHE_TIMEOUT
+        )
+    return snapshot
+
+
+def get_changes(since, revision):
+    """Ingredients changed and deleted after revision since, or None
+    when the client is too far behind and should take the snapshot."""
+    if not 0 <= since <= revision:
+        return None
+    limit = settings.INGREDIENT_SYNC_MAX_CHANGES
+    ids = set(
+        IngredientChange.objects.filter(id__gt=since).order_by().values_list(
+            'ingredient_id', flat=True
+        ).distinct()[:limit + 1]
+    )
+    if len(ids) > limit:
+        return None
+    changed = IngredientSerializer(
+        Ingredient.objects.filter(pk__in=ids), many=True
+    ).data
+    return {
+        'revision': revision,
+        'full': False,
+        'changed': changed,
+        'deleted': sorted(ids - {ingredient['id'] for ingredient in changed}),
+    }
+
+
+def get_tags():
+    tags = cache.get(TAGS_CACHE_KEY)
+    if tags is None:
+        tags = [
+            dict(tag)
+            for tag in TagSerializer(Tag.objects.all(), many=True).data
+        ]
+        cache.set(TAGS_CACHE_KEY, tags, settings.CATALOG_CACHE_TIMEOUT)
+    return tags
+
+
+def invalidate_tags():
+    cache.delete(TAGS_CACHE_KEY)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register(checks.Tags.compatibility)
+def snapshot_settings(app_configs, **kwargs):
+    """Snapshots with relative image URLs would not match the pages of
+    the backend, so publishing needs the public site address."""
+    if settings.RECIPE_SNAPSHOT_DIR and not settings.RECIPE_SNAPSHOT_ORIGIN:
+        return [checks.Error(
+            'RECIPE_SNAPSHOT_DIR задан без RECIPE_SNAPSHOT_ORIGIN.',
+            hint='Укажите в RECIPE_SNAPSHOT_ORIGIN адрес сайта, '
+                 'например https://foodgram.example.',
+            id='api.E001',
+        )]
+    return []
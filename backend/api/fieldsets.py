@@ -0,0 +1,114 @@
+from rest_framework.serializers import ListSerializer
+
+PARAMS = ('fields', 'omit', 'expand')
+
+
+def parse_paths(value):
+    """'id,author.username' -> {'id': {}, 'author': {'username': {}}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class Selection:
+    """Fields requested with ?fields=, ?omit= and ?expand= for one level
+    of a serializer. Dotted names address nested serializers:
+    ?fields=id,name,author.username or ?omit=author.is_subscribed."""
+
+    def __init__(self, fields=None, omit=None, expand=None):
+        self.fields = fields
+        self.omit = omit or {}
+        self.expand = expand or {}
+
+    @classmethod
+    def from_request(cls, request):
+        params = request.query_params
+        fields, omit, expand = (
+            parse_paths(params[name]) if params.get(name) else None
+            for name in PARAMS
+        )
+        return cls(fields, omit, expand)
+
+    def includes(self, name, expandable=False):
+        if self.omit.get(name) == {}:
+            return False
+        if name in self.expand:
+            return True
+        if self.fields is not None:
+            return name in self.fields
+        return not expandable
+
+    def child(self, name):
+        return Selection(
+            self.fields.get(name) or None if self.fields is not None
+            else None,
+            self.omit.get(name),
+            self.expand.get(name)
+        )
+
+
+ALL = Selection()
+
+
+class DynamicFieldsMixin:
+    """Serializer mixin that drops the fields the client did not select.
+    Only the outermost serializer of a GET request reads the query
+    string; nested ones get their part of the selection from it.
+    Fields built by `expandable_fields` factories appear only in
+    ?expand= or ?fields=."""
+
+    expandable_fields = {}
+
+    def get_selection(self):
+        selection = getattr(self, 'selection', None)
+        if selection is not None:
+            return selection
+        request = self.context.get('request')
+        parent = self.parent
+        if isinstance(parent, ListSerializer):
+            parent = parent.parent
+        if request is None or parent is not None or request.method != 'GET':
+            return ALL
+        return Selection.from_request(request)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name, factory in self.expandable_fields.items():
+            fields[name] = factory()
+        selection = self.get_selection()
+        for name in list(fields):
+            if not selection.includes(name, name in self.expandable_fields):
+                del fields[name]
+                continue
+            nested = getattr(fields[name], 'child', fields[name])
+            if isinstance(nested, DynamicFieldsMixin):
+                nested.selection = selection.child(name)
+        return fields
+
+
+def unknown_paths(serializer, tree, prefix=''):
+    """Dotted names of a parse_paths() tree that the serializer and its
+    nested serializers have no field for."""
+    serializer.selection = ALL
+    fields = serializer.fields
+    unknown = []
+    for name, children in tree.items():
+        path = f'{prefix}{name}'
+        field = fields.get(name)
+        if field is None and name in serializer.expandable_fields:
+            field = serializer.expandable_fields[name]()
+        if field is None:
+            unknown.append(path)
+            continue
+        nested = getattr(field, 'child', field)
+        if not children:
+            continue
+        if isinstance(nested, DynamicFieldsMixin):
+            unknown.extend(unknown_paths(nested, children, f'{path}.'))
+        else:
+            unknown.extend(f'{path}.{child}' for child in children)
+    return unknown
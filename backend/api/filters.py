@@ -1,3 +1,5 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Q
 from django_filters import rest_framework
 
 from recipes.models import (FavoriteRecipe,
@@ -6,11 +8,26 @@ from recipes.models import (FavoriteRecipe,
                             ShoppingCart,
                             Tag)
 
+User = get_user_model()
+
 CHOICES_LIST = (
     ('0', 'False'),
     ('1', 'True')
 )
 
+# Each ordering is an index of recipes_recipe read forwards or
+# backwards, so descending options break ties by the oldest recipe.
+ORDERINGS = {
+    'popular': ('-popularity', '-created'),
+    'favorites': ('-favorites_count', '-created'),
+    'cooking_time': ('cooking_time', '-created'),
+    '-cooking_time': ('-cooking_time', 'created'),
+    'name': ('name', '-created'),
+    '-name': ('-name', 'created'),
+    'created': ('created',),
+    '-created': ('-created',),
+}
+
 
 class CustomFilterForRecipes(rest_framework.FilterSet):
 
@@ -26,18 +43,24 @@ class CustomFilterForRecipes(rest_framework.FilterSet):
         field_name='author',
         lookup_expr='exact'
     )
+    cooking_time = rest_framework.RangeFilter()
     tags = rest_framework.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all()
     )
+    ordering = rest_framework.ChoiceFilter(
+        method='ordering_method',
+        choices=[(name, name) for name in ORDERINGS]
+    )
 
     def is_favorited_method(self, queryset, name, value):
         if self.request.user.is_anonymous:
             return Recipe.objects.none()
 
-        favorites = FavoriteRecipe.objects.filter(user=self.request.user)
-        recipes = [item.recipe.id for item in favorites]
+        recipes = FavoriteRecipe.objects.filter(
+            user=self.request.user
+        ).values('recipe_id')
         if value == '1':
             return queryset.filter(id__in=recipes)
         if value == '0':
@@ -46,13 +69,17 @@ class CustomFilterForRecipes(rest_framework.FilterSet):
     def is_in_shopping_cart_method(self, queryset, name, value):
         if self.request.user.is_anonymous:
             return Recipe.objects.none()
-        shopping_chart = ShoppingCart.objects.filter(user=self.request.user)
-        recipes = [item.recipe.id for item in shopping_chart]
+        recipes = ShoppingCart.objects.filter(
+            user=self.request.user
+        ).values('recipe_id')
         if value == '1':
             return queryset.filter(id__in=recipes)
         if value == '0':
             return queryset.exclude(id__in=recipes)
 
+    def ordering_method(self, queryset, name, value):
+        return queryset.order_by(*ORDERINGS[value])
+
     class Meta:
         model = Recipe
         fields = ('author', 'tags')
@@ -65,3 +92,19 @@ class CustomFilterForIngredients(rest_framework.FilterSet):
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+
+class CustomFilterForUsers(rest_framework.FilterSet):
+    """Prefix search by username or email, served on PostgreSQL by the
+    expression indexes of users.0002_user_prefix_search."""
+
+    search = rest_framework.CharFilter(method='search_method')
+
+    def search_method(self, queryset, name, value):
+        return queryset.filter(
+            Q(username__istartswith=value) | Q(email__istartswith=value)
+        )
+
+    class Meta:
+        model = User
+        fields = ('search',)
@@ -0,0 +1,142 @@
+import binascii
+import re
+import uuid
+import warnings
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+
+from recipes.models import RecipeImageUpload
+
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+TOKEN_RE = re.compile(r'^[\w-]{20,64}$')
+# Base64 characters read per step; whitespace of line-wrapped payloads
+# is dropped and whole 4-character groups are decoded.
+DECODE_CHUNK = 64 * 1024
+WHITESPACE = ' \t\n\r\f\v'
+STRIP_WHITESPACE = str.maketrans('', '', WHITESPACE)
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """Closed when garbage collected, since no request owns it; close()
+    tolerates the file having been moved into the storage already."""
+
+    def __del__(self):
+        self.close()
+
+
+def dimension_error():
+    return serializers.ValidationError(
+        'Стороны изображения не должны превышать '
+        f'{settings.IMAGE_MAX_DIMENSION} пикселей.')
+
+
+def read_header(file):
+    """Format and size from the image header; Pillow does not decode
+    the pixel data in Image.open. Headers Pillow takes for decompression
+    bombs, warned about or not, are rejected like any oversized image."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            with Image.open(file) as image:
+                return image.format, image.size
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise dimension_error()
+    except (UnidentifiedImageError, OSError, ValueError):
+        raise serializers.ValidationError(
+            'Загрузите корректное изображение.')
+    finally:
+        file.seek(0)
+
+
+def check_size(size):
+    if size > settings.IMAGE_MAX_SIZE:
+        raise serializers.ValidationError(
+            'Размер изображения не должен превышать '
+            f'{settings.IMAGE_MAX_SIZE // 2 ** 20} МБ.')
+
+
+def check_image(file):
+    check_size(file.size)
+    image_format, (width, height) = read_header(file)
+    if image_format not in FORMATS:
+        raise serializers.ValidationError(
+            'Поддерживаются изображения JPEG, PNG и GIF.')
+    if max(width, height) > settings.IMAGE_MAX_DIMENSION:
+        raise dimension_error()
+    return image_format
+
+
+def decode_base64(data):
+    """Decodes a (data URI) base64 string into a temporary file chunk by
+    chunk, rejecting oversized payloads before decoding anything."""
+    content_type = None
+    offset = data.find(';base64,', 0, 100) + 1
+    if offset:
+        content_type = data[:offset - 1].replace('data:', '')
+        offset += len('base64,')
+    # Slicing instead of split() keeps a single copy of the payload.
+    length = len(data) - offset - sum(
+        data.count(character, offset) for character in WHITESPACE
+    )
+    size = length * 3 // 4 - data.rstrip(WHITESPACE)[-2:].count('=')
+    check_size(size)
+    file = DecodedImageFile(f'{uuid.uuid4()}', content_type, size, None)
+    # Characters past the last whole group wait for the next chunk.
+    rest = ''
+    try:
+        for start in range(offset, len(data), DECODE_CHUNK):
+            chunk = rest + data[start:start + DECODE_CHUNK].translate(
+                STRIP_WHITESPACE
+            )
+            whole = len(chunk) - len(chunk) % 4
+            file.write(binascii.a2b_base64(chunk[:whole]))
+            rest = chunk[whole:]
+        if rest:
+            file.write(binascii.a2b_base64(rest))
+    except ValueError:
+        file.close()
+        raise serializers.ValidationError(
+            'Загрузите корректное изображение.')
+    file.size = file.tell()
+    file.seek(0)
+    return file
+
+
+class RecipeImageField(serializers.ImageField):
+    """Accepts a multipart file, a token from /api/recipes/images/ or,
+    for older clients, a base64 string. Size, format and dimensions are
+    checked from the header before the whole image is decoded."""
+
+    def __init__(self, *args, allow_tokens=True, **kwargs):
+        self.allow_tokens = allow_tokens
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            if self.allow_tokens and TOKEN_RE.match(data):
+                return self.from_token(data)
+            data = decode_base64(data)
+        elif not hasattr(data, 'size'):
+            return super().to_internal_value(data)
+        image_format = check_image(data)
+        if '.' not in data.name:
+            data.name = f'{data.name}.{FORMATS[image_format]}'
+        return super().to_internal_value(data)
+
+    def from_token(self, token):
+        upload = RecipeImageUpload.objects.filter(
+            token=token,
+            user=self.context['request'].user,
+            created__gte=timezone.now() - timedelta(
+                seconds=settings.IMAGE_UPLOAD_TTL
+            )
+        ).first()
+        if upload is None:
+            raise serializers.ValidationError(
+                'Загруженное изображение не найдено или устарело.')
+        return upload.image
@@ -0,0 +1,62 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api import renderers
+from api.fieldsets import ALL
+from api.serializers import GetRecipeSerializer
+from recipes.models import Recipe
+
+
+class EscapingJSONRenderer(JSONRenderer):
+    ensure_ascii = True
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость и размер ответа рендереров JSON на '
+            'странице рецептов в представлении GetRecipeSerializer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size', type=int, default=100,
+            help='Рецептов на странице; недостающие повторяются.'
+        )
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def page(self, size):
+        recipes = list(GetRecipeSerializer.optimize_queryset(
+            Recipe.objects.all(), ALL, AnonymousUser()
+        )[:size])
+        if not recipes:
+            raise CommandError('В базе нет рецептов.')
+        data = GetRecipeSerializer(recipes, many=True).data
+        return {
+            'count': size,
+            'next': None,
+            'previous': None,
+            'results': [data[number % len(data)] for number in range(size)]
+        }
+
+    def measure(self, label, renderer, data, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            content = renderer.render(data, 'application/json')
+        seconds = (time.perf_counter() - started) / repeat
+        self.stdout.write(
+            f'{label}: {seconds * 1000:.2f} мс, {len(content)} байт'
+        )
+
+    def handle(self, *args, **options):
+        data = self.page(options['page_size'])
+        repeat = options['repeat']
+        self.measure(
+            'JSONRenderer, \\uXXXX', EscapingJSONRenderer(), data, repeat
+        )
+        self.measure('JSONRenderer', JSONRenderer(), data, repeat)
+        self.measure(
+            'FastJSONRenderer'
+            + (', orjson' if renderers.orjson is not None else ''),
+            renderers.FastJSONRenderer(), data, repeat
+        )
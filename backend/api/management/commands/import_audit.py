@@ -0,0 +1,101 @@
+import os
+import resource
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Packages from requirements.txt that the project does not need to load.
+WATCHLIST = (
+    'social_django',
+    'social_core',
+    'rest_framework_simplejwt',
+    'jwt',
+    'oauthlib',
+    'requests_oauthlib',
+)
+
+STARTUP_CODE = (
+    'import django; django.setup(); '
+    'import foodgram.wsgi; '
+    'from django.urls import get_resolver; get_resolver().url_patterns'
+)
+
+
+class Command(BaseCommand):
+    help = ('Показывает время импорта модулей при старте приложения '
+            'и пиковую память процесса.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25)
+        parser.add_argument(
+            '--packages', action='store_true',
+            help='Суммировать время по пакетам верхнего уровня.'
+        )
+
+    def handle(self, *args, **options):
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get(
+                'DJANGO_SETTINGS_MODULE', 'foodgram.settings'
+            ),
+        }
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode:
+            self.stderr.write(result.stderr)
+            return
+        rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+        modules = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            own, cumulative, name = line[len('import time:'):].split('|')
+            modules.append((int(cumulative), int(own), name.strip()))
+
+        total = sum(own for _, own, _ in modules)
+        if options['packages']:
+            packages = defaultdict(lambda: [0, 0])
+            for _, own, name in modules:
+                package = packages[name.split('.')[0]]
+                package[0] += own
+                package[1] += 1
+            self.stdout.write(f'{"self ms":>9} {"modules":>8}  package')
+            rows = sorted(
+                ((own, count, name)
+                 for name, (own, count) in packages.items()),
+                reverse=True
+            )
+            for own, count, name in rows[:options['top']]:
+                self.stdout.write(f'{own / 1000:9.1f} {count:8}  {name}')
+        else:
+            self.stdout.write(
+                f'{"cumulative ms":>14} {"self ms":>9}  module'
+            )
+            for cumulative, own, name in sorted(modules, reverse=True)[
+                :options['top']
+            ]:
+                self.stdout.write(
+                    f'{cumulative / 1000:14.1f} {own / 1000:9.1f}  {name}'
+                )
+        self.stdout.write(
+            f'\nМодулей: {len(modules)}, время импорта: {total / 1000:.0f} '
+            f'мс, пиковая память: {rss / 1024:.0f} МБ'
+        )
+
+        installed = {app.split('.')[0] for app in settings.INSTALLED_APPS}
+        imported = {name.split('.')[0] for _, _, name in modules}
+        unused = sorted(
+            package for package in WATCHLIST
+            if package in imported and package not in installed
+        )
+        if unused:
+            self.stdout.write(
+                'Импортированы, но не подключены в INSTALLED_APPS: '
+                + ', '.join(unused)
+            )
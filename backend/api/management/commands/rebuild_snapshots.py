@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.snapshots import enabled, rebuild
+from foodgram.db_router import use_primary
+
+
+class Command(BaseCommand):
+    help = ('Заново записывает готовые JSON-снимки всех рецептов для '
+            'nginx и удаляет снимки скрытых и удалённых рецептов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not enabled():
+            raise CommandError(
+                'Не заданы RECIPE_SNAPSHOT_DIR и RECIPE_SNAPSHOT_ORIGIN.'
+            )
+        with use_primary():
+            count = sum(rebuild(options['batch_size']))
+        self.stdout.write(f'Записано снимков рецептов: {count}.')
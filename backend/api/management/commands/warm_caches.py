@@ -0,0 +1,65 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram.warmup import (is_cache_shared, replay, warm_references,
+                             warmup_urls)
+
+
+class Command(BaseCommand):
+    help = ('Прогревает общий кэш после выкладки или очистки: загружает '
+            'справочники и запрашивает самые востребованные адреса API. '
+            'Команда работает в своем процессе, поэтому нужен кэш, общий '
+            'с воркерами gunicorn (CACHE_BACKEND); память воркеров '
+            'прогревает WARMUP_ON_START.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--access-log', default=settings.WARMUP_ACCESS_LOG,
+            help='Журнал доступа nginx, из которого берутся самые частые '
+                 'запросы.'
+        )
+        parser.add_argument(
+            '--top', type=int, default=settings.WARMUP_TOP_URLS,
+            help='Сколько адресов взять из журнала.'
+        )
+        parser.add_argument(
+            '--popular', type=int, default=settings.WARMUP_POPULAR_RECIPES,
+            help='Сколько самых популярных рецептов запросить.'
+        )
+        parser.add_argument(
+            '--url', action='append', default=[], dest='urls',
+            help='Дополнительный адрес, можно указать несколько раз.'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.WARMUP_CONCURRENCY
+        )
+        parser.add_argument(
+            '--budget', type=float, default=settings.WARMUP_BUDGET,
+            help='Не начинать новые запросы позже этого числа секунд.'
+        )
+
+    def handle(self, *args, **options):
+        if not is_cache_shared():
+            raise CommandError(
+                'Кэш хранится в памяти процесса, прогрев из команды не '
+                'дойдет до воркеров. Задайте общий CACHE_BACKEND или '
+                'включите WARMUP_ON_START.'
+            )
+        started = time.monotonic()
+        warm_references(process=False)
+        urls = list(dict.fromkeys(options['urls'] + warmup_urls(
+            options['access_log'], options['top'], options['popular']
+        )))
+        results = replay(urls, options['concurrency'], options['budget'])
+        failed = 0
+        for url, status, seconds in results:
+            if status >= 400:
+                failed += 1
+            if options['verbosity'] > 1 or status >= 400:
+                self.stdout.write(f'{status} {seconds * 1000:.0f} мс {url}')
+        self.stdout.write(
+            f'Запрошено адресов: {len(results)} из {len(urls)}, ошибок: '
+            f'{failed}, {time.monotonic() - started:.1f} с.'
+        )
@@ -0,0 +1,183 @@
+import calendar
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework import exceptions
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from recipes.models import FavoriteRecipe, ShoppingCart
+from users.models import Follow
+from .fieldsets import DynamicFieldsMixin, Selection, unknown_paths
+
+
+def get_viewer_state(user):
+    """Fingerprint of everything that makes a recipe look different to
+    this user: is_favorited, is_in_shopping_cart and is_subscribed.
+    Ids only grow, so (count, max id) changes on every add and delete."""
+    if user.is_anonymous:
+        return ()
+    state = [user.pk]
+    for queryset in (
+        FavoriteRecipe.objects.filter(user=user),
+        ShoppingCart.objects.filter(user=user),
+        Follow.objects.filter(user=user),
+    ):
+        state.extend(queryset.aggregate(Count('id'), Max('id')).values())
+    return tuple(state)
+
+
+class ConditionalResponseMixin:
+    """Answers If-None-Match / If-Modified-Since on list and retrieve
+    from Recipe.updated before any serialization runs. Counters added
+    with ?expand= change without touching Recipe.updated, so such
+    responses carry no validators.
+
+    The data of anonymous responses is cached under their ETag: it
+    changes with every row shown, so an entry is never stale, only
+    left unused until RESPONSE_CACHE_TIMEOUT."""
+
+    def has_validators(self):
+        return not self.request.query_params.get('expand')
+
+    def get_validators(self, request, rows, *extra):
+        digest = hashlib.md5(usedforsecurity=False)
+        parts = (
+            request.get_full_path(),
+            *extra,
+            *get_viewer_state(request.user),
+            *rows
+        )
+        for part in parts:
+            digest.update(str(part).encode())
+        return f'"{digest.hexdigest()}"'
+
+    def apply_validators(self, response, etag, last_modified=None):
+        if self.has_validators():
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def cached_data(self, request, etag, serialize):
+        if not request.user.is_anonymous or not self.has_validators():
+            return serialize()
+        # Image URLs are absolute, so the site address is part of the key.
+        key = f'response:{request.build_absolute_uri("/")}{etag}'
+        data = cache.get(key)
+        if data is None:
+            data = serialize()
+            cache.set(key, data, settings.RESPONSE_CACHE_TIMEOUT)
+        return data
+
+    def conditional_response(self, request, etag, last_modified=None):
+        if not self.has_validators():
+            return None
+        probe = self.apply_validators(HttpResponse(), etag, last_modified)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified, response=probe
+        )
+        if response is not probe:
+            return response
+        return None
+
+    def retrieve(self, request, *args, **kwargs):
+        # Only (id, updated) is read until the precondition fails, so a
+        # 304 runs none of the prefetches and annotations.
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        pk, updated = get_object_or_404(
+            self.filter_queryset(self.get_queryset()).values_list(
+                'id', 'updated'
+            ),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        etag = self.get_validators(request, [(pk, updated)])
+        # Favorites, cart and subscriptions carry no timestamps, so
+        # Last-Modified is only safe to send to anonymous users.
+        last_modified = None
+        if request.user.is_anonymous:
+            last_modified = calendar.timegm(updated.utctimetuple())
+
+        not_modified = self.conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        data = self.cached_data(
+            request, etag,
+            lambda: self.get_serializer(self.get_object()).data
+        )
+        return self.apply_validators(Response(data), etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset.values_list('id', 'updated'))
+        if page is None:
+            return super().list(request, *args, **kwargs)
+
+        rows = list(page)
+        etag = self.get_validators(
+            request, rows, self.paginator.page.paginator.count
+        )
+        not_modified = self.conditional_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        def serialize():
+            recipes = self.get_queryset().in_bulk([pk for pk, _ in rows])
+            return self.get_serializer(
+                [recipes[pk] for pk, _ in rows if pk in recipes], many=True
+            ).data
+
+        return self.apply_validators(
+            self.get_paginated_response(
+                self.cached_data(request, etag, serialize)
+            ),
+            etag
+        )
+
+
+class SparseFieldsMixin:
+    """Adds to the queryset only the prefetches and annotations that the
+    fields selected with ?fields= / ?omit= / ?expand= need, as described
+    by optimize_queryset of the serializer. Unknown field names are
+    rejected before anything is read."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method == 'GET':
+            self.check_selection(request)
+
+    def check_selection(self, request):
+        serializer_class = self.get_serializer_class()
+        if not issubclass(serializer_class, DynamicFieldsMixin):
+            return
+        selection = Selection.from_request(request)
+        unknown = []
+        for tree in (selection.fields, selection.omit, selection.expand):
+            if tree:
+                unknown.extend(unknown_paths(
+                    serializer_class(context=self.get_serializer_context()),
+                    tree
+                ))
+        if unknown:
+            raise exceptions.ValidationError(
+                f'Неизвестные поля: {", ".join(dict.fromkeys(unknown))}.')
+
+    def optimize_queryset(self, queryset, serializer_class=None):
+        serializer_class = serializer_class or self.get_serializer_class()
+        optimize = getattr(serializer_class, 'optimize_queryset', None)
+        if optimize is None or self.request.method != 'GET':
+            return queryset
+        return optimize(
+            queryset, Selection.from_request(self.request), self.request.user
+        )
+
+    def get_queryset(self):
+        return self.optimize_queryset(super().get_queryset())
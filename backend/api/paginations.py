@@ -1,6 +1,28 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+# Larger ?limit= values are cut down, so no request reads a whole table.
+MAX_PAGE_SIZE = 100
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class TimelinePagination(CursorPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+    ordering = '-id'
+
+
+class DirectoryPagination(CursorPagination):
+    """No COUNT over the whole table and no OFFSET: every page is one
+    range read of the primary key. Pages are kept small, since the
+    directory is what crawlers walk."""
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 50
+    ordering = 'id'
@@ -0,0 +1,24 @@
+import json
+
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """multipart/form-data with the JSON payload in a "data" part and the
+    files as separate parts, so nested fields such as ingredients keep
+    their JSON shape while the image is streamed to a temporary file."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        if 'data' not in parsed.data:
+            return parsed
+        try:
+            data = json.loads(parsed.data['data'])
+        except ValueError as error:
+            raise ParseError(f'JSON parse error - {error}')
+        if not isinstance(data, dict):
+            raise ParseError('JSON parse error - ожидается объект.')
+        data.update(parsed.files.dict())
+        return DataAndFiles(data, MultiValueDict())
@@ -0,0 +1,248 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+MODES = ('cprofile', 'sample')
+HEADER = 'HTTP_X_PROFILE'
+OUTPUT_HEADER = 'HTTP_X_PROFILE_OUTPUT'
+PARAM = 'profile'
+OUTPUT_PARAM = 'profile_output'
+PSTATS_LINES = 60
+
+
+class SamplingProfiler:
+    """Takes the stack of the request thread every interval seconds from
+    a background thread and counts them as collapsed stacks, the input
+    format of flamegraph.pl and speedscope."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+
+    def __enter__(self):
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.sampler.join()
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(
+                    f'{frame.f_globals.get("__name__", "?")}:'
+                    f'{frame.f_code.co_name}'
+                )
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(
+            f'{stack} {count}\n' for stack, count in self.stacks.items()
+        )
+
+
+class Timings:
+    """Wall time of the request phases. Queries are timed by a database
+    execute wrapper and attributed to the phase that ran them, so that
+    lazy querysets evaluated by a serializer count as ORM time."""
+
+    def __init__(self):
+        self.phase = None
+        self.wall = Counter()
+        self.database = Counter()
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.database[self.phase] += time.perf_counter() - started
+            self.queries += 1
+
+    @contextmanager
+    def measure(self, phase):
+        previous, self.phase = self.phase, phase
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.wall[phase] += time.perf_counter() - started
+            self.phase = previous
+
+    def watch(self, serializer):
+        """Times serializer.data of this one instance."""
+        timings = self
+        base = type(serializer)
+
+        class ProfiledSerializer(base):
+            @property
+            def data(self):
+                with timings.measure('serializer'):
+                    return super().data
+
+        ProfiledSerializer.__name__ = base.__name__
+        serializer.__class__ = ProfiledSerializer
+
+    def breakdown(self):
+        """Milliseconds spent in the ORM, serializers (without their
+        queries), renderers and the rest of the view."""
+        orm = sum(self.database.values())
+        serializer = self.wall['serializer'] - self.database['serializer']
+        renderer = self.wall['renderer'] - self.database['renderer']
+        total = self.wall['total']
+        return {
+            name: round(seconds * 1000, 2)
+            for name, seconds in (
+                ('orm', orm),
+                ('serializer', serializer),
+                ('renderer', renderer),
+                ('view', total - orm - serializer - renderer),
+                ('total', total),
+            )
+        }
+
+
+class RequestProfile:
+
+    def __init__(self, view, request, user, mode):
+        self.view = view
+        self.request = request
+        self.user = user
+        self.mode = mode if mode in MODES else MODES[0]
+        self.timings = Timings()
+        self.name = '-'.join((
+            time.strftime('%Y%m%d-%H%M%S'),
+            type(view).__name__,
+            uuid.uuid4().hex[:8]
+        ))
+
+    def run(self, dispatch):
+        if self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+        else:
+            profiler = SamplingProfiler(settings.PROFILE_SAMPLE_INTERVAL)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.timings))
+            with self.timings.measure('total'), profiler:
+                response = dispatch()
+                # Responses are normally rendered after the view returns;
+                # here it happens inside the profile.
+                with self.timings.measure('renderer'):
+                    if response.streaming:
+                        response.streaming_content = list(
+                            response.streaming_content
+                        )
+                    elif not getattr(response, 'is_rendered', True):
+                        response.render()
+        self.profiler = profiler
+        return self.finish(response)
+
+    def summary(self):
+        return {
+            'id': self.name,
+            'path': self.request.get_full_path(),
+            'method': self.request.method,
+            'view': f'{type(self.view).__name__}.{self.view.action}',
+            'user': self.user.pk,
+            'mode': self.mode,
+            'queries': self.timings.queries,
+            'ms': self.timings.breakdown(),
+        }
+
+    def report(self):
+        if self.mode == 'sample':
+            return self.profiler.collapsed()
+        output = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(PSTATS_LINES)
+        return output.getvalue()
+
+    def save(self, summary):
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        path = os.path.join(settings.PROFILE_DIR, self.name)
+        if self.mode == 'sample':
+            with open(f'{path}.folded', 'w') as file:
+                file.write(self.profiler.collapsed())
+        else:
+            self.profiler.dump_stats(f'{path}.prof')
+        with open(f'{path}.json', 'w') as file:
+            json.dump(summary, file, indent=2)
+
+    def finish(self, response):
+        summary = self.summary()
+        if settings.PROFILE_DIR:
+            self.save(summary)
+        logger.info('Profiled %s: %s', summary['path'], summary['ms'])
+        wanted = (
+            self.request.META.get(OUTPUT_HEADER)
+            or self.request.GET.get(OUTPUT_PARAM)
+        )
+        if wanted == 'response':
+            response = HttpResponse(
+                json.dumps(summary, indent=2) + '\n\n' + self.report(),
+                content_type='text/plain; charset=utf-8'
+            )
+        response['X-Profile-Id'] = self.name
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={ms}' for name, ms in summary['ms'].items()
+        )
+        return response
+
+
+class ProfiledViewMixin:
+    """Profiles one request for staff who send the X-Profile header or
+    ?profile= with "cprofile" or "sample". The breakdown is returned in
+    Server-Timing, the profile is stored in PROFILE_DIR and, with
+    X-Profile-Output / ?profile_output=response, returned instead of the
+    response. Requests without the trigger only pay for its lookup."""
+
+    profile = None
+
+    def dispatch(self, request, *args, **kwargs):
+        mode = request.META.get(HEADER) or request.GET.get(PARAM)
+        if not mode:
+            return super().dispatch(request, *args, **kwargs)
+        try:
+            user = self.initialize_request(request).user
+        except APIException:
+            # Failed authentication is answered by the regular dispatch.
+            user = None
+        if user is None or not user.is_staff:
+            return super().dispatch(request, *args, **kwargs)
+        self.profile = RequestProfile(self, request, user, mode)
+        return self.profile.run(
+            lambda: super(ProfiledViewMixin, self).dispatch(
+                request, *args, **kwargs
+            )
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self.profile is not None:
+            self.profile.timings.watch(serializer)
+        return serializer
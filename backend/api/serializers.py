@@ -1,43 +1,46 @@
 from django.contrib.auth import get_user_model
-from django.db.models import F
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import (Count, Exists, IntegerField, OuterRef,
+                              Prefetch, Subquery)
+from django.db.models.functions import Coalesce
+from django.http import Http404
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import exceptions, serializers
 
+from recipes import similarity
 from recipes.models import (FavoriteRecipe,
                             Ingredient,
                             Recipe,
+                            RecipeImageUpload,
                             RecipeIngredient,
                             ShoppingCart, Tag)
 from users.models import Follow
+from .fieldsets import DynamicFieldsMixin
+from .images import RecipeImageField
 
 User = get_user_model()
 
 
-class GetIsSubscribedMixin:
-
-    def get_is_subscribed(self, obj):
-        user = self.context.get("request").user
-        if user.is_anonymous:
-            return False
-        return user.follower.filter(author=obj.id).exists()
-
-
-class GetIngredientsMixin:
-
-    def get_ingredients(self, obj):
-        return obj.ingredients.values(
-            "id",
-            "name",
-            "measurement_unit",
-            amount=F("ingredients_amount__amount"),
-        )
+def count_related(queryset, field, outer):
+    """Correlated COUNT subquery: unlike Count() over a join it needs no
+    GROUP BY, so it keeps the ordering and other annotations intact."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: outer}).order_by().values(
+                field
+            ).annotate(count=Count('id')).values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(DynamicFieldsMixin, UserSerializer):
 
     is_subscribed = serializers.SerializerMethodField(read_only=True)
+    expandable_fields = {
+        'recipes_count': lambda: serializers.IntegerField(read_only=True),
+    }
 
     class Meta:
         model = User
@@ -48,13 +51,42 @@ class CustomUserSerializer(UserSerializer):
                   'last_name',
                   'is_subscribed')
 
+    @staticmethod
+    def get_annotations(selection, user, outer='pk'):
+        annotations = {}
+        if user.is_authenticated and selection.includes('is_subscribed'):
+            annotations['is_subscribed'] = Exists(
+                Follow.objects.filter(user=user, author=OuterRef(outer))
+            )
+        if selection.includes('recipes_count', expandable=True):
+            annotations['recipes_count'] = count_related(
+                Recipe.objects, 'author', OuterRef(outer)
+            )
+        return annotations
+
+    @classmethod
+    def optimize_queryset(cls, queryset, selection, user):
+        return queryset.annotate(**cls.get_annotations(selection, user))
+
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
         return Follow.objects.filter(user=request.user,
                                      author=obj.id).exists()
 
+    def to_representation(self, instance):
+        if (
+            'recipes_count' in self.fields
+            and not hasattr(instance, 'recipes_count')
+        ):
+            instance.recipes_count = Recipe.objects.filter(
+                author=instance
+            ).count()
+        return super().to_representation(instance)
+
 
 class CustomUserCreateSerializer(UserCreateSerializer):
 
@@ -83,36 +115,29 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class GetIngredientRecipeSerializer(serializers.ModelSerializer):
+    """Expects the ingredient to be selected along with the row."""
 
-    id = serializers.SerializerMethodField()
-    name = serializers.SerializerMethodField()
-    measurement_unit = serializers.SerializerMethodField()
-    amount = serializers.SerializerMethodField()
+    id = serializers.ReadOnlyField(source='ingredient_id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
 
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
-    def get_id(self, obj):
-        return obj.ingredient.id
-
-    def get_name(self, obj):
-        return obj.ingredient.name
-
-    def get_measurement_unit(self, obj):
-        return obj.ingredient.measurement_unit
 
-    def get_amount(self, obj):
-        return obj.amount
-
-
-class GetRecipeSerializer(serializers.ModelSerializer):
+class GetRecipeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
 
     tags = TagSerializer(read_only=True, many=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField(read_only=True)
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    expandable_fields = {
+        'favorites_count': lambda: serializers.IntegerField(read_only=True),
+    }
 
     class Meta:
         model = Recipe
@@ -120,7 +145,47 @@ class GetRecipeSerializer(serializers.ModelSerializer):
                   'is_in_shopping_cart',
                   'name', 'image', 'text', 'cooking_time')
 
+    @classmethod
+    def optimize_queryset(cls, queryset, selection, user):
+        if selection.includes('tags'):
+            queryset = queryset.prefetch_related('tags')
+        if selection.includes('ingredients'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ),
+                to_attr='ingredient_amounts'
+            ))
+        if selection.includes('author'):
+            queryset = queryset.select_related('author').annotate(**{
+                f'author_{name}': annotation
+                for name, annotation in CustomUserSerializer.get_annotations(
+                    selection.child('author'), user, 'author_id'
+                ).items()
+            })
+        if user.is_authenticated:
+            for name, model in (
+                ('is_favorited', FavoriteRecipe),
+                ('is_in_shopping_cart', ShoppingCart),
+            ):
+                if selection.includes(name):
+                    queryset = queryset.annotate(**{name: Exists(
+                        model.objects.filter(user=user, recipe=OuterRef('pk'))
+                    )})
+        return queryset
+
+    def to_representation(self, instance):
+        for name in ('is_subscribed', 'recipes_count'):
+            if hasattr(instance, f'author_{name}'):
+                setattr(
+                    instance.author, name, getattr(instance, f'author_{name}')
+                )
+        return super().to_representation(instance)
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -128,6 +193,8 @@ class GetRecipeSerializer(serializers.ModelSerializer):
                                              recipe=obj.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -135,13 +202,25 @@ class GetRecipeSerializer(serializers.ModelSerializer):
                                            recipe=obj.id).exists()
 
     def get_ingredients(self, obj):
-        recipe = obj
-        ingredients = RecipeIngredient.objects.filter(recipe=recipe)
+        ingredients = getattr(obj, 'ingredient_amounts', None)
+        if ingredients is None:
+            ingredients = obj.recipeingredient_set.select_related(
+                'ingredient'
+            )
         serializer = GetIngredientRecipeSerializer(ingredients, many=True)
         return serializer.data
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class PantryRecipeSerializer(GetRecipeSerializer):
+
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(GetRecipeSerializer.Meta):
+        fields = GetRecipeSerializer.Meta.fields + ('missing_ingredients',)
+
+
+class ShortRecipeSerializer(DynamicFieldsMixin,
+                            serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
@@ -158,6 +237,15 @@ class ShortIngredientSerializerForRecipe(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class RecipeImageUploadSerializer(serializers.ModelSerializer):
+
+    image = RecipeImageField(allow_tokens=False)
+
+    class Meta:
+        model = RecipeImageUpload
+        fields = ('token', 'image')
+
+
 class PostRecipeSerializer(serializers.ModelSerializer):
 
     author = CustomUserSerializer(read_only=True)
@@ -166,7 +254,7 @@ class PostRecipeSerializer(serializers.ModelSerializer):
         many=True
     )
     ingredients = ShortIngredientSerializerForRecipe(many=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
     cooking_time = serializers.IntegerField()
 
     def validate_tags(self, tags):
@@ -193,6 +281,7 @@ class PostRecipeSerializer(serializers.ModelSerializer):
                 'Минимальное время приготовления 1 минута.')
         return cooking_time
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
@@ -200,25 +289,13 @@ class PostRecipeSerializer(serializers.ModelSerializer):
 
         recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tags)
-
-        recipe_ingredients = []
-
-        for ingredient in ingredients:
-            amount = ingredient['amount']
-            ingredient_instance = ingredient['id']
-            ingredient = get_object_or_404(Ingredient, pk=ingredient_instance)
-
-            recipe_ingredients.append(
-                RecipeIngredient(
-                    recipe=recipe,
-                    ingredient=ingredient,
-                    amount=amount
-                )
-            )
-        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        self.add_ingredients(recipe, ingredients)
+        self.claim_upload(recipe)
+        similarity.schedule(recipe.pk)
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags', None)
         if tags is not None:
@@ -227,20 +304,40 @@ class PostRecipeSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop('ingredients', None)
         if ingredients is not None:
             instance.ingredients.clear()
+            self.add_ingredients(instance, ingredients)
+
+        if tags is not None or ingredients is not None:
+            similarity.schedule(instance.pk)
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            self.claim_upload(instance)
+        return instance
+
+    @staticmethod
+    def add_ingredients(recipe, ingredients):
+        """Checks all ids with one query and inserts the rows at once;
+        bulk_create sends no post_save, so the recipe is not touched
+        once per row."""
+        ids = [ingredient['id'] for ingredient in ingredients]
+        if Ingredient.objects.filter(pk__in=ids).count() != len(ids):
+            raise Http404
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount']
+            )
+            for ingredient in ingredients
+        )
 
-            for ingredient in ingredients:
-                amount = ingredient['amount']
-                ingredient_instance = ingredient['id']
-                ingredient = get_object_or_404(Ingredient,
-                                               pk=ingredient_instance)
-
-                RecipeIngredient.objects.update_or_create(
-                    recipe=instance,
-                    ingredient=ingredient,
-                    amount=amount
-                )
-
-        return super().update(instance, validated_data)
+    @staticmethod
+    def claim_upload(recipe):
+        """An image given by upload token now belongs to the recipe.
+        Identical images share a file, so only the author's uploads are
+        claimed."""
+        RecipeImageUpload.objects.filter(
+            user=recipe.author_id, image=recipe.image.name
+        ).delete()
 
     def to_representation(self, instance):
         serializer = GetRecipeSerializer(
@@ -253,13 +350,26 @@ class PostRecipeSerializer(serializers.ModelSerializer):
         exclude = ('created',)
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(DynamicFieldsMixin,
+                             serializers.ModelSerializer):
 
     recipes = ShortRecipeSerializer(many=True, read_only=True)
     recipes_count = serializers.SerializerMethodField(read_only=True)
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
+    @classmethod
+    def optimize_queryset(cls, queryset, selection, user):
+        if selection.includes('recipes'):
+            queryset = queryset.prefetch_related('recipes')
+        if selection.includes('recipes_count'):
+            queryset = queryset.annotate(recipes_count=count_related(
+                Recipe.objects, 'author', OuterRef('pk')
+            ))
+        return queryset
+
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj).count()
 
     def get_is_subscribed(self, obj):
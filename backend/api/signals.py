@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from recipes.models import DeletionJob, Ingredient, Recipe, Tag
+from . import snapshots
+from .catalog import invalidate_catalog, invalidate_tags
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_catalog_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    invalidate_tags()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_snapshot_saved(sender, instance, **kwargs):
+    snapshots.on_commit(snapshots.publish, instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_snapshot_deleted(sender, instance, **kwargs):
+    snapshots.on_commit(snapshots.unpublish, instance.pk)
+
+
+@receiver(post_save, sender=DeletionJob)
+def recipe_snapshots_hidden(sender, instance, created, **kwargs):
+    if not created:
+        return
+    if instance.kind == DeletionJob.USER:
+        lookup = {'author_id': instance.object_id}
+    else:
+        lookup = {'pk': instance.object_id}
+    snapshots.unpublish_where(Recipe.all_objects.filter(**lookup))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_snapshots_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        snapshots.unpublish_where(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_snapshots_changed(sender, instance, created=False,
+                                 **kwargs):
+    if not created:
+        snapshots.unpublish_where(
+            Recipe.objects.filter(ingredients=instance)
+        )
+
+
+@receiver(post_save, sender=User)
+def author_snapshots_changed(sender, instance, **kwargs):
+    # Set by recipes.signals.author_saving.
+    if getattr(instance, '_author_changed', False):
+        snapshots.unpublish_where(Recipe.objects.filter(author=instance))
@@ -0,0 +1,148 @@
+import logging
+import os
+import tempfile
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+
+from foodgram.compression import ENCODINGS
+from recipes.models import Recipe
+from .catalog import encode
+from .fieldsets import ALL
+from .serializers import GetRecipeSerializer
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = ('', *(suffix for _, suffix in ENCODINGS))
+
+
+def enabled():
+    # Without the origin the image URLs would differ from the backend's,
+    # so snapshots are not written at all (see checks.snapshot_settings).
+    return bool(
+        settings.RECIPE_SNAPSHOT_DIR and settings.RECIPE_SNAPSHOT_ORIGIN
+    )
+
+
+def snapshot_path(recipe_id, suffix=''):
+    return os.path.join(
+        settings.RECIPE_SNAPSHOT_DIR, 'recipes', f'{recipe_id}.json{suffix}'
+    )
+
+
+def render(recipe):
+    """The page as the backend returns it, where ImageField makes the
+    image URL absolute with the address of the request."""
+    data = GetRecipeSerializer(recipe).data
+    if data['image']:
+        data['image'] = urljoin(settings.RECIPE_SNAPSHOT_ORIGIN, data['image'])
+    return encode(data)
+
+
+def write(path, content):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(content)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def save(recipe):
+    """Every file is replaced atomically: nginx serves the old snapshot
+    or the new one, never a partly written file."""
+    blob = render(recipe)
+    for encoding, suffix in ENCODINGS:
+        if encoding in blob:
+            write(snapshot_path(recipe.pk, suffix), blob[encoding])
+    write(snapshot_path(recipe.pk), blob[None])
+
+
+def remove(recipe_id):
+    for suffix in SUFFIXES:
+        try:
+            os.unlink(snapshot_path(recipe_id, suffix))
+        except FileNotFoundError:
+            pass
+
+
+def anonymous_view(queryset):
+    return GetRecipeSerializer.optimize_queryset(
+        queryset, ALL, AnonymousUser()
+    )
+
+
+def publish(*recipe_ids):
+    """Writes the snapshots of the recipes as an anonymous user sees
+    them and removes those of recipes that are gone or hidden."""
+    published = set()
+    for recipe in anonymous_view(Recipe.objects.filter(pk__in=recipe_ids)):
+        save(recipe)
+        published.add(recipe.pk)
+    for recipe_id in set(recipe_ids) - published:
+        remove(recipe_id)
+
+
+def unpublish(*recipe_ids):
+    for recipe_id in recipe_ids:
+        remove(recipe_id)
+
+
+def on_commit(function, *recipe_ids):
+    """Runs function after the transaction; a failed write leaves the
+    recipe to the backend instead of failing the saved request."""
+    def run():
+        try:
+            function(*recipe_ids)
+        except OSError:
+            logger.exception('Recipe snapshots %s failed', recipe_ids)
+    if enabled() and recipe_ids:
+        transaction.on_commit(run)
+
+
+def unpublish_where(queryset):
+    """Removes the snapshots of recipes affected by a change that may
+    reach many of them; their pages are served by the backend until the
+    next rebuild_snapshots. The ids are read before the change commits."""
+    if enabled():
+        on_commit(unpublish, *queryset.values_list('pk', flat=True))
+
+
+def stored_ids():
+    try:
+        names = os.listdir(os.path.join(
+            settings.RECIPE_SNAPSHOT_DIR, 'recipes'
+        ))
+    except FileNotFoundError:
+        return set()
+    return {
+        int(name.split('.')[0]) for name in names
+        if name.split('.')[0].isdigit()
+    }
+
+
+def rebuild(batch_size=500):
+    """Writes every snapshot again in batches of batch_size recipes and
+    removes the stale ones. Yields the number of recipes written."""
+    stale = stored_ids()
+    last = 0
+    while True:
+        recipes = list(anonymous_view(
+            Recipe.objects.filter(pk__gt=last).order_by('pk')
+        )[:batch_size])
+        if not recipes:
+            break
+        for recipe in recipes:
+            save(recipe)
+            stale.discard(recipe.pk)
+        last = recipes[-1].pk
+        yield len(recipes)
+    for recipe_id in stale:
+        remove(recipe_id)
@@ -0,0 +1,1341 @@
+import base64
+import gzip
+import io
+import json
+import os
+import random
+import re
+import runpy
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+import brotli
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, router, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+
+from foodgram.compression import choose_encoding
+from foodgram.middleware import (CompressionMiddleware,
+                                 ReplicaRoutingMiddleware)
+from foodgram.nplusone import (RepeatedQueriesError, allow_repeated_queries,
+                               detect_repeated_queries, fingerprint)
+from foodgram.warmup import client_host, replay
+from recipes.models import (FavoriteRecipe, Ingredient, MediaFile, Recipe,
+                            RecipeImageUpload, RecipeIngredient, ShoppingCart,
+                            Tag)
+from users.models import Follow
+from recipes import pantry
+from . import snapshots, throttling
+from .checks import snapshot_settings
+from .filters import ORDERINGS
+from .images import DECODE_CHUNK, decode_base64
+from .views import RecipeViewSet
+
+User = get_user_model()
+
+
+class RecipeDataTestCase(TestCase):
+    """A reader following three authors of six recipes, half of them in
+    the reader's favorites and shopping cart."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='password-12345'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='password-12345'
+            )
+            for number in range(3)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}'
+            )
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(10)
+        ]
+        cls.recipes = []
+        for number in range(6):
+            recipe = Recipe.objects.create(
+                author=cls.authors[number % 3], name=f'Рецепт {number}',
+                text='Описание', cooking_time=10 + number
+            )
+            recipe.tags.set(tags[:1 + number % 3])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=100
+                )
+                for ingredient in ingredients[number:number + 4]
+            )
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[:3]:
+            FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in cls.authors:
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class QueryCountTests(RecipeDataTestCase):
+    """Number of queries of the list, detail and subscription pages. It
+    must not grow with the number of rows on a page, and fields left out
+    with ?fields= / ?omit= must not be queried at all."""
+
+    def assert_queries(self, number, url):
+        with self.assertNumQueries(number):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_recipe_list(self):
+        response = self.assert_queries(8, '/api/recipes/')
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_recipe_list_does_not_grow_with_page(self):
+        self.assert_queries(8, '/api/recipes/?limit=2')
+
+    def test_recipe_list_fields(self):
+        self.assert_queries(6, '/api/recipes/?fields=id,name,cooking_time')
+
+    def test_recipe_list_omit(self):
+        self.assert_queries(7, '/api/recipes/?omit=author,ingredients')
+
+    def test_recipe_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_queries(5, '/api/recipes/')
+
+    def test_recipe_detail(self):
+        self.assert_queries(7, f'/api/recipes/{self.recipes[0].pk}/')
+
+    def test_recipe_detail_not_modified(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(4):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_recipe_detail_fields(self):
+        self.assert_queries(
+            5, f'/api/recipes/{self.recipes[0].pk}/?fields=id,name'
+        )
+
+    def test_subscriptions(self):
+        response = self.assert_queries(3, '/api/users/subscriptions/')
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_subscriptions_recipes_limit(self):
+        self.assert_queries(3, '/api/users/subscriptions/?recipes_limit=1')
+
+    def test_subscriptions_fields(self):
+        self.assert_queries(
+            2, '/api/users/subscriptions/?fields=id,username'
+        )
+
+
+class UserDirectoryTests(RecipeDataTestCase):
+    """The open user list: cursor pages of at most 50 users, prefix
+    search and is_subscribed read in the page query."""
+
+    def ids(self, response):
+        return [user['id'] for user in response.data['results']]
+
+    def test_cursor_pages(self):
+        User.objects.create_user(
+            username='inactive', email='inactive@example.com',
+            password='password-12345', is_active=False
+        )
+        url, seen = '/api/users/?limit=3', []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            seen.extend(self.ids(response))
+            url = response.data['next']
+        self.assertEqual(
+            seen,
+            sorted(User.objects.filter(is_active=True).values_list(
+                'pk', flat=True
+            ))
+        )
+
+    def test_limit_is_capped(self):
+        User.objects.bulk_create(
+            User(username=f'user{number}', email=f'user{number}@example.com')
+            for number in range(60)
+        )
+        response = self.client.get('/api/users/?limit=1000')
+        self.assertEqual(len(response.data['results']), 50)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_search_by_prefix(self):
+        for search, expected in (
+            ('author', self.authors),
+            ('READER@', [self.user]),
+            ('author1@example', [self.authors[1]]),
+            ('example.com', []),
+        ):
+            with self.subTest(search=search):
+                response = self.client.get('/api/users/', {'search': search})
+                self.assertEqual(
+                    self.ids(response), [user.pk for user in expected]
+                )
+
+    def test_queries_do_not_grow_with_page(self):
+        User.objects.bulk_create(
+            User(username=f'user{number}', email=f'user{number}@example.com')
+            for number in range(20)
+        )
+        for limit in (2, 20):
+            with self.subTest(limit=limit), self.assertNumQueries(1):
+                response = self.client.get('/api/users/', {'limit': limit})
+            self.assertEqual(len(response.data['results']), limit)
+        subscribed = {
+            user['id']: user['is_subscribed']
+            for user in response.data['results']
+        }
+        self.assertEqual(
+            [pk for pk, value in subscribed.items() if value],
+            [author.pk for author in self.authors]
+        )
+
+    def test_retrieve(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/users/{self.authors[0].pk}/')
+        self.assertTrue(response.data['is_subscribed'])
+        response = self.client.get(f'/api/users/{self.user.pk}/')
+        self.assertFalse(response.data['is_subscribed'])
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(
+            user['is_subscribed'] for user in response.data['results']
+        ))
+
+
+class SparseFieldsTests(RecipeDataTestCase):
+
+    def test_selected_fields(self):
+        response = self.client.get(
+            '/api/recipes/',
+            {'fields': 'id,author.username', 'expand': 'author.recipes_count'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['results'][0],
+            {'id': self.recipes[5].pk,
+             'author': {'username': 'author2', 'recipes_count': 2}}
+        )
+
+    def test_unknown_fields(self):
+        recipe_url = f'/api/recipes/{self.recipes[0].pk}/'
+        for url, params, unknown in (
+            ('/api/recipes/', {'fields': 'bogus'}, 'bogus'),
+            ('/api/recipes/', {'fields': 'bogus', 'author': 0}, 'bogus'),
+            (recipe_url, {'fields': 'id,author.bogus'}, 'author.bogus'),
+            (recipe_url, {'omit': 'name.first'}, 'name.first'),
+            (recipe_url, {'expand': 'tags.bogus'}, 'tags.bogus'),
+            ('/api/users/', {'fields': 'id,recipes'}, 'recipes'),
+            ('/api/users/subscriptions/', {'omit': 'bogus'}, 'bogus'),
+        ):
+            with self.subTest(url=url, **params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(unknown, response.data[0])
+
+
+class PopularOrderingTests(RecipeDataTestCase):
+
+    def test_popular_with_tags(self):
+        for author in self.authors:
+            FavoriteRecipe.objects.create(user=author, recipe=self.recipes[5])
+        response = self.client.get(
+            '/api/recipes/',
+            {'ordering': 'popular', 'tags': ['tag1', 'tag2']}
+        )
+        self.assertEqual(response.status_code, 200)
+        recipes = self.recipes
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipes[5].pk, recipes[2].pk, recipes[1].pk, recipes[4].pk]
+        )
+
+    def test_unfavorite_restores_order(self):
+        url = f'/api/recipes/{self.recipes[4].pk}/favorite/'
+        for _ in range(3):
+            self.assertEqual(self.client.post(url).status_code, 201)
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        response = self.client.get(
+            '/api/recipes/', {'ordering': 'popular', 'tags': 'tag1'}
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipe.pk for recipe in self.recipes[2:0:-1]]
+            + [self.recipes[5].pk, self.recipes[4].pk]
+        )
+
+
+class PantryTests(RecipeDataTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(pantry, 'index', pantry.PantryIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ingredient = self.recipes[3].ingredients.order_by('pk').last()
+
+    def search(self):
+        response = self.client.get(
+            '/api/recipes/pantry/', {'ingredients': self.ingredient.pk}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_search_is_read_only(self):
+        found = self.search()
+        self.assertEqual(len(found), 3)
+        with mock.patch.object(pantry.index, 'discard') as discard:
+            # As if deleted by another process: no signal reaches this
+            # index.
+            Recipe.objects.filter(pk=found[0]).delete()
+            discard.reset_mock()
+            self.assertEqual(self.search(), found[1:])
+        discard.assert_not_called()
+
+
+class ConditionalRequestTests(RecipeDataTestCase):
+    """ETag and Last-Modified of recipe pages change with the recipes
+    and with the viewer's favorites, cart and subscriptions."""
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assert_not_modified(self, url, etag, expected=True):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304 if expected else 200)
+
+    def test_list_and_detail(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipes[0].pk}/'):
+            with self.subTest(url=url):
+                self.assert_not_modified(url, self.etag(url))
+
+    def test_recipe_change(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        etag = self.etag(url)
+        self.recipes[0].save()
+        self.assert_not_modified(url, etag, expected=False)
+
+    def test_viewer_state(self):
+        url = f'/api/recipes/{self.recipes[5].pk}/'
+        etag = self.etag(url)
+        FavoriteRecipe.objects.create(user=self.user, recipe=self.recipes[5])
+        self.assert_not_modified(url, etag, expected=False)
+
+    def test_other_viewer(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        etag = self.etag(url)
+        self.client.force_authenticate(self.authors[0])
+        self.assert_not_modified(url, etag, expected=False)
+
+    def test_last_modified_only_for_anonymous(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        self.assertNotIn('Last-Modified', self.client.get(url))
+        self.client.force_authenticate(None)
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_expand_has_no_validators(self):
+        response = self.client.get(
+            f'/api/recipes/{self.recipes[0].pk}/?expand=author'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_anonymous_data_is_cached(self):
+        self.client.force_authenticate(None)
+        recipe = self.recipes[0]
+        for url, queries in (
+            ('/api/recipes/', 2), (f'/api/recipes/{recipe.pk}/', 1)
+        ):
+            with self.subTest(url=url):
+                expected = self.client.get(url).json()
+                with self.assertNumQueries(queries):
+                    self.assertEqual(self.client.get(url).json(), expected)
+
+        recipe.name = 'Новое название'
+        recipe.save()
+        for url in ('/api/recipes/', f'/api/recipes/{recipe.pk}/'):
+            self.assertContains(self.client.get(url), 'Новое название')
+
+    def test_authenticated_data_is_not_cached(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        self.client.get(url)
+        with self.assertNumQueries(7):
+            self.client.get(url)
+
+    def test_hidden_recipe(self):
+        Recipe.all_objects.filter(pk=self.recipes[0].pk).update(
+            is_deleted=True
+        )
+        response = self.client.get(f'/api/recipes/{self.recipes[0].pk}/')
+        self.assertEqual(response.status_code, 404)
+
+
+class CompressionTests(SimpleTestCase):
+    """Accept-Encoding q-values decide between brotli and gzip; brotli
+    is kept to JSON."""
+
+    body = b'{"name": "recipe"}' * 200
+
+    def compress(self, accept_encoding, response):
+        request = RequestFactory().get(
+            '/api/recipes/', HTTP_ACCEPT_ENCODING=accept_encoding
+        )
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_choose_encoding(self):
+        for header, expected in (
+            ('gzip, deflate, br', 'br'),
+            ('gzip;q=1, br;q=0.5', 'gzip'),
+            ('br;q=0, gzip', 'gzip'),
+            ('BR;Q=0.000, gzip;q=0.1', 'gzip'),
+            ('*', 'br'),
+            ('*, br;q=0', 'gzip'),
+            ('br;q=oops', None),
+            ('identity', None),
+            ('', None),
+        ):
+            with self.subTest(header=header):
+                request = RequestFactory().get(
+                    '/', HTTP_ACCEPT_ENCODING=header
+                )
+                self.assertEqual(choose_encoding(request), expected)
+
+    def test_json_gets_brotli(self):
+        response = HttpResponse(self.body, content_type='application/json')
+        response['ETag'] = '"abc"'
+        response = self.compress('gzip, br', response)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.body)
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_html_gets_gzip(self):
+        response = self.compress(
+            'br', HttpResponse(self.body, content_type='text/html')
+        )
+        self.assertNotIn('Content-Encoding', response)
+        response = self.compress(
+            'br, gzip;q=0.5', HttpResponse(self.body, content_type='text/html')
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_refused_or_small(self):
+        response = self.compress(
+            'br;q=0, gzip;q=0',
+            HttpResponse(self.body, content_type='application/json')
+        )
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        response = self.compress(
+            'br', HttpResponse(b'{}', content_type='application/json')
+        )
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_streaming(self):
+        response = self.compress('gzip', StreamingHttpResponse(
+            iter([self.body] * 3), content_type='application/json'
+        ))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            self.body * 3
+        )
+
+
+class RepeatedQueriesTests(RecipeDataTestCase):
+    """A loop querying row by row is reported; loops marked as such and
+    allowlisted queries are not."""
+
+    def query_each(self):
+        for recipe in self.recipes:
+            list(recipe.tags.all())
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 5 AND name = 'a''b'"),
+            fingerprint('SELECT * FROM t WHERE id = 17 AND name =  \'c\'')
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (1, 2, 3)'),
+            fingerprint('SELECT * FROM t WHERE id IN (4)')
+        )
+
+    def test_loop_is_reported(self):
+        with self.assertRaisesMessage(
+            RepeatedQueriesError, 'loop: 6 queries of the same shape'
+        ):
+            with detect_repeated_queries('loop', threshold=3, fail=True):
+                self.query_each()
+
+    def test_warning_outside_tests(self):
+        with self.assertLogs('foodgram.nplusone', 'WARNING'):
+            with detect_repeated_queries(threshold=3, fail=False):
+                self.query_each()
+
+    def test_allowed_loops(self):
+        with detect_repeated_queries(threshold=3, fail=True):
+            with allow_repeated_queries():
+                self.query_each()
+            list(Recipe.objects.all())
+        with override_settings(NPLUSONE_ALLOWLIST=[r'recipes_recipe_tags']):
+            with detect_repeated_queries(threshold=3, fail=True):
+                self.query_each()
+
+
+class BatchTests(RecipeDataTestCase):
+
+    def batch(self, ids, **headers):
+        return self.client.get(f'/api/recipes/batch/?ids={ids}', **headers)
+
+    def test_requested_order_and_missing(self):
+        hidden = self.recipes[1]
+        Recipe.all_objects.filter(pk=hidden.pk).update(is_deleted=True)
+        ids = [self.recipes[3].pk, hidden.pk, 0, self.recipes[0].pk]
+        response = self.batch(','.join(map(str, ids)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.recipes[3].pk, self.recipes[0].pk]
+        )
+        self.assertEqual(response.data['missing'], [hidden.pk, 0])
+        self.assertTrue(response.data['results'][1]['is_favorited'])
+
+    def test_repeated_ids(self):
+        pk = self.recipes[0].pk
+        response = self.client.get(
+            f'/api/recipes/batch/?ids={pk},{pk}&ids={pk}'
+        )
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_not_modified(self):
+        ids = f'{self.recipes[0].pk},{self.recipes[1].pk}'
+        etag = self.batch(ids)['ETag']
+        self.assertEqual(
+            self.batch(ids, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+
+    @override_settings(RECIPE_BATCH_MAX_IDS=2)
+    def test_invalid(self):
+        for ids in ('', 'a,b', '1,2,3'):
+            with self.subTest(ids=ids):
+                self.assertEqual(self.batch(ids).status_code, 400)
+
+
+class BootstrapTests(RecipeDataTestCase):
+
+    def test_authenticated(self):
+        response = self.client.get('/api/bootstrap/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['id'], self.user.pk)
+        self.assertEqual(response.data['favorites_count'], 3)
+        self.assertEqual(response.data['shopping_cart_count'], 3)
+        self.assertEqual(len(response.data['tags']), 3)
+        self.assertEqual(
+            response.data['recipes'],
+            self.client.get('/api/recipes/').data
+        )
+
+    def test_counts_skip_hidden_recipes(self):
+        Recipe.all_objects.filter(pk=self.recipes[0].pk).update(
+            is_deleted=True
+        )
+        response = self.client.get('/api/bootstrap/')
+        self.assertEqual(response.data['favorites_count'], 2)
+        self.assertEqual(response.data['recipes']['count'], 5)
+
+    def test_filters_and_next_link(self):
+        query = f'?limit=1&author={self.authors[0].pk}'
+        recipes = self.client.get(f'/api/bootstrap/{query}').data['recipes']
+        self.assertEqual(
+            recipes, self.client.get(f'/api/recipes/{query}').data
+        )
+        self.assertIn('/api/recipes/?', recipes['next'])
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/bootstrap/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['user'])
+        self.assertEqual(response.data['favorites_count'], 0)
+        self.assertEqual(response.data['recipes']['count'], 6)
+
+
+@override_settings(INGREDIENT_SYNC_OVERLAP=0)
+class IngredientSyncTests(RecipeDataTestCase):
+
+    def sync(self, since=None):
+        url = '/api/ingredients/sync/'
+        if since is not None:
+            url += f'?since={since}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_changes_since_revision(self):
+        snapshot = self.sync()
+        self.assertTrue(snapshot['full'])
+        self.assertEqual(len(snapshot['ingredients']), 10)
+
+        renamed, removed, *_ = Ingredient.objects.all()
+        renamed.name = 'Соль'
+        renamed.save()
+        removed_id = removed.pk
+        removed.delete()
+        added = Ingredient.objects.create(name='Перец', measurement_unit='г')
+
+        changes = self.sync(snapshot['revision'])
+        self.assertFalse(changes['full'])
+        self.assertGreater(changes['revision'], snapshot['revision'])
+        self.assertEqual(
+            {ingredient['id']: ingredient['name']
+             for ingredient in changes['changed']},
+            {renamed.pk: 'Соль', added.pk: 'Перец'}
+        )
+        self.assertEqual(changes['deleted'], [removed_id])
+
+        latest = self.sync(changes['revision'])
+        self.assertEqual((latest['changed'], latest['deleted']), ([], []))
+
+    def test_snapshot_when_behind_or_ahead(self):
+        revision = self.sync()['revision']
+        for name in ('Перец', 'Укроп'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        with override_settings(INGREDIENT_SYNC_MAX_CHANGES=1):
+            self.assertTrue(self.sync(revision)['full'])
+        self.assertTrue(self.sync(revision + 100)['full'])
+
+    @override_settings(INGREDIENT_SYNC_OVERLAP=3600)
+    def test_recent_changes_are_not_settled(self):
+        revision = self.sync()['revision']
+        Ingredient.objects.create(name='Перец', measurement_unit='г')
+        self.assertEqual(self.sync(revision)['revision'], revision)
+
+    def test_invalid_revision(self):
+        response = self.client.get('/api/ingredients/sync/?since=abc')
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeSnapshotTests(RecipeDataTestCase):
+    """Anonymous recipe pages written for nginx follow the recipes."""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(
+            RECIPE_SNAPSHOT_DIR=directory,
+            RECIPE_SNAPSHOT_ORIGIN='http://testserver'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def stored(self, recipe):
+        path = snapshots.snapshot_path(recipe.pk)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as file:
+            return json.loads(file.read())
+
+    def test_publish_matches_anonymous_page(self):
+        recipe = self.recipes[0]
+        snapshots.publish(recipe.pk)
+        self.client.force_authenticate(None)
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(self.stored(recipe), json.loads(response.content))
+        with open(snapshots.snapshot_path(recipe.pk, '.br'), 'rb') as file:
+            self.assertEqual(
+                json.loads(brotli.decompress(file.read())),
+                self.stored(recipe)
+            )
+
+    def test_image_url_matches_backend(self):
+        recipe = self.recipes[0]
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image='recipes/images/soup.png'
+        )
+        snapshots.publish(recipe.pk)
+        self.client.force_authenticate(None)
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(
+            self.stored(recipe)['image'],
+            'http://testserver/media/recipes/images/soup.png'
+        )
+        self.assertEqual(self.stored(recipe), json.loads(response.content))
+
+    def test_follows_saves_and_deletes(self):
+        recipe = self.recipes[0]
+        recipe.name = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        self.assertEqual(self.stored(recipe)['name'], 'Новое название')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertIsNone(self.stored(recipe))
+        for suffix in snapshots.SUFFIXES:
+            self.assertFalse(
+                os.path.exists(snapshots.snapshot_path(recipe.pk, suffix))
+            )
+
+    def test_hidden_recipe_is_removed(self):
+        recipe = self.recipes[0]
+        snapshots.publish(recipe.pk)
+        Recipe.all_objects.filter(pk=recipe.pk).update(is_deleted=True)
+        snapshots.publish(recipe.pk)
+        self.assertIsNone(self.stored(recipe))
+
+    def test_tag_change_unpublishes_its_recipes(self):
+        tag = Tag.objects.get(slug='tag2')
+        tagged = set(tag.recipe_set.values_list('pk', flat=True))
+        snapshots.publish(*(recipe.pk for recipe in self.recipes))
+        tag.name = 'Ужин'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        self.assertEqual(
+            snapshots.stored_ids(),
+            {recipe.pk for recipe in self.recipes} - tagged
+        )
+
+    def test_rebuild(self):
+        snapshots.write(snapshots.snapshot_path(10 ** 6), b'{}')
+        self.assertEqual(sum(snapshots.rebuild(batch_size=4)), 6)
+        self.assertEqual(
+            snapshots.stored_ids(), {recipe.pk for recipe in self.recipes}
+        )
+
+    @override_settings(RECIPE_SNAPSHOT_DIR='')
+    def test_disabled(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.recipes[0].save()
+        self.assertEqual(callbacks, [])
+
+    @override_settings(RECIPE_SNAPSHOT_ORIGIN='')
+    def test_origin_is_required(self):
+        self.assertFalse(snapshots.enabled())
+        self.assertEqual(
+            [error.id for error in snapshot_settings(None)], ['api.E001']
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.recipes[0].save()
+        self.assertEqual(callbacks, [])
+
+
+@override_settings(PROFILE_DIR='')
+class ProfilingTests(RecipeDataTestCase):
+    """Every recipe action that serializes recipes reports serializer
+    time in Server-Timing when profiled."""
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+
+    def serializer_ms(self, url):
+        response = self.client.get(url, HTTP_X_PROFILE='cprofile')
+        self.assertEqual(response.status_code, 200)
+        timings = dict(
+            part.strip().split(';dur=')
+            for part in response['Server-Timing'].split(',')
+        )
+        return float(timings['serializer'])
+
+    def test_serializer_time(self):
+        ids = ','.join(str(recipe.pk) for recipe in self.recipes)
+        for url in (
+            '/api/recipes/',
+            '/api/recipes/feed/',
+            f'/api/recipes/batch/?ids={ids}',
+            '/api/recipes/pantry/?ingredients='
+            f'{self.recipes[0].ingredients.first().pk}',
+        ):
+            with self.subTest(url=url):
+                self.assertGreater(self.serializer_ms(url), 0)
+
+
+class Base64ImageTests(SimpleTestCase):
+    """Line-wrapped data URIs, as some clients send them, decode to the
+    original bytes across chunk boundaries."""
+
+    def setUp(self):
+        # Noise does not compress, so the PNG spans several chunks.
+        pixels = random.Random(0).randbytes(3 * 160 * 160)
+        image = Image.frombytes('RGB', (160, 160), pixels)
+        output = io.BytesIO()
+        image.save(output, format='PNG')
+        self.png = output.getvalue()
+
+    def test_wrapped_payload(self):
+        encoded = base64.encodebytes(self.png).decode()
+        self.assertGreater(len(encoded), DECODE_CHUNK)
+        with override_settings(IMAGE_MAX_SIZE=len(self.png)):
+            file = decode_base64(f'data:image/png;base64,{encoded}')
+        self.assertEqual(file.read(), self.png)
+        self.assertEqual(file.size, len(self.png))
+
+
+def png(size=(10, 10)):
+    output = io.BytesIO()
+    Image.new('RGB', size).save(output, format='PNG')
+    return output.getvalue()
+
+
+class RecipeImageTests(RecipeDataTestCase):
+    """Recipe images sent as multipart files or uploaded first and
+    referred to by token."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def recipe_data(self, **fields):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+            'tags': [self.recipes[0].tags.first().pk],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 50}
+                for ingredient in self.recipes[0].ingredients.all()[:2]
+            ],
+            **fields
+        }
+
+    def upload(self, content=None, client=None):
+        response = (client or self.client).post(
+            '/api/recipes/images/',
+            {'image': SimpleUploadedFile('photo', content or png())},
+            format='multipart'
+        )
+        return response
+
+    def references(self, name):
+        return MediaFile.objects.filter(name=name).values_list(
+            'references', flat=True
+        ).first()
+
+    def other_client(self):
+        client = APIClient()
+        client.force_authenticate(self.authors[0])
+        return client
+
+    def test_multipart_create(self):
+        response = self.client.post(
+            '/api/recipes/',
+            {
+                'data': json.dumps(self.recipe_data()),
+                'image': SimpleUploadedFile('photo', png()),
+            },
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.assertTrue(recipe.image.name.endswith('.png'))
+        self.assertEqual(recipe.ingredients.count(), 2)
+        self.assertEqual(self.references(recipe.image.name), 1)
+
+    def test_invalid_data_part(self):
+        response = self.client.post(
+            '/api/recipes/', {'data': '[1, 2]'}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_with_token(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 201)
+        upload = RecipeImageUpload.objects.get(token=response.data['token'])
+        name = upload.image.name
+        self.assertEqual(self.references(name), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/',
+                self.recipe_data(image=upload.token),
+                format='json'
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.assertEqual(recipe.image.name, name)
+        self.assertFalse(RecipeImageUpload.objects.exists())
+        self.assertEqual(self.references(name), 1)
+
+        # The token was used up.
+        response = self.client.post(
+            '/api/recipes/', self.recipe_data(image=upload.token),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    def test_token_of_another_user(self):
+        token = self.upload().data['token']
+        response = self.other_client().post(
+            '/api/recipes/', self.recipe_data(image=token), format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+        self.assertTrue(RecipeImageUpload.objects.filter(
+            token=token
+        ).exists())
+
+    def test_expired_token(self):
+        token = self.upload().data['token']
+        RecipeImageUpload.objects.update(
+            created=timezone.now() - timedelta(
+                seconds=settings.IMAGE_UPLOAD_TTL + 1
+            )
+        )
+        response = self.client.post(
+            '/api/recipes/', self.recipe_data(image=token), format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_upload_limits(self):
+        with override_settings(IMAGE_MAX_SIZE=100):
+            self.assertEqual(
+                self.upload(png((100, 100)) + bytes(100)).status_code, 400
+            )
+        # Rejected from the header: the pixels are never decoded.
+        content = png((6001, 1))
+        with mock.patch.object(
+            Image.Image, 'load', side_effect=AssertionError
+        ):
+            response = self.upload(content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('6000', str(response.data['image']))
+        self.assertEqual(self.upload(b'not an image').status_code, 400)
+        self.assertFalse(RecipeImageUpload.objects.exists())
+
+    def test_upload_needs_authentication(self):
+        self.assertEqual(self.upload(client=APIClient()).status_code, 401)
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTests(SimpleTestCase):
+    """Both stores with an injected clock: refill, burst and the
+    all-or-nothing charge of several buckets."""
+
+    def stores(self):
+        yield throttling.LocalBucketStore()
+        caches['default'].clear()
+        yield throttling.CacheBucketStore('default')
+
+    def test_burst_then_refill(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                store.clock = clock = Clock()
+                bucket = [('anon:ip:1', 3, 0.5, 1)]
+                self.assertEqual(
+                    [store.take(bucket) for _ in range(4)], [0, 0, 0, 2]
+                )
+                clock.now += 1
+                self.assertEqual(store.take(bucket), 1)
+                clock.now += 1
+                self.assertEqual(store.take(bucket), 0)
+
+    def test_rejected_request_charges_no_bucket(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                store.clock = Clock()
+                general = ('user:user:1', 10, 1, 5)
+                endpoint = ('recipes-batch:user:1', 1, 1, 1)
+                self.assertEqual(store.take([general, endpoint]), 0)
+                self.assertEqual(store.take([general, endpoint]), 1)
+                # Only the first request drained the general bucket.
+                self.assertEqual(store.take([general]), 0)
+                self.assertEqual(store.take([general]), 5)
+
+    def test_take_all(self):
+        buckets = [('a', 10, 2, 4), ('b', 4, 1, 1)]
+        wait, levels = throttling.take_all(
+            buckets, {'a': (1, 100), 'b': (0, 100)}, 101
+        )
+        self.assertEqual(wait, 0.5)
+        self.assertEqual(levels, {'a': (3, 101), 'b': (1, 101)})
+        wait, levels = throttling.take_all(buckets, {'a': (1, 100)}, 102)
+        self.assertEqual(wait, 0)
+        self.assertEqual(levels, {'a': (1, 102), 'b': (3, 102)})
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {'anon': '2/min'},
+})
+class ThrottlingTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            throttling, '_store', throttling.LocalBucketStore()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_too_many_requests(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/tags/').status_code, 200)
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_anonymous_clients_by_proxy_address(self):
+        def get(forwarded):
+            return self.client.get(
+                '/api/tags/', HTTP_X_FORWARDED_FOR=forwarded
+            ).status_code
+
+        # A spoofed first entry does not give the client a new bucket.
+        self.assertEqual(
+            [get(f'10.0.0.{number}, 192.0.2.1') for number in range(3)],
+            [200, 200, 429]
+        )
+        self.assertEqual(get('192.0.2.2'), 200)
+
+    @override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {'anon': '10/min', 'users-list': '2/min'},
+    })
+    def test_user_list_has_its_own_rate(self):
+        self.assertEqual(
+            [self.client.get('/api/users/').status_code for _ in range(3)],
+            [200, 200, 429]
+        )
+        self.assertEqual(self.client.get('/api/tags/').status_code, 200)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Tests run with one replica mirroring the default database."""
+
+    databases = {'default', 'replica1'}
+
+    def request(self, method, status=200, **cookies):
+        seen = []
+
+        def view(request):
+            seen.append(router.db_for_read(Recipe))
+            return HttpResponse(status=status)
+
+        factory = RequestFactory()
+        factory.cookies.load(cookies)
+        response = ReplicaRoutingMiddleware(view)(
+            getattr(factory, method)('/api/recipes/')
+        )
+        return seen[0], response
+
+    def test_reads_go_to_replica(self):
+        Tag.objects.create(name='Обед', color='#000000', slug='lunch')
+        tags = Tag.objects.filter(slug='lunch')
+        self.assertEqual(tags.db, 'replica1')
+        self.assertTrue(tags.exists())
+
+    def test_atomic_blocks_read_from_primary(self):
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Recipe), 'default')
+        self.assertEqual(router.db_for_read(Recipe), 'replica1')
+
+    def test_write_pins_client_to_primary(self):
+        alias, response = self.request('post', status=201)
+        self.assertEqual(alias, 'default')
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        alias, response = self.request(
+            'get', **{settings.REPLICA_PIN_COOKIE: '1'}
+        )
+        self.assertEqual(alias, 'default')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(self.request('get')[0], 'replica1')
+        self.assertEqual(router.db_for_read(Recipe), 'replica1')
+
+    def test_failed_write_does_not_pin(self):
+        alias, response = self.request('post', status=400)
+        self.assertEqual(alias, 'default')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_workers_read_from_primary(self):
+        seen = []
+
+        def process_updates(recipe_ids):
+            seen.append(router.db_for_read(Recipe))
+            return len(recipe_ids)
+
+        with mock.patch(
+            'recipes.management.commands.process_similar_recipes.'
+            'claim_updates', side_effect=[[1], []]
+        ), mock.patch(
+            'recipes.management.commands.process_similar_recipes.'
+            'process_updates', process_updates
+        ):
+            call_command(
+                'process_similar_recipes', once=True, stdout=io.StringIO()
+            )
+        self.assertEqual(seen, ['default'])
+        self.assertEqual(router.db_for_read(Recipe), 'replica1')
+
+    def test_batch_commands_read_from_primary(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password-12345'
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=10
+        )
+        FavoriteRecipe.objects.create(user=author, recipe=recipe)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        export = os.path.join(directory, 'export.jsonl')
+        call_command('export_foodgram', export, stderr=io.StringIO())
+        commands = [
+            ('rebuild_popularity',),
+            ('build_similar_recipes',),
+            ('clear_image_uploads',),
+            ('rebuild_snapshots',),
+            ('import_foodgram', export),
+        ]
+        for command in commands:
+            with self.subTest(command=command[0]), override_settings(
+                RECIPE_SNAPSHOT_DIR=directory,
+                RECIPE_SNAPSHOT_ORIGIN='http://testserver'
+            ), CaptureQueriesContext(
+                connections['replica1']
+            ) as replica, CaptureQueriesContext(
+                connections['default']
+            ) as primary:
+                call_command(*command, stdout=io.StringIO())
+                self.assertEqual(len(replica), 0)
+                self.assertTrue(any(
+                    query['sql'].startswith('SELECT') for query in primary
+                ))
+
+
+class ResponseWarmupTests(TransactionTestCase):
+    """The replay runs in threads with their own connections, so the
+    data is committed."""
+
+    databases = {'default', 'replica1'}
+
+    def test_replay_fills_response_cache(self):
+        cache.clear()
+        recipe = Recipe.objects.create(
+            author=User.objects.create_user(
+                username='author', email='author@example.com',
+                password='password-12345'
+            ),
+            name='Рецепт', text='Описание', cooking_time=10
+        )
+        url = f'/api/recipes/{recipe.pk}/'
+        self.assertEqual(
+            [status for _, status, _ in replay([url], 1, 30)], [200]
+        )
+        with CaptureQueriesContext(
+            connections['default']
+        ) as primary, CaptureQueriesContext(
+            connections['replica1']
+        ) as replica:
+            response = self.client.get(url, HTTP_HOST=client_host())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Рецепт')
+        # Only the ETag lookup.
+        self.assertEqual(len(primary) + len(replica), 1)
+
+
+class GunicornConfigTests(SimpleTestCase):
+
+    def setUp(self):
+        self.config = runpy.run_path(
+            os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')
+        )
+
+    def test_settings(self):
+        self.assertTrue(self.config['preload_app'])
+        self.assertGreater(self.config['workers'], 0)
+        self.assertNotIn('post_fork', self.config)
+
+    def test_master_closes_connections_after_warmup(self):
+        calls = mock.Mock()
+        with mock.patch(
+            'foodgram.warmup.warm', calls.warm
+        ), mock.patch.object(
+            connections, 'close_all', calls.close_all
+        ):
+            self.config['when_ready'](mock.Mock())
+        self.assertEqual(
+            calls.mock_calls, [mock.call.warm(), mock.call.close_all()]
+        )
+
+
+class ImportAuditTests(SimpleTestCase):
+
+    def test_report(self):
+        for options, header in (
+            ({}, 'cumulative ms'), ({'packages': True}, 'package')
+        ):
+            with self.subTest(**options):
+                output = io.StringIO()
+                call_command(
+                    'import_audit', top=3, stdout=output,
+                    stderr=io.StringIO(), **options
+                )
+                lines = output.getvalue().splitlines()
+                self.assertIn(header, lines[0])
+                self.assertEqual(len(lines[1:4]), 3)
+                self.assertEqual(lines[4], '')
+                self.assertRegex(
+                    lines[5], r'^Модулей: \d+, время импорта: \d+ мс'
+                )
+
+
+class WarmupTests(TestCase):
+
+    def test_warm_caches_needs_shared_cache(self):
+        with self.assertRaises(CommandError):
+            call_command('warm_caches', popular=0)
+
+    @override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {'anon': '1/min'},
+    })
+    def test_replay_is_not_throttled(self):
+        results = replay(['/api/tags/'] * 3, concurrency=1, budget=30)
+        self.assertEqual([status for _, status, _ in results], [200] * 3)
+
+
+# Plan lines meaning the whole recipe table is read or sorted.
+FULL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on recipes_recipe\b'),
+    'sqlite': re.compile(r'\bSCAN recipes_recipe$', re.MULTILINE),
+}
+SORT = {
+    'postgresql': re.compile(r'^\s*(->\s*)?(Incremental )?Sort\b',
+                             re.MULTILINE),
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+}
+
+
+class RecipeOrderingPlanTests(TestCase):
+    """Every ?ordering= of the recipe list, alone and combined with the
+    author, tag and cooking time filters, is served by an index: EXPLAIN
+    of the queryset RecipeViewSet builds shows no full scan of the
+    recipe table, and no sort unless a tag or a cooking time range
+    narrows the rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='password-12345'
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#000000', slug='breakfast'
+        )
+        recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание', cooking_time=10
+        )
+        recipe.tags.add(cls.tag)
+
+    def setUp(self):
+        if connection.vendor not in FULL_SCAN:
+            self.skipTest(f'Планы {connection.vendor} не поддерживаются.')
+
+    def cases(self):
+        yield {}, True
+        yield {'cooking_time_min': 5, 'cooking_time_max': 30}, False
+        yield {'author': self.user.pk}, True
+        yield {'tags': self.tag.slug}, False
+
+    def served_queryset(self, params):
+        request = APIRequestFactory().get('/api/recipes/', params)
+        force_authenticate(request, self.user)
+        view = RecipeViewSet(
+            action_map={'get': 'list'}, args=(), kwargs={},
+            format_kwarg=None
+        )
+        view.request = view.initialize_request(request)
+        return view.filter_queryset(view.get_queryset())
+
+    def explain(self, queryset):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # With a small table the planner rightly prefers reading
+                # it whole; this shows what it would do with a big one.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+
+    def test_orderings_use_indexes(self):
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        for params, ordered in self.cases():
+            for ordering in ORDERINGS:
+                queryset = self.served_queryset(
+                    {**params, 'ordering': ordering}
+                )
+                # The page of ids the list view reads first, then the
+                # annotated rows it serializes.
+                for query in (
+                    queryset.values_list('id', 'updated')[:page_size],
+                    queryset[:page_size],
+                ):
+                    with self.subTest(params=params, ordering=ordering):
+                        plan = self.explain(query)
+                        self.assertIsNone(
+                            FULL_SCAN[connection.vendor].search(plan), plan
+                        )
+                        if ordered:
+                            self.assertIsNone(
+                                SORT[connection.vendor].search(plan), plan
+                            )
@@ -0,0 +1,181 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from foodgram.warmup import WARMUP_ENVIRON
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# The local store forgets full buckets once it tracks this many keys.
+LOCAL_STORE_MAX_KEYS = 100000
+
+
+def parse_rate(rate):
+    """'120/min' -> (capacity 120, refill 2 tokens per second)."""
+    number, period = rate.split('/')
+    capacity = int(number)
+    return capacity, capacity / DURATIONS[period[0]]
+
+
+def refill_bucket(bucket, capacity, refill, now):
+    tokens, stamp = bucket[:2] if bucket else (capacity, now)
+    return min(capacity, tokens + max(0, now - stamp) * refill)
+
+
+def take_all(buckets, stored, now):
+    """All-or-nothing charge of buckets, a list of (key, capacity,
+    refill, cost), given their stored (tokens, stamp) values. Returns the
+    wait in seconds and the new values; nothing is deducted unless every
+    bucket has enough tokens."""
+    levels = {
+        key: refill_bucket(stored.get(key), capacity, refill, now)
+        for key, capacity, refill, _ in buckets
+    }
+    wait = max(
+        (
+            (cost - levels[key]) / refill
+            for key, _, refill, cost in buckets
+            if levels[key] < cost
+        ),
+        default=0
+    )
+    if not wait:
+        for key, _, _, cost in buckets:
+            levels[key] -= cost
+    return wait, {key: (tokens, now) for key, tokens in levels.items()}
+
+
+class LocalBucketStore:
+    """Token buckets in process memory, shared by the threads of one
+    worker."""
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def take(self, buckets):
+        with self.lock:
+            now = self.clock()
+            wait, updated = take_all(buckets, self.buckets, now)
+            for key, capacity, refill, _ in buckets:
+                tokens = updated[key][0]
+                self.buckets[key] = (
+                    tokens, now, now + (capacity - tokens) / refill
+                )
+            if len(self.buckets) > LOCAL_STORE_MAX_KEYS:
+                self.prune(now)
+            return wait
+
+    def prune(self, now):
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items()
+            if bucket[2] > now
+        }
+
+
+class CacheBucketStore:
+    """Token buckets in a Django cache shared by all workers and hosts,
+    so they are stamped with the wall clock. A short lock in the cache
+    makes the check and the charge of one client's buckets atomic; if it
+    cannot be taken in time the request is charged without it."""
+
+    clock = staticmethod(time.time)
+    lock_timeout = 1
+    lock_wait = 0.05
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    @contextmanager
+    def locked(self, key):
+        key = f'throttle-lock:{key}'
+        deadline = time.monotonic() + self.lock_wait
+        acquired = self.cache.add(key, 1, self.lock_timeout)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(0.002)
+            acquired = self.cache.add(key, 1, self.lock_timeout)
+        try:
+            yield
+        finally:
+            if acquired:
+                self.cache.delete(key)
+
+    def take(self, buckets):
+        keys = {key: f'throttle:{key}' for key, _, _, _ in buckets}
+        with self.locked(buckets[0][0]):
+            now = self.clock()
+            stored = self.cache.get_many(list(keys.values()))
+            wait, updated = take_all(
+                buckets,
+                {key: stored.get(cache_key) for key, cache_key in
+                 keys.items()},
+                now
+            )
+            timeout = max(
+                int((capacity - updated[key][0]) / refill) + 1
+                for key, capacity, refill, _ in buckets
+            )
+            self.cache.set_many(
+                {keys[key]: value for key, value in updated.items()},
+                timeout
+            )
+        return wait
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        if settings.THROTTLE_STORE == 'cache':
+            _store = CacheBucketStore(settings.THROTTLE_CACHE_ALIAS)
+        else:
+            _store = LocalBucketStore()
+    return _store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Charges every request to the 'user' or 'anon' bucket of the client
+    with the THROTTLE_COSTS weight of its URL name. URL names that have
+    their own entry in DEFAULT_THROTTLE_RATES get an extra bucket."""
+
+    def __init__(self):
+        self.wait_time = 0
+
+    def get_buckets(self, request, view):
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        url_name = getattr(request.resolver_match, 'url_name', None)
+        if request.user and request.user.is_authenticated:
+            scope, ident = 'user', f'user:{request.user.pk}'
+        else:
+            scope, ident = 'anon', f'ip:{self.get_ident(request)}'
+        cost = settings.THROTTLE_COSTS.get(url_name, 1)
+        if rates.get(scope):
+            yield f'{scope}:{ident}', rates[scope], cost
+        if url_name in rates:
+            yield f'{url_name}:{ident}', rates[url_name], 1
+
+    def allow_request(self, request, view):
+        """A request is charged to its buckets only if all of them allow
+        it, so a rejected call to an endpoint with its own rate does not
+        drain the client's general bucket. Cache warmup requests are
+        not throttled."""
+        if request.META.get(WARMUP_ENVIRON):
+            return True
+        buckets = []
+        for key, rate, cost in self.get_buckets(request, view):
+            capacity, refill = parse_rate(rate)
+            buckets.append((key, capacity, refill, min(cost, capacity)))
+        self.wait_time = get_store().take(buckets) if buckets else 0
+        return self.wait_time == 0
+
+    def wait(self):
+        return math.ceil(self.wait_time)
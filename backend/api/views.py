@@ -1,29 +1,57 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import OuterRef, Sum
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
+from djoser import utils as djoser_utils
 from djoser.views import UserViewSet
 from rest_framework import exceptions, status, viewsets, mixins
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import FileUploadParser, JSONParser
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from recipes import deletion, pantry, timeline
 from recipes.models import (FavoriteRecipe,
                             Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, SimilarRecipe, Tag)
 from users.models import Follow
-from .filters import CustomFilterForIngredients, CustomFilterForRecipes
-from .paginations import CustomPagination
+from .catalog import (catalog_response, encoded_response, get_changes,
+                      get_revision, get_snapshot, get_tags)
+from .fieldsets import ALL
+from .filters import (CustomFilterForIngredients, CustomFilterForRecipes,
+                      CustomFilterForUsers)
+from .mixins import ConditionalResponseMixin, SparseFieldsMixin
+from .paginations import (CustomPagination, DirectoryPagination,
+                          TimelinePagination)
+from .parsers import MultiPartJSONParser
 from .permissions import IsAuthorOrReadOnly
+from .profiling import ProfiledViewMixin
 from .serializers import (CustomUserSerializer, GetRecipeSerializer,
-                          IngredientSerializer, PostRecipeSerializer,
+                          IngredientSerializer, PantryRecipeSerializer,
+                          PostRecipeSerializer, RecipeImageUploadSerializer,
                           ShortRecipeSerializer, SubscriptionSerializer,
-                          TagSerializer)
+                          TagSerializer, count_related)
 
 User = get_user_model()
 
 
+def get_id_list(request, name, error):
+    """Unique ids from ?name=1,2&name=3 in the order given."""
+    try:
+        ids = [
+            int(value)
+            for item in request.query_params.getlist(name)
+            for value in item.split(',') if value
+        ]
+    except ValueError:
+        raise exceptions.ValidationError(error)
+    return list(dict.fromkeys(ids))
+
+
 class ListRetrieveViewSet(
     viewsets.GenericViewSet, mixins.ListModelMixin, mixins.RetrieveModelMixin
 ):
@@ -36,6 +64,9 @@ class TagsViewSet(ListRetrieveViewSet):
     serializer_class = TagSerializer
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return Response(get_tags())
+
 
 class IngredientsViewSet(ListRetrieveViewSet):
 
@@ -44,12 +75,47 @@ class IngredientsViewSet(ListRetrieveViewSet):
     pagination_class = None
     filter_class = CustomFilterForIngredients
 
+    def list(self, request, *args, **kwargs):
+        if not request.query_params:
+            return catalog_response(request)
+        return super().list(request, *args, **kwargs)
 
-class CustomUserViewSet(UserViewSet):
+    @action(detail=False, methods=['GET'])
+    def sync(self, request):
+        """Changes of the catalog after ?since=<revision>, or the whole
+        catalog when since is missing or too old. Clients keep the
+        returned revision for the next call."""
+        since = request.query_params.get('since')
+        revision = get_revision()
+        if since:
+            if not since.isdigit():
+                raise exceptions.ValidationError(
+                    'Ревизия задаётся целым числом.')
+            changes = get_changes(int(since), revision)
+            if changes is not None:
+                return Response(changes)
+        return encoded_response(request, get_snapshot(revision))
 
-    queryset = User.objects.all()
+
+class CustomUserViewSet(ProfiledViewMixin, SparseFieldsMixin, UserViewSet):
+
+    queryset = User.objects.filter(is_active=True)
     serializer_class = CustomUserSerializer
-    pagination_class = CustomPagination
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = CustomFilterForUsers
+
+    @property
+    def pagination_class(self):
+        # The open directory is paged by cursor; subscriptions keep the
+        # page numbers the frontend asks for.
+        if self.action == 'list':
+            return DirectoryPagination
+        return CustomPagination
+
+    def perform_destroy(self, instance):
+        if instance == self.request.user:
+            djoser_utils.logout_user(self.request)
+        deletion.delete_user(instance)
 
     @action(
         detail=False,
@@ -58,13 +124,14 @@ class CustomUserViewSet(UserViewSet):
         serializer_class=SubscriptionSerializer
     )
     def subscriptions(self, request):
-        user = request.user
-        favorites = user.followers.all()
-        users_id = [
-            favorite_instance.author.id for favorite_instance in favorites]
-        users = User.objects.filter(id__in=users_id)
+        users = self.optimize_queryset(
+            User.objects.filter(
+                id__in=request.user.followers.values('author_id'),
+                is_active=True
+            )
+        )
         paginated_queryset = self.paginate_queryset(users)
-        serializer = self.serializer_class(paginated_queryset, many=True)
+        serializer = self.get_serializer(paginated_queryset, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(
@@ -74,7 +141,7 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, pk=id)
+        author = get_object_or_404(User, pk=id, is_active=True)
 
         follow_search = Follow.objects.filter(user=user, author=author)
 
@@ -120,19 +187,117 @@ class FavoriteShoppingCartMixin:
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RecipeViewSet(viewsets.ModelViewSet, FavoriteShoppingCartMixin):
+class RecipeViewSet(ProfiledViewMixin, ConditionalResponseMixin,
+                    SparseFieldsMixin, viewsets.ModelViewSet,
+                    FavoriteShoppingCartMixin):
 
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthorOrReadOnly]
     pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = CustomFilterForRecipes
+    parser_classes = (JSONParser, MultiPartJSONParser)
 
     def get_serializer_class(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'batch', 'feed']:
             return GetRecipeSerializer
+        if self.action == 'pantry':
+            return PantryRecipeSerializer
         return PostRecipeSerializer
 
+    def perform_destroy(self, instance):
+        deletion.delete_recipe(instance)
+
+    @action(detail=False, methods=['POST'],
+            permission_classes=[IsAuthenticated],
+            parser_classes=[MultiPartJSONParser, FileUploadParser])
+    def images(self, request):
+        image = request.data.get('image', request.data.get('file'))
+        serializer = RecipeImageUploadSerializer(
+            data={'image': image}, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['GET'],
+            permission_classes=[IsAuthenticated],
+            pagination_class=TimelinePagination)
+    def feed(self, request):
+        page = self.paginate_queryset(
+            self.optimize_queryset(timeline.feed(request.user))
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['GET'])
+    def batch(self, request):
+        """Recipes by ?ids=1,2,3 in the requested order; ids that do not
+        exist or are hidden are listed in "missing"."""
+        ids = get_id_list(request, 'ids', 'Рецепты задаются списком id.')
+        if not ids:
+            raise exceptions.ValidationError('Укажите хотя бы один рецепт.')
+        if len(ids) > settings.RECIPE_BATCH_MAX_IDS:
+            raise exceptions.ValidationError(
+                'Можно запросить не больше '
+                f'{settings.RECIPE_BATCH_MAX_IDS} рецептов.')
+
+        queryset = self.get_queryset().filter(pk__in=ids)
+        rows = list(queryset.values_list('id', 'updated'))
+        etag = self.get_validators(request, rows)
+        not_modified = self.conditional_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        recipes = queryset.in_bulk([pk for pk, _ in rows])
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True
+        )
+        return self.apply_validators(Response({
+            'results': serializer.data,
+            'missing': [pk for pk in ids if pk not in recipes],
+        }), etag)
+
+    @action(detail=False, methods=['GET'])
+    def pantry(self, request):
+        ingredient_ids = set(get_id_list(
+            request, 'ingredients', 'Ингредиенты задаются списком id.'
+        ))
+        if not ingredient_ids:
+            raise exceptions.ValidationError(
+                'Укажите хотя бы один ингредиент.')
+        if len(ingredient_ids) > settings.PANTRY_MAX_INGREDIENTS:
+            raise exceptions.ValidationError(
+                'Слишком много ингредиентов.')
+
+        ranking = pantry.index.search(
+            ingredient_ids, settings.PANTRY_MAX_RESULTS
+        )
+        page = self.paginate_queryset(ranking)
+        recipes = self.optimize_queryset(Recipe.objects.all()).in_bulk(
+            [pk for pk, _ in page]
+        )
+        # Recipes deleted in another process stay in this index until
+        # its next rebuild and are skipped here.
+        results = []
+        for pk, missing in page:
+            if pk in recipes:
+                recipes[pk].missing_ingredients = missing
+                results.append(recipes[pk])
+        serializer = self.get_serializer(results, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['GET'])
+    def similar(self, request, pk=None):
+        similar_recipes = SimilarRecipe.objects.filter(
+            recipe=self.get_object(), similar__is_deleted=False
+        ).select_related('similar').order_by('-score')
+        recipes = [row.similar for row in similar_recipes]
+        serializer = ShortRecipeSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data)
+
     @action(detail=True, methods=('POST', 'DELETE'),
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
@@ -161,26 +326,96 @@ class RecipeViewSet(viewsets.ModelViewSet, FavoriteShoppingCartMixin):
             return self.delete_method(ShoppingCart, pk, request,
                                       error_message)
 
-    @action(detail=False, methods=['GET'],
-            permission_classes=[IsAuthenticated])
-    def download_shopping_cart(self, request):
-        shopping_cart = ShoppingCart.objects.filter(user=request.user)
-        recipes_id = [item.recipe.id for item in shopping_cart]
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__in=recipes_id).values('ingredient__name',
-                                          'ingredient__measurement_unit'
-                                          ).annotate(amount=Sum('amount'))
-        final_list = 'Список покупок от Foodgram\n\n'
-
+    @staticmethod
+    def shopping_list_lines(ingredients, batch_size=500):
+        batch = ['Список покупок от Foodgram\n']
         for item in ingredients:
             ingredient_name = item['ingredient__name']
             measurement_unit = item['ingredient__measurement_unit']
             amount = item['amount']
-            final_list += f'{ingredient_name} ({measurement_unit}) {amount}\n'
+            batch.append(f'\n{ingredient_name} ({measurement_unit}) {amount}')
+            if len(batch) >= batch_size:
+                yield ''.join(batch)
+                batch = []
+        yield ''.join(batch)
 
+    @action(detail=False, methods=['GET'],
+            permission_classes=[IsAuthenticated])
+    def download_shopping_cart(self, request):
+        shopping_cart = ShoppingCart.objects.filter(user=request.user)
+        ingredients = RecipeIngredient.objects.filter(
+            recipe__in=shopping_cart.values('recipe_id'),
+            recipe__is_deleted=False
+        ).values('ingredient__name',
+                 'ingredient__measurement_unit').annotate(amount=Sum('amount'))
         filename = 'foodgram_shopping_list.txt'
-        response = HttpResponse(final_list[:-1], content_type='text/plain')
+        response = StreamingHttpResponse(
+            self.shopping_list_lines(ingredients.iterator()),
+            content_type='text/plain'
+        )
         response['Content-Disposition'] = 'attachment; filename={0}'.format(
             filename
         )
         return response
+
+
+class BootstrapView(APIView):
+    """Everything the first page render needs in one request: the current
+    user with cart and favorites counts, the cached tags and the first
+    page of /api/recipes/ with the same filters."""
+
+    permission_classes = [AllowAny]
+    filterset_class = CustomFilterForRecipes
+
+    def get(self, request):
+        user = request.user
+        context = {'request': request, 'view': self}
+        data = {
+            'user': None,
+            'shopping_cart_count': 0,
+            'favorites_count': 0,
+            'tags': get_tags(),
+        }
+        if user.is_authenticated:
+            # The profile and both counters come from a single query.
+            me = User.objects.filter(pk=user.pk).annotate(
+                **CustomUserSerializer.get_annotations(ALL, user),
+                **{
+                    f'{name}_count': count_related(
+                        model.objects.filter(recipe__is_deleted=False),
+                        'user',
+                        OuterRef('pk')
+                    )
+                    for name, model in (
+                        ('shopping_cart', ShoppingCart),
+                        ('favorites', FavoriteRecipe),
+                    )
+                }
+            ).get()
+            data['user'] = CustomUserSerializer(me, context=context).data
+            data['shopping_cart_count'] = me.shopping_cart_count
+            data['favorites_count'] = me.favorites_count
+
+        recipes = DjangoFilterBackend().filter_queryset(
+            request, Recipe.objects.all(), self
+        )
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(
+            GetRecipeSerializer.optimize_queryset(recipes, ALL, user),
+            request,
+            view=self
+        )
+        next_link = paginator.get_next_link()
+        if next_link is not None:
+            next_link = next_link.replace(
+                request.path, reverse('api:recipes-list'), 1
+            )
+        data['recipes'] = {
+            'count': paginator.page.paginator.count,
+            'next': next_link,
+            'previous': None,
+            'results': GetRecipeSerializer(
+                page, many=True, context=context
+            ).data,
+        }
+        return Response(data)
@@ -0,0 +1,122 @@
+import logging
+
+from django.conf import settings
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BROTLI_QUALITY = 5
+GZIP_MAX_RANDOM_BYTES = 100
+
+# Encodings in order of preference with the file suffix used for
+# precompressed artifacts.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Brotli has no counterpart to the random gzip header padding Django uses
+# against BREACH, so dynamic responses are brotli-compressed only when
+# they are API JSON; pages that can mix secrets with reflected input fall
+# back to gzip.
+BROTLI_CONTENT_TYPES = ('application/json',)
+
+
+def available_encodings():
+    return [
+        encoding for encoding, _ in ENCODINGS
+        if encoding != 'br' or brotli is not None
+    ]
+
+
+def parse_accept_encoding(header):
+    """Quality by coding from an Accept-Encoding header; a malformed q
+    counts as 0."""
+    accepted = {}
+    for part in header.split(','):
+        coding, *params = part.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(request, encodings=None):
+    """The accepted encoding with the highest q, by ENCODINGS order on a
+    tie. Encodings with q=0 are never chosen."""
+    accepted = parse_accept_encoding(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')
+    )
+    if encodings is None:
+        encodings = available_encodings()
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def media_type(content_type):
+    return content_type.split(';')[0].strip().lower()
+
+
+def response_encodings(content_type):
+    brotli_allowed = media_type(content_type) in BROTLI_CONTENT_TYPES
+    return [
+        encoding for encoding in available_encodings()
+        if encoding != 'br' or brotli_allowed
+    ]
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return compress_string(data, max_random_bytes=GZIP_MAX_RANDOM_BYTES)
+
+
+def compress_stream(chunks, encoding):
+    if encoding == 'gzip':
+        yield from compress_sequence(
+            chunks, max_random_bytes=GZIP_MAX_RANDOM_BYTES
+        )
+        return
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def is_compressible(content_type):
+    return media_type(content_type) in settings.COMPRESSION_CONTENT_TYPES
+
+
+def count_stream(chunks, counter):
+    for chunk in chunks:
+        counter[0] += len(chunk)
+        yield chunk
+
+
+def log_stream_saving(chunks, encoding, endpoint, original):
+    compressed = [0]
+    yield from count_stream(chunks, compressed)
+    log_saving(endpoint, encoding, original[0], compressed[0])
+
+
+def log_saving(endpoint, encoding, original, compressed):
+    logger.info(
+        '%s %s: %d -> %d bytes, %d saved',
+        endpoint, encoding, original, compressed, original - compressed
+    )
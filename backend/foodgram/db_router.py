@@ -0,0 +1,62 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_PREFIX = 'replica'
+
+_state = threading.local()
+
+
+def pin_to_primary(value=True):
+    _state.pinned = value
+
+
+def is_pinned_to_primary():
+    return getattr(_state, 'pinned', False)
+
+
+@contextmanager
+def use_primary():
+    """Reads in the block go to the primary. Background workers read
+    right before they write, so a lagging replica must not answer."""
+    previous = is_pinned_to_primary()
+    pin_to_primary()
+    try:
+        yield
+    finally:
+        pin_to_primary(previous)
+
+
+def get_replicas():
+    return [
+        alias for alias in settings.DATABASES
+        if alias.startswith(REPLICA_PREFIX)
+    ]
+
+
+class PrimaryReplicaRouter:
+    """Sends reads to a random replica and everything else to the
+    primary. Reads stay on the primary while the current request is
+    pinned to it or inside a transaction."""
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if (
+            not replicas
+            or is_pinned_to_primary()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
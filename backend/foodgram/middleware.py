@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+from .compression import (choose_encoding, compress, compress_stream,
+                          count_stream, is_compressible, log_saving,
+                          log_stream_saving, response_encodings)
+from .db_router import get_replicas, pin_to_primary
+from .nplusone import detect_repeated_queries
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RepeatedQueriesMiddleware:
+    """Reports N+1 queries per request, see detect_repeated_queries.
+    Only loaded when NPLUSONE_DETECT is set (DEBUG and tests)."""
+
+    def __init__(self, get_response):
+        if not settings.NPLUSONE_DETECT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with detect_repeated_queries(f'{request.method} {request.path}'):
+            return self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """Pins writes to the primary database and keeps a client on the
+    primary for DB_REPLICA_PIN_SECONDS after a successful write, so it
+    reads its own changes despite replication lag."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not get_replicas():
+            return self.get_response(request)
+
+        is_write = request.method not in SAFE_METHODS
+        pin_to_primary(
+            is_write or settings.REPLICA_PIN_COOKIE in request.COOKIES
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            pin_to_primary(False)
+
+        if is_write and response.status_code < 400:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
+
+
+class CompressionMiddleware:
+    """Compresses responses with brotli or gzip depending on
+    Accept-Encoding, COMPRESSION_CONTENT_TYPES and COMPRESSION_MIN_LENGTH;
+    brotli is used for BROTLI_CONTENT_TYPES only, everything else gets gzip
+    with random header padding against BREACH.
+    Streaming responses are compressed chunk by chunk. Bytes saved are
+    logged per endpoint to the foodgram.compression logger."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.has_header('Content-Encoding')
+            or not is_compressible(response.get('Content-Type', ''))
+        ):
+            return response
+        if (
+            not response.streaming
+            and len(response.content) < settings.COMPRESSION_MIN_LENGTH
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(
+            request, response_encodings(response.get('Content-Type', ''))
+        )
+        if encoding is None:
+            return response
+        endpoint = getattr(request.resolver_match, 'view_name', request.path)
+
+        if response.streaming:
+            original = [0]
+            response.streaming_content = log_stream_saving(
+                compress_stream(
+                    count_stream(response.streaming_content, original),
+                    encoding
+                ),
+                encoding,
+                endpoint,
+                original
+            )
+            del response.headers['Content-Length']
+        else:
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            log_saving(
+                endpoint, encoding, len(response.content), len(compressed)
+            )
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,121 @@
+import logging
+import re
+import threading
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LITERALS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\bIN \([^()]*\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'\s+'), ' '),
+)
+# Transaction control repeats by nature.
+IGNORED = re.compile(
+    r'^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE
+)
+STACK_DEPTH = 8
+
+_local = threading.local()
+
+
+class RepeatedQueriesError(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """Query shape: literals and IN lists of any length look the same."""
+    for pattern, replacement in LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def caller_stack():
+    """Frames of the project code that issued the current query."""
+    frames = [
+        frame for frame in traceback.extract_stack()[:-1]
+        if frame.filename.startswith(str(settings.BASE_DIR))
+        and frame.filename != __file__
+    ]
+    return traceback.format_list(frames[-STACK_DEPTH:])
+
+
+class QueryCollector:
+    """Database execute wrapper counting queries by shape. The stack is
+    only captured when a shape reaches the threshold."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = Counter()
+        self.stacks = {}
+        self.paused = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.paused and not IGNORED.match(sql):
+            shape = fingerprint(sql)
+            self.counts[shape] += 1
+            if self.counts[shape] == self.threshold:
+                self.stacks[shape] = caller_stack()
+        return execute(sql, params, many, context)
+
+    def repeated(self):
+        allowlist = [
+            re.compile(pattern) for pattern in settings.NPLUSONE_ALLOWLIST
+        ]
+        for shape, stack in self.stacks.items():
+            text = shape + '\n' + ''.join(stack)
+            if not any(pattern.search(text) for pattern in allowlist):
+                yield shape, self.counts[shape], stack
+
+
+def report(repeated, label):
+    return '\n\n'.join(
+        f'{label}: {count} queries of the same shape\n    {shape}\n'
+        + ''.join(stack)
+        for shape, count, stack in repeated
+    )
+
+
+@contextmanager
+def detect_repeated_queries(label='', threshold=None, fail=None):
+    """Flags query shapes run at least NPLUSONE_THRESHOLD times inside
+    the block: raises RepeatedQueriesError when fail (NPLUSONE_RAISE by
+    default) is set, logs a warning otherwise. Patterns from
+    NPLUSONE_ALLOWLIST matched against the SQL and the stack, and code
+    wrapped in allow_repeated_queries(), are not reported."""
+    collector = QueryCollector(threshold or settings.NPLUSONE_THRESHOLD)
+    collectors = _local.__dict__.setdefault('collectors', [])
+    collectors.append(collector)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            yield collector
+    finally:
+        collectors.remove(collector)
+    repeated = list(collector.repeated())
+    if not repeated:
+        return
+    message = report(repeated, label)
+    if settings.NPLUSONE_RAISE if fail is None else fail:
+        raise RepeatedQueriesError(message)
+    logger.warning(message)
+
+
+@contextmanager
+def allow_repeated_queries():
+    """For loops that are meant to run one query per item."""
+    collectors = getattr(_local, 'collectors', [])
+    for collector in collectors:
+        collector.paused += 1
+    try:
+        yield
+    finally:
+        for collector in collectors:
+            collector.paused -= 1
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -52,13 +53,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "foodgram.middleware.RepeatedQueriesMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "foodgram.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "foodgram.middleware.ReplicaRoutingMiddleware",
 ]
 
 ROOT_URLCONF = "foodgram.urls"
@@ -96,6 +100,53 @@ DATABASES = {
     }
 }
 
+# N+1 detection: a request that runs the same query shape
+# NPLUSONE_THRESHOLD times is logged in development and fails under
+# "manage.py test". NPLUSONE_ALLOWLIST holds regular expressions matched
+# against the query and the stack that ran it.
+TESTING = sys.argv[1:2] == ['test']
+NPLUSONE_DETECT = TESTING or os.getenv(
+    'NPLUSONE_DETECT', str(DEBUG)
+).lower() in ('1', 'true', 'yes')
+NPLUSONE_RAISE = TESTING
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', 5))
+NPLUSONE_ALLOWLIST = []
+
+# Read replicas: space separated hosts (database file paths for SQLite).
+# Tests mirror them to the default database and always have one, so the
+# routing is exercised.
+DB_REPLICAS = os.getenv('DB_REPLICAS', '').split()
+if TESTING and not DB_REPLICAS:
+    DB_REPLICAS = [DATABASES['default']['HOST']]
+for number, replica in enumerate(DB_REPLICAS, 1):
+    location = (
+        {'NAME': replica}
+        if DATABASES['default']['ENGINE'].endswith('sqlite3')
+        else {'HOST': replica}
+    )
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        **location,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['foodgram.db_router.PrimaryReplicaRouter']
+
+# How long a client keeps reading from the primary after a write.
+REPLICA_PIN_COOKIE = 'use_primary_db'
+REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 5))
+
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -140,6 +191,132 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+STORAGES = {
+    "default": {
+        "BACKEND": "foodgram.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "foodgram.storage.CompressedStaticFilesStorage",
+    },
+}
+
+# Response compression
+COMPRESSION_MIN_LENGTH = int(os.getenv('COMPRESSION_MIN_LENGTH', 1024))
+COMPRESSION_CONTENT_TYPES = (
+    'application/json',
+    'application/javascript',
+    'text/plain',
+    'text/html',
+    'text/css',
+    'image/svg+xml',
+)
+STATIC_COMPRESSED_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.html',
+                                '.txt', '.map')
+
+# Number of precomputed neighbors served by /api/recipes/{id}/similar/.
+# Saved recipes are queued and recomputed by process_similar_recipes once
+# they have not been saved again for SIMILAR_RECIPES_DELAY seconds.
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', 10))
+SIMILAR_RECIPES_DELAY = int(os.getenv('SIMILAR_RECIPES_DELAY', 5))
+
+# Favorites and cart additions lose half their weight in the popular
+# ordering every POPULARITY_HALF_LIFE_DAYS.
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv('POPULARITY_HALF_LIFE_DAYS', 7))
+
+# Followed-authors feed: recipes are pushed to followers' timelines
+# unless the author has more followers than TIMELINE_FANOUT_LIMIT; such
+# authors are pulled at read time until they fall below
+# TIMELINE_FANOUT_LIMIT - TIMELINE_FANOUT_WINDOW.
+TIMELINE_FANOUT_LIMIT = int(os.getenv('TIMELINE_FANOUT_LIMIT', 5000))
+TIMELINE_FANOUT_WINDOW = int(os.getenv('TIMELINE_FANOUT_WINDOW', 500))
+TIMELINE_BACKFILL = int(os.getenv('TIMELINE_BACKFILL', 50))
+
+# Most recipes /api/recipes/batch/?ids= returns at once.
+RECIPE_BATCH_MAX_IDS = int(os.getenv('RECIPE_BATCH_MAX_IDS', 100))
+
+# "What can I cook" search over the in-process ingredient index.
+PANTRY_INDEX_TTL = int(os.getenv('PANTRY_INDEX_TTL', 600))
+PANTRY_INDEX_OVERLAP = 60
+PANTRY_MAX_INGREDIENTS = 100
+PANTRY_MAX_RESULTS = 1000
+
+# The full ingredient catalog is cached pre-rendered and pre-compressed.
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+# Serialized recipe list and detail pages of anonymous users, cached under
+# their ETag.
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+# /api/ingredients/sync/: clients more than INGREDIENT_SYNC_MAX_CHANGES
+# ingredients behind get the full snapshot. Changes of the last
+# INGREDIENT_SYNC_OVERLAP seconds are sent again on the next sync.
+INGREDIENT_SYNC_MAX_CHANGES = int(
+    os.getenv('INGREDIENT_SYNC_MAX_CHANGES', 500)
+)
+INGREDIENT_SYNC_OVERLAP = 60
+
+# Anonymous GET /api/recipes/<id>/ is served by nginx from JSON snapshots
+# (with .gz and .br variants) in RECIPE_SNAPSHOT_DIR, written when a
+# recipe is saved; publishing is off while it is empty. Image URLs are
+# made absolute with RECIPE_SNAPSHOT_ORIGIN, the public site address
+# (e.g. https://foodgram.example), which is required with the directory.
+# nginx limits these pages itself (limit_req in infra/nginx.conf): they
+# never reach the DRF throttles.
+RECIPE_SNAPSHOT_DIR = os.getenv('RECIPE_SNAPSHOT_DIR', '')
+RECIPE_SNAPSHOT_ORIGIN = os.getenv('RECIPE_SNAPSHOT_ORIGIN', '')
+
+# Cache warming: warm_caches, and gunicorn at start with WARMUP_ON_START,
+# requests WARMUP_URLS, the WARMUP_TOP_URLS most frequent GET /api/ URLs
+# of the WARMUP_ACCESS_LOG nginx log and the WARMUP_POPULAR_RECIPES most
+# popular recipes, WARMUP_CONCURRENCY at a time for WARMUP_BUDGET seconds.
+# The replay fills the response cache of the anonymous recipe pages.
+# warm_caches runs in its own process and needs a shared CACHE_BACKEND.
+WARMUP_URLS = [
+    '/api/tags/',
+    '/api/ingredients/',
+    '/api/bootstrap/',
+    '/api/recipes/',
+    '/api/recipes/?ordering=popular',
+]
+WARMUP_ACCESS_LOG = os.getenv('WARMUP_ACCESS_LOG', '')
+WARMUP_TOP_URLS = int(os.getenv('WARMUP_TOP_URLS', 50))
+WARMUP_POPULAR_RECIPES = int(os.getenv('WARMUP_POPULAR_RECIPES', 20))
+WARMUP_CONCURRENCY = int(os.getenv('WARMUP_CONCURRENCY', 4))
+WARMUP_BUDGET = float(os.getenv('WARMUP_BUDGET', 30))
+WARMUP_ON_START = os.getenv(
+    'WARMUP_ON_START', 'false'
+).lower() in ('1', 'true', 'yes')
+
+# Recipe images: limits checked from the image header, and how long a
+# token from /api/recipes/images/ stays valid. Larger multipart uploads
+# are streamed to a temporary file instead of memory.
+IMAGE_MAX_SIZE = int(os.getenv('IMAGE_MAX_SIZE', 10 * 2 ** 20))
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', 6000))
+IMAGE_UPLOAD_TTL = int(os.getenv('IMAGE_UPLOAD_TTL', 24 * 3600))
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2 ** 20
+
+# Media files are named by content hash and shared between recipes.
+# collect_media removes files without references that are older than
+# MEDIA_GC_GRACE seconds, so uploads not yet committed are kept.
+MEDIA_GC_GRACE = int(os.getenv('MEDIA_GC_GRACE', 3600))
+# A file released by its last reference is kept if it was saved again in
+# the last MEDIA_REMOVE_GRACE seconds; collect_media removes it later.
+MEDIA_REMOVE_GRACE = int(os.getenv('MEDIA_REMOVE_GRACE', 60))
+
+# Recipes and users with more dependent rows than DELETION_SYNC_LIMIT
+# are hidden at once and removed by the process_deletions worker in
+# batches of DELETION_BATCH_SIZE rows. A running job without progress
+# for DELETION_JOB_TIMEOUT seconds is picked up by another worker.
+DELETION_SYNC_LIMIT = int(os.getenv('DELETION_SYNC_LIMIT', 1000))
+DELETION_BATCH_SIZE = int(os.getenv('DELETION_BATCH_SIZE', 500))
+DELETION_JOB_TIMEOUT = int(os.getenv('DELETION_JOB_TIMEOUT', 600))
+
+# Staff can profile a request with the X-Profile header or ?profile=
+# (see api.profiling); profiles are written to PROFILE_DIR unless it is
+# empty.
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.001))
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.TokenAuthentication",
@@ -150,10 +327,44 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_PAGINATION_CLASS": "api.paginations.PageNumberPagination",
     "PAGE_SIZE": 6,
+    # nginx appends the client address to X-Forwarded-For; anonymous
+    # clients are throttled by that entry, not by what they send.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 1)),
+    "DEFAULT_THROTTLE_CLASSES": [
+        "api.throttling.TokenBucketThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": os.getenv("THROTTLE_ANON_RATE", "120/min"),
+        "user": os.getenv("THROTTLE_USER_RATE", "300/min"),
+        "recipes-download-shopping-cart": "10/min",
+        "users-list": os.getenv("THROTTLE_USERS_LIST_RATE", "30/min"),
+    },
 }
 
+# Token bucket throttling: requests to these URL names take more than one
+# token. THROTTLE_STORE is "local" (per worker) or "cache" (shared through
+# the THROTTLE_CACHE_ALIAS cache).
+THROTTLE_COSTS = {
+    "recipes-download-shopping-cart": 10,
+    "recipes-pantry": 5,
+    "recipes-batch": 5,
+    "bootstrap": 3,
+    "recipes-images": 5,
+    "ingredients-list": 2,
+    "ingredients-sync": 2,
+}
+THROTTLE_STORE = os.getenv("THROTTLE_STORE", "local")
+THROTTLE_CACHE_ALIAS = "default"
+
+# The user list stays open to anonymous clients as the API specification
+# requires; crawling is bounded by the "users-list" rate above and the 50
+# users of a DirectoryPagination page.
 DJOSER = {
     "LOGIN_FIELD": "email",
     "SERIALIZERS": {
@@ -170,3 +381,27 @@ DJOSER = {
 }
 
 CSRF_TRUSTED_ORIGINS = os.getenv('CSRF_TRUSTED_ORIGINS', '').split()
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram': {
+            'handlers': ['console'],
+            'level': os.getenv('FOODGRAM_LOG_LEVEL', 'WARNING'),
+        },
+        'recipes': {
+            'handlers': ['console'],
+            'level': os.getenv('FOODGRAM_LOG_LEVEL', 'WARNING'),
+        },
+        'api': {
+            'handlers': ['console'],
+            'level': os.getenv('FOODGRAM_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import StaticFilesStorage
+from django.core.files.storage import FileSystemStorage
+
+from .compression import ENCODINGS, available_encodings, compress
+
+
+class CompressedStaticFilesStorage(StaticFilesStorage):
+    """Writes .gz and .br siblings of compressible static files during
+    collectstatic, for nginx gzip_static to serve without compressing
+    on every request."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        encodings = available_encodings()
+        for name in paths:
+            extension = os.path.splitext(name)[1].lower()
+            if extension not in settings.STATIC_COMPRESSED_EXTENSIONS:
+                continue
+            with self.open(name) as source:
+                data = source.read()
+            if len(data) < settings.COMPRESSION_MIN_LENGTH:
+                continue
+            for encoding, suffix in ENCODINGS:
+                if encoding not in encodings:
+                    continue
+                compressed = compress(data, encoding)
+                if len(compressed) < len(data):
+                    with open(self.path(name + suffix), 'wb') as target:
+                        target.write(compressed)
+            yield name, name, True
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Names files by the SHA-256 of their content, sharded as
+    <upload_to>/ab/cd/abcd...<ext>. A file with the same content is
+    written only once; reference counts and removal are handled by
+    recipes.media."""
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, basename = os.path.split(name)
+        name = os.path.join(
+            directory,
+            digest[:2],
+            digest[2:4],
+            digest + os.path.splitext(basename)[1].lower()
+        )
+        path = self.path(name)
+        try:
+            # A fresh mtime keeps the file out of the garbage collector's
+            # grace period until the new reference is committed. A file
+            # being removed is moved away first and then written again.
+            os.utime(path)
+            return name
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name and renamed, so concurrent saves
+        # of the same content never expose a partial file.
+        temporary = tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path), prefix='.', delete=False
+        )
+        try:
+            with temporary:
+                for chunk in content.chunks():
+                    temporary.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary.name, self.file_permissions_mode)
+            os.replace(temporary.name, path)
+        except BaseException:
+            if os.path.exists(temporary.name):
+                os.remove(temporary.name)
+            raise
+        return name
@@ -0,0 +1,152 @@
+import logging
+import queue
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.urls import get_resolver, reverse
+
+logger = logging.getLogger(__name__)
+
+# A successful GET of the API in the nginx "combined" log format.
+LOG_REQUEST = re.compile(r'"GET (?P<url>/api/\S*) HTTP/[\d.]+" 200 ')
+
+# WSGI environ key marking the requests replayed here; throttling skips
+# them. Clients cannot set it, unlike a header.
+WARMUP_ENVIRON = 'foodgram.warmup'
+
+# Cache backends that keep their data in the process that wrote it.
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_cache_shared(alias='default'):
+    backend = caches[alias]
+    return (
+        f'{type(backend).__module__}.{type(backend).__name__}'
+        not in PROCESS_CACHES
+    )
+
+
+def warm_references(process=True):
+    """Reference data every request may need, in the shared cache and,
+    with process, in the memory of the current process."""
+    from api.catalog import (get_catalog, get_revision, get_snapshot,
+                             get_tags)
+    from recipes.pantry import index
+
+    get_tags()
+    get_catalog()
+    get_snapshot(get_revision())
+    if process:
+        get_resolver().url_patterns
+        index.refresh()
+
+
+def access_log_urls(path, limit):
+    """The limit most frequent successful GET /api/ URLs of a log."""
+    counts = Counter()
+    with open(path, errors='replace') as log:
+        for line in log:
+            match = LOG_REQUEST.search(line)
+            if match:
+                counts[match['url']] += 1
+    return [url for url, _ in counts.most_common(limit)]
+
+
+def popular_recipe_urls(limit):
+    from recipes.models import Recipe
+
+    recipes = Recipe.objects.order_by('-popularity', '-created')
+    return [
+        reverse('api:recipes-detail', args=[pk])
+        for pk in recipes.values_list('pk', flat=True)[:limit]
+    ]
+
+
+def warmup_urls(access_log='', top=None, popular=None):
+    """WARMUP_URLS, then the most requested URLs of the access log, then
+    the pages of the most popular recipes, without repeats."""
+    urls = list(settings.WARMUP_URLS)
+    if access_log:
+        urls += access_log_urls(
+            access_log, settings.WARMUP_TOP_URLS if top is None else top
+        )
+    urls += popular_recipe_urls(
+        settings.WARMUP_POPULAR_RECIPES if popular is None else popular
+    )
+    return list(dict.fromkeys(urls))
+
+
+def client_host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def replay(urls, concurrency, budget):
+    """Requests the urls anonymously through the test client from
+    concurrency threads, without throttling. URLs not started within
+    budget seconds are skipped. Returns (url, status, seconds) of the
+    requests made."""
+    from django.test import Client
+
+    deadline = time.monotonic() + budget
+    pending = queue.SimpleQueue()
+    for url in urls:
+        pending.put(url)
+    results = []
+
+    def work():
+        client = Client(
+            HTTP_HOST=client_host(), raise_request_exception=False,
+            **{WARMUP_ENVIRON: True}
+        )
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    url = pending.get_nowait()
+                except queue.Empty:
+                    return
+                started = time.monotonic()
+                status = client.get(url).status_code
+                results.append((url, status, time.monotonic() - started))
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=work, daemon=True)
+        for _ in range(max(1, min(concurrency, len(urls))))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def warm():
+    """Loads what the first requests of every worker would otherwise pay
+    for. Run in the gunicorn master with preload_app, the results are
+    shared with the workers through copy-on-write. With WARMUP_ON_START
+    the warmup URLs are replayed too, delaying the workers by up to
+    WARMUP_BUDGET seconds."""
+    try:
+        warm_references()
+        if settings.WARMUP_ON_START:
+            replay(
+                warmup_urls(settings.WARMUP_ACCESS_LOG),
+                settings.WARMUP_CONCURRENCY,
+                settings.WARMUP_BUDGET
+            )
+    except Exception:
+        logger.exception('Cache warmup failed')
+    finally:
+        connections.close_all()
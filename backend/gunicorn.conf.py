@@ -0,0 +1,27 @@
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(
+    os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1)
+)
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# Import Django, DRF and the apps once in the master; workers share the
+# loaded code and warmed caches copy-on-write.
+preload_app = True
+
+
+def when_ready(server):
+    from django.db import connections
+
+    from foodgram.warmup import warm
+
+    warm()
+    # Runs in the master before any worker is forked. Workers must not
+    # inherit the sockets opened by the warmup: closing a shared one in
+    # a worker would also end it for the master and the other workers.
+    connections.close_all()
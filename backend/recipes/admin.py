@@ -1,11 +1,29 @@
 from django.contrib import admin
 
-from .models import FavoriteRecipe, Ingredient, Recipe, ShoppingCart, Tag
+from .admin_utils import EstimatedCountPaginator, InputFilter
+from .models import (DeletionJob, FavoriteRecipe, Ingredient, Recipe,
+                     ShoppingCart, Tag)
+
+
+class AuthorEmailFilter(InputFilter):
+    title = 'email автора'
+    parameter_name = 'author_email'
+    lookup = 'author__email__istartswith'
+
+
+class NameFilter(InputFilter):
+    title = 'названию'
+    parameter_name = 'name'
+    lookup = 'name__istartswith'
 
 
 class RecipeIngredientsInLine(admin.TabularInline):
     model = Recipe.ingredients.through
     extra = 1
+    raw_id_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
 
 
 @admin.register(Recipe)
@@ -17,21 +35,25 @@ class RecipeAdmin(admin.ModelAdmin):
         'text',
         'cooking_time',
         'get_tags',
-        'get_favorite_count'
+        'favorites_count'
     )
     inlines = (RecipeIngredientsInLine,)
-    list_filter = ('author__email', 'tags', 'name')
+    list_filter = (AuthorEmailFilter, 'tags', NameFilter)
     search_fields = ('author__email', 'name',)
+    autocomplete_fields = ('author',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author'
+        ).prefetch_related('tags')
 
     @admin.display(description='Тэги')
     def get_tags(self, obj):
         list_ = [tag.name for tag in obj.tags.all()]
         return ', '.join(list_)
 
-    @admin.display(description='В избранном')
-    def get_favorite_count(self, obj):
-        return FavoriteRecipe.objects.filter(recipe=obj).count()
-
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -51,6 +73,8 @@ class IngredientAdmin(admin.ModelAdmin):
         'measurement_unit'
     )
     search_fields = ('name',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(FavoriteRecipe)
@@ -60,6 +84,10 @@ class FavoriteRecipeAdmin(admin.ModelAdmin):
         'user',
         'recipe'
     )
+    list_select_related = ('user', 'recipe')
+    raw_id_fields = ('user', 'recipe')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(ShoppingCart)
@@ -69,3 +97,30 @@ class ShoppingCartAdmin(admin.ModelAdmin):
         'user',
         'recipe'
     )
+    list_select_related = ('user', 'recipe')
+    raw_id_fields = ('user', 'recipe')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'kind',
+        'object_id',
+        'status',
+        'deleted_rows',
+        'created',
+        'heartbeat',
+        'finished'
+    )
+    list_filter = ('status', 'kind')
+    readonly_fields = (
+        'kind',
+        'object_id',
+        'deleted_rows',
+        'error',
+        'heartbeat',
+        'finished'
+    )
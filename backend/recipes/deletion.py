@@ -0,0 +1,189 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from users.models import Follow
+from . import similarity
+from .models import (DeletionJob, FavoriteRecipe, Recipe, ShoppingCart,
+                     SimilarRecipe, TimelineEntry)
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def recipe_dependents(recipe_id):
+    return (
+        FavoriteRecipe.objects.filter(recipe_id=recipe_id),
+        ShoppingCart.objects.filter(recipe_id=recipe_id),
+        TimelineEntry.objects.filter(recipe_id=recipe_id),
+        SimilarRecipe.objects.filter(recipe_id=recipe_id),
+        SimilarRecipe.objects.filter(similar_id=recipe_id),
+    )
+
+
+def user_dependents(user_id):
+    return (
+        TimelineEntry.objects.filter(user_id=user_id),
+        FavoriteRecipe.objects.filter(user_id=user_id),
+        ShoppingCart.objects.filter(user_id=user_id),
+        Follow.objects.filter(user_id=user_id),
+        Follow.objects.filter(author_id=user_id),
+        Follow.objects.filter(following_id=user_id),
+    )
+
+
+def authored_dependents(user_id):
+    return (
+        Recipe.all_objects.filter(author_id=user_id),
+        FavoriteRecipe.objects.filter(recipe__author_id=user_id),
+        ShoppingCart.objects.filter(recipe__author_id=user_id),
+        TimelineEntry.objects.filter(recipe__author_id=user_id),
+        SimilarRecipe.objects.filter(recipe__author_id=user_id),
+    )
+
+
+def exceeds(querysets, limit):
+    """Counts at most limit + 1 rows in total."""
+    total = 0
+    for queryset in querysets:
+        total += queryset[:limit + 1 - total].count()
+        if total > limit:
+            return True
+    return False
+
+
+def delete_recipe(recipe):
+    """Deletes a recipe at once or hides it and queues a job when it has
+    too many dependent rows for one request."""
+    if not exceeds(
+        recipe_dependents(recipe.pk), settings.DELETION_SYNC_LIMIT
+    ):
+        recipe.delete()
+        return
+    with transaction.atomic():
+        Recipe.all_objects.filter(pk=recipe.pk).update(
+            is_deleted=True, updated=timezone.now()
+        )
+        similarity.forget([recipe.pk])
+        DeletionJob.objects.create(
+            kind=DeletionJob.RECIPE, object_id=recipe.pk
+        )
+
+
+def delete_user(user):
+    """Same as delete_recipe for a user: the account is deactivated and
+    all of their recipes are hidden until the job removes them."""
+    recipes = Recipe.all_objects.filter(author_id=user.pk)
+    if not exceeds(
+        (*user_dependents(user.pk), *authored_dependents(user.pk)),
+        settings.DELETION_SYNC_LIMIT
+    ):
+        user.delete()
+        return
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        recipes.update(is_deleted=True, updated=timezone.now())
+        similarity.forget(recipes.values_list('pk', flat=True))
+        DeletionJob.objects.create(kind=DeletionJob.USER, object_id=user.pk)
+
+
+def claim_job():
+    stale = timezone.now() - timedelta(
+        seconds=settings.DELETION_JOB_TIMEOUT
+    )
+    with transaction.atomic():
+        job = DeletionJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=DeletionJob.PENDING)
+            | Q(status=DeletionJob.RUNNING, heartbeat__lt=stale)
+        ).first()
+        if job is not None:
+            job.status = DeletionJob.RUNNING
+            job.heartbeat = timezone.now()
+            job.save(update_fields=['status', 'heartbeat'])
+    return job
+
+
+class JobRunner:
+    """Removes the object of a job in short transactions of at most
+    batch_size rows, saving the progress after each of them. All steps
+    are idempotent, so a job interrupted midway can be run again."""
+
+    def __init__(self, job, batch_size=None):
+        self.job = job
+        self.batch_size = batch_size or settings.DELETION_BATCH_SIZE
+
+    def run(self):
+        try:
+            if self.job.kind == DeletionJob.USER:
+                self.delete_user(self.job.object_id)
+            else:
+                self.delete_recipe(self.job.object_id)
+        except Exception as error:
+            logger.exception('Deletion job %s failed', self.job.pk)
+            self.finish(DeletionJob.FAILED, repr(error))
+        else:
+            self.finish(DeletionJob.DONE)
+
+    def delete_recipe(self, recipe_id):
+        for queryset in recipe_dependents(recipe_id):
+            self.delete_in_batches(queryset)
+        recipe = Recipe.all_objects.only('image').filter(pk=recipe_id).first()
+        if recipe is None:
+            return
+        # The remaining ingredient and tag rows are bounded by the
+        # recipe form, so the usual cascade is cheap here. The image is
+        # released by the post_delete signal.
+        with transaction.atomic():
+            deleted, _ = recipe.delete()
+        self.progress(deleted)
+
+    def delete_user(self, user_id):
+        recipes = Recipe.all_objects.filter(author_id=user_id).values_list(
+            'id', flat=True
+        )
+        while True:
+            with transaction.atomic():
+                recipe_ids = list(recipes[:self.batch_size])
+            if not recipe_ids:
+                break
+            for recipe_id in recipe_ids:
+                self.delete_recipe(recipe_id)
+        for queryset in user_dependents(user_id):
+            self.delete_in_batches(queryset)
+        with transaction.atomic():
+            deleted, _ = User.objects.filter(pk=user_id).delete()
+        self.progress(deleted)
+
+    def delete_in_batches(self, queryset):
+        model = queryset.model
+        while True:
+            with transaction.atomic():
+                pks = list(
+                    queryset.values_list('pk', flat=True)[:self.batch_size]
+                )
+                if not pks:
+                    return
+                deleted, _ = model.objects.filter(pk__in=pks).delete()
+            self.progress(deleted)
+
+    def progress(self, deleted):
+        self.job.deleted_rows += deleted
+        self.job.heartbeat = timezone.now()
+        self.job.save(update_fields=['deleted_rows', 'heartbeat'])
+        logger.info(
+            'Deletion job %s (%s %s): %d rows deleted',
+            self.job.pk, self.job.kind, self.job.object_id,
+            self.job.deleted_rows
+        )
+
+    def finish(self, status, error=''):
+        self.job.status = status
+        self.job.error = error
+        self.job.finished = timezone.now()
+        self.job.save(update_fields=['status', 'error', 'finished'])
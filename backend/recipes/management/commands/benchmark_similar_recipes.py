@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import similar_rows
+
+
+class Command(BaseCommand):
+    help = ('Замеряет полный пересчёт похожих рецептов на синтетических '
+            'данных без обращения к базе: по умолчанию 100 000 рецептов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--per-recipe', type=int, default=8,
+            help='Ингредиентов в рецепте.'
+        )
+        parser.add_argument('--tags', type=int, default=3)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--count', type=int, default=None)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def pairs(self, options):
+        """Ingredients are drawn by a Zipf-like law: a few, like salt, are
+        in most recipes and most are rare, as in real data."""
+        rng = np.random.default_rng(options['seed'])
+        recipe_ids = np.arange(1, options['recipes'] + 1, dtype=np.int64)
+        popularity = 1 / np.arange(1, options['ingredients'] + 1)
+        ingredients = rng.choice(
+            options['ingredients'],
+            size=(len(recipe_ids), options['per_recipe']),
+            p=popularity / popularity.sum()
+        ) + 1
+        tags = rng.integers(1, options['tags'] + 1, size=len(recipe_ids))
+        ingredient_pairs = list(zip(
+            np.repeat(recipe_ids, options['per_recipe']).tolist(),
+            ingredients.ravel().tolist()
+        ))
+        tag_pairs = list(zip(recipe_ids.tolist(), tags.tolist()))
+        return recipe_ids, ingredient_pairs, tag_pairs
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipe_ids, ingredient_pairs, tag_pairs = self.pairs(options)
+        self.stdout.write(
+            f'Данные: {len(recipe_ids)} рецептов, {len(ingredient_pairs)} '
+            f'ингредиентов в рецептах за {time.monotonic() - started:.1f} с.'
+        )
+        started = time.monotonic()
+        rows = 0
+        for _, batch in similar_rows(
+            recipe_ids, ingredient_pairs, tag_pairs, options['batch_size'],
+            options['count'] or settings.SIMILAR_RECIPES_COUNT
+        ):
+            rows += len(batch)
+        self.stdout.write(
+            f'Пересчёт: {rows} пар похожих рецептов за '
+            f'{time.monotonic() - started:.1f} с.'
+        )
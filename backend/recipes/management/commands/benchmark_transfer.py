@@ -0,0 +1,115 @@
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.transfer import Importer, export_records
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Замеряет импорт и выгрузку на синтетических данных заданного '
+            'размера. Всё загруженное откатывается, если не указан --keep.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=50000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Подписок на пользователя.'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=10,
+            help='Рецептов в избранном и в списке покупок пользователя.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Не откатывать загруженные данные.'
+        )
+
+    def dataset(self, options):
+        """Export records by type, with names that cannot clash with the
+        rows already in the database."""
+        rng = random.Random(options['seed'])
+        prefix = uuid.uuid4().hex[:8]
+        now = timezone.now().isoformat()
+        users = range(1, options['users'] + 1)
+        recipes = range(1, options['recipes'] + 1)
+        ingredients = range(1, options['ingredients'] + 1)
+        tags = range(1, 4)
+        yield 'tag', [
+            {'type': 'tag', 'id': tag, 'name': f'{prefix}-{tag}',
+             'color': f'#{prefix[:5]}{tag}', 'slug': f'{prefix}-{tag}'}
+            for tag in tags
+        ]
+        yield 'ingredient', [
+            {'type': 'ingredient', 'id': ingredient,
+             'name': f'{prefix}-{ingredient}', 'measurement_unit': 'г'}
+            for ingredient in ingredients
+        ]
+        yield 'user', [
+            {'type': 'user', 'id': user, 'username': f'{prefix}-{user}',
+             'email': f'{prefix}-{user}@example.com', 'first_name': 'Имя',
+             'last_name': 'Фамилия', 'password': '!', 'is_active': True,
+             'is_staff': False, 'is_superuser': False, 'date_joined': now}
+            for user in users
+        ]
+        yield 'recipe', [
+            {'type': 'recipe', 'id': recipe,
+             'author_id': rng.choice(users), 'name': f'Рецепт {recipe}',
+             'image': '', 'text': 'Описание', 'cooking_time': 30,
+             'created': now, 'updated': now,
+             'ingredients': [
+                 [ingredient, 100]
+                 for ingredient in rng.sample(ingredients, 8)
+             ],
+             'tags': rng.sample(tags, 2)}
+            for recipe in recipes
+        ]
+        for kind in ('favorite', 'cart'):
+            yield kind, [
+                {'type': kind, 'user_id': user, 'recipe_id': recipe}
+                for user in users
+                for recipe in rng.sample(recipes, options['favorites'])
+            ]
+        yield 'follow', [
+            {'type': 'follow', 'user_id': user, 'author_id': author,
+             'following_id': author, 'created_at': now}
+            for user in users
+            for author in rng.sample(users, options['follows'])
+            if author != user
+        ]
+
+    def measure(self, options):
+        importer = Importer(options['batch_size'])
+        for kind, records in self.dataset(options):
+            started = time.monotonic()
+            importer.feed(records)
+            self.report(kind, len(records), time.monotonic() - started)
+        started = time.monotonic()
+        lines = sum(1 for _ in export_records())
+        self.report('выгрузка', lines, time.monotonic() - started)
+
+    def report(self, label, rows, seconds):
+        self.stdout.write(
+            f'{label}: {rows} записей за {seconds:.2f} с, '
+            f'{rows / max(seconds, 1e-9):.0f} в секунду'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.measure(options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write('Загруженные данные откачены.')
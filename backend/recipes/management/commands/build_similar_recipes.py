@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodgram.db_router import use_primary
+from recipes.similarity import rebuild_similar_recipes
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие рецепты для всех рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--count', type=int, default=None)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with use_primary():
+            total = rebuild_similar_recipes(
+                batch_size=options['batch_size'], count=options['count']
+            )
+        self.stdout.write(
+            f'Похожие рецепты пересчитаны для {total} рецептов '
+            f'за {time.monotonic() - started:.1f} с.'
+        )
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodgram.db_router import use_primary
+from recipes.models import RecipeImageUpload
+
+
+class Command(BaseCommand):
+    help = 'Удаляет загруженные картинки, не привязанные к рецептам вовремя.'
+
+    def handle(self, *args, **options):
+        expired = RecipeImageUpload.objects.filter(
+            created__lt=timezone.now() - timedelta(
+                seconds=settings.IMAGE_UPLOAD_TTL
+            )
+        )
+        count = 0
+        with use_primary():
+            # The files are released by the post_delete signal.
+            for upload in expired.iterator():
+                upload.delete()
+                count += 1
+        self.stdout.write(f'Удалено картинок: {count}.')
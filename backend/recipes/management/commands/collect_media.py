@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foodgram.db_router import use_primary
+from recipes.media import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Удаляет картинки, на которые не ссылаются рецепты и загрузки.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=settings.MEDIA_GC_GRACE,
+            help='Не трогать файлы, изменённые за это число секунд.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, какие файлы будут удалены.'
+        )
+
+    def handle(self, *args, **options):
+        with use_primary():
+            count = size = 0
+            for name, file_size in collect_garbage(
+                options['grace'], options['batch_size'], options['dry_run']
+            ):
+                if options['verbosity'] > 1:
+                    self.stdout.write(name)
+                count += 1
+                size += file_size
+            self.stdout.write(
+                f'{"Найдено" if options["dry_run"] else "Удалено"} файлов: '
+                f'{count}, {size / 2 ** 20:.1f} МБ.'
+            )
@@ -0,0 +1,42 @@
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.transfer import export_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает теги, ингредиенты, пользователей, рецепты, избранное, '
+        'списки покупок и подписки в формате JSON Lines.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл выгрузки, .gz сжимается; по умолчанию stdout.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path == '-':
+            target = sys.stdout.buffer
+        elif path.endswith('.gz'):
+            target = gzip.open(path, 'wb', compresslevel=6)
+        else:
+            target = open(path, 'wb')
+        started = time.monotonic()
+        lines = 0
+        try:
+            for line in export_records():
+                target.write(line)
+                lines += 1
+        finally:
+            if target is not sys.stdout.buffer:
+                target.close()
+        self.stderr.write(
+            f'Выгружено записей: {lines} '
+            f'за {time.monotonic() - started:.1f} с.'
+        )
@@ -0,0 +1,43 @@
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.transfer import Importer, loads
+
+
+class Command(BaseCommand):
+    help = 'Загружает выгрузку export_foodgram в текущую базу.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл выгрузки, .gz распаковывается; по умолчанию stdin.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        importer = Importer(options['batch_size'])
+        path = options['path']
+        if path == '-':
+            source = sys.stdin.buffer
+        elif path.endswith('.gz'):
+            source = gzip.open(path, 'rb')
+        else:
+            source = open(path, 'rb')
+        started = time.monotonic()
+        try:
+            counts = importer.feed(
+                loads(line) for line in source if line.strip()
+            )
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+        for kind, created in counts.items():
+            self.stdout.write(f'{kind}: {created}')
+        self.stdout.write(
+            f'Загрузка заняла {time.monotonic() - started:.1f} с. '
+            'Сигналы при пакетной загрузке не срабатывают: выполните '
+            'rebuild_popularity и build_similar_recipes.'
+        )
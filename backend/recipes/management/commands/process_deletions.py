@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodgram.db_router import use_primary
+from recipes.deletion import JobRunner, claim_job
+
+
+class Command(BaseCommand):
+    help = (
+        'Фоновое удаление рецептов и пользователей с большим числом '
+        'связанных записей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить задачи из очереди и завершиться.'
+        )
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--sleep', type=float, default=5,
+            help='Пауза между проверками пустой очереди, с.'
+        )
+
+    def handle(self, *args, **options):
+        with use_primary():
+            while True:
+                job = claim_job()
+                if job is None:
+                    if options['once']:
+                        return
+                    time.sleep(options['sleep'])
+                    continue
+                self.stdout.write(
+                    f'Удаление {job.get_kind_display().lower()} '
+                    f'{job.object_id} (задача {job.pk})...'
+                )
+                started = time.monotonic()
+                JobRunner(job, options['batch_size']).run()
+                seconds = time.monotonic() - started
+                self.stdout.write(
+                    f'{job.get_status_display()}: удалено строк '
+                    f'{job.deleted_rows} за {seconds:.1f} с.'
+                )
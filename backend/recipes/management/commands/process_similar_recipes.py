@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodgram.db_router import use_primary
+from recipes.similarity import claim_updates, process_updates
+
+
+class Command(BaseCommand):
+    help = (
+        'Фоновый пересчёт похожих рецептов для сохранённых рецептов и '
+        'для списков, из которых ушли скрытые или удалённые рецепты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать очередь и завершиться.'
+        )
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--sleep', type=float, default=2,
+            help='Пауза между проверками пустой очереди, с.'
+        )
+
+    def handle(self, *args, **options):
+        with use_primary():
+            while True:
+                recipe_ids = claim_updates(options['batch_size'])
+                if not recipe_ids:
+                    if options['once']:
+                        return
+                    time.sleep(options['sleep'])
+                    continue
+                started = time.monotonic()
+                updated = process_updates(recipe_ids)
+                self.stdout.write(
+                    f'Похожие рецепты пересчитаны для {updated} из '
+                    f'{len(recipe_ids)} рецептов за '
+                    f'{time.monotonic() - started:.1f} с.'
+                )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from foodgram.db_router import use_primary
+from recipes.popularity import rebuild_popularity
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает популярность рецептов и число добавлений '
+            'в избранное.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with use_primary():
+            rebuild_popularity(batch_size=options['batch_size'])
+        self.stdout.write('Популярность рецептов пересчитана.')
@@ -0,0 +1,128 @@
+import os
+import time
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import MediaFile, Recipe, RecipeImageUpload
+
+IMAGE_DIRECTORY = Recipe._meta.get_field('image').upload_to
+
+
+def retain(*names):
+    for name, count in Counter(filter(None, names)).items():
+        references = F('references') + count
+        # The row may be removed by remove_unreferenced() at any moment.
+        if not MediaFile.objects.filter(name=name).update(
+            references=references
+        ):
+            _, created = MediaFile.objects.get_or_create(
+                name=name, defaults={'references': count}
+            )
+            if not created:
+                MediaFile.objects.filter(name=name).update(
+                    references=references
+                )
+
+
+def release(*names):
+    for name, count in Counter(filter(None, names)).items():
+        MediaFile.objects.filter(name=name).update(
+            references=Greatest(F('references') - count, 0)
+        )
+        transaction.on_commit(lambda name=name: remove_unreferenced(name))
+
+
+def remove_unreferenced(name):
+    """Removes the file of a row without references. The row is locked,
+    so a retain() in flight either commits first or finds it gone. The
+    storage hands out an existing file before its new reference is even
+    written and only touches its mtime: the file is moved aside first,
+    so later saves write it again, and put back if it was touched in
+    the last MEDIA_REMOVE_GRACE seconds."""
+    with transaction.atomic():
+        media_file = MediaFile.objects.select_for_update().filter(
+            name=name, references__lte=0
+        ).first()
+        if media_file is None:
+            return
+        path = default_storage.path(name)
+        removed = f'{path}.removed'
+        try:
+            os.replace(path, removed)
+        except FileNotFoundError:
+            media_file.delete()
+            return
+        if os.stat(removed).st_mtime > time.time() - (
+            settings.MEDIA_REMOVE_GRACE
+        ):
+            os.replace(removed, path)
+            return
+        media_file.delete()
+        os.remove(removed)
+
+
+def stored_files(directory):
+    """Yields (name, size, mtime) of the files below a directory of the
+    default storage, reading one directory listing at a time."""
+    root = default_storage.location
+    stack = [default_storage.path(directory)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat()
+                    name = os.path.relpath(entry.path, root).replace(
+                        os.sep, '/'
+                    )
+                    yield name, stat.st_size, stat.st_mtime
+
+
+def referenced(names):
+    found = set()
+    for model in (Recipe, RecipeImageUpload):
+        found.update(
+            model._base_manager.filter(image__in=names).values_list(
+                'image', flat=True
+            )
+        )
+    return found
+
+
+def collect_garbage(grace, batch_size=1000, dry_run=False):
+    """Removes image files that no recipe or upload refers to, checking
+    batch_size files per query. Files changed in the last grace seconds
+    may belong to a transaction in progress and are kept. Yields the
+    names and sizes of the removed files."""
+    cutoff = time.time() - grace
+    files = stored_files(IMAGE_DIRECTORY)
+    while True:
+        batch = list(islice(files, batch_size))
+        if not batch:
+            return
+        candidates = {
+            name: size for name, size, mtime in batch if mtime < cutoff
+        }
+        garbage = set(candidates) - referenced(candidates)
+        if not dry_run:
+            # A file saved again meanwhile got a fresh mtime.
+            garbage = {
+                name for name in garbage
+                if os.stat(default_storage.path(name)).st_mtime < cutoff
+            }
+            MediaFile.objects.filter(name__in=garbage).delete()
+            for name in garbage:
+                default_storage.delete(name)
+        for name in sorted(garbage):
+            yield name, candidates[name]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-19 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.FloatField(db_index=True, default=0, editable=False, verbose_name='Популярность'),
+        ),
+    ]
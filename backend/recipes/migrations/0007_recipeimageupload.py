@@ -0,0 +1,31 @@
+# Generated by Django 4.2.6 on 2026-10-19 07:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import recipes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0006_recipe_is_deleted_deletionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImageUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='recipes/', verbose_name='Картинка')),
+                ('token', models.CharField(default=recipes.models.make_upload_token, editable=False, max_length=64, unique=True, verbose_name='Токен')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Время загрузки')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_uploads', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Загруженная картинка',
+                'verbose_name_plural': 'Загруженные картинки',
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.6 on 2026-10-19 08:04
+
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    MediaFile = apps.get_model('recipes', 'MediaFile')
+    counts = {}
+    for model_name in ('Recipe', 'RecipeImageUpload'):
+        model = apps.get_model('recipes', model_name)
+        for name in model._base_manager.values_list(
+            'image', flat=True
+        ).iterator():
+            if name:
+                counts[name] = counts.get(name, 0) + 1
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name, references=count)
+         for name, count in counts.items()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipeimageupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Медиафайл',
+                'verbose_name_plural': 'Медиафайлы',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to='recipes/', verbose_name='Картинка'),
+        ),
+        migrations.AlterField(
+            model_name='recipeimageupload',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to='recipes/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.6 on 2026-10-19 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_mediafile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingredient_id', models.PositiveBigIntegerField(verbose_name='id ингредиента')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Время изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение ингредиента',
+                'verbose_name_plural': 'Изменения ингредиентов',
+                'ordering': ['id'],
+            },
+        ),
+    ]
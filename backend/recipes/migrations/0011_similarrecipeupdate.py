@@ -0,0 +1,26 @@
+# Generated by Django 4.2.6 on 2026-10-19 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarRecipeUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.PositiveBigIntegerField(unique=True, verbose_name='id рецепта')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Время постановки в очередь')),
+            ],
+            options={
+                'verbose_name': 'Пересчёт похожих рецептов',
+                'verbose_name_plural': 'Очередь пересчёта похожих рецептов',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.6 on 2026-10-19 14:02
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def date_by_recipe(apps, schema_editor):
+    """Existing rows carry no time: they are dated at recipe creation,
+    as rebuild_popularity did before."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    for name in ('FavoriteRecipe', 'ShoppingCart'):
+        model = apps.get_model('recipes', name)
+        model.objects.update(created=Subquery(
+            Recipe._base_manager.filter(
+                pk=OuterRef('recipe_id')
+            ).values('created')[:1]
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_author_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favoriterecipe',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Время добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Время добавления'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(date_by_recipe, migrations.RunPython.noop),
+    ]
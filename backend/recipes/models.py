@@ -1,3 +1,5 @@
+import secrets
+
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
@@ -50,6 +52,12 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeManager(models.Manager):
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
 class Recipe(models.Model):
 
     author = models.ForeignKey(
@@ -64,7 +72,8 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         'Картинка',
-        upload_to='recipes/'
+        upload_to='recipes/',
+        db_index=True
     )
     text = models.TextField(
         'Описание'
@@ -94,11 +103,84 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    updated = models.DateTimeField(
+        'Время изменения',
+        auto_now=True,
+        db_index=True
+    )
+    popularity = models.FloatField(
+        'Популярность',
+        default=0,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    is_deleted = models.BooleanField(
+        'Удален',
+        default=False,
+        editable=False
+    )
+
+    objects = RecipeManager()
+    all_objects = models.Manager()
 
     class Meta:
         ordering = ['-created']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        # One per ?ordering= option, limited to the rows RecipeManager
+        # returns, and the same led by author for ?author=; the tag
+        # filter uses its own index.
+        indexes = [
+            models.Index(
+                fields=['-popularity', '-created'],
+                condition=models.Q(is_deleted=False),
+                name='recipe_popularity_idx'
+            ),
+            models.Index(
+                fields=['cooking_time', '-created'],
+                condition=models.Q(is_deleted=False),
+                name='recipe_cooking_time_idx'
+            ),
+            models.Index(
+                fields=['name', '-created'],
+                condition=models.Q(is_deleted=False),
+                name='recipe_name_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-created'],
+                condition=models.Q(is_deleted=False),
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=['author', '-popularity', '-created'],
+                condition=models.Q(is_deleted=False),
+                name='recipe_author_popularity_idx'
+            ),
+            models.Index(
+                fields=['author', 'cooking_time', '-created'],
+                condition=models.Q(is_deleted=False),
+                name='recipe_author_cooking_time_idx'
+            ),
+            models.Index(
+                fields=['author', 'name', '-created'],
+                condition=models.Q(is_deleted=False),
+                name='recipe_author_name_idx'
+            ),
+            models.Index(
+                fields=['author', '-favorites_count', '-created'],
+                condition=models.Q(is_deleted=False),
+                name='recipe_author_favorites_idx'
+            ),
+            models.Index(
+                fields=['author', '-created'],
+                condition=models.Q(is_deleted=False),
+                name='recipe_author_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -130,8 +212,11 @@ class RecipeIngredient(models.Model):
         verbose_name_plural = 'Ингредиенты в рецепте'
 
     def __str__(self):
-        return f'{self.ingredient.name} - {self.amount}\
-            {self.ingredient.measurement_unit}'
+        ingredient = self.ingredient
+        return (
+            f'{ingredient.name} - {self.amount} '
+            f'{ingredient.measurement_unit}'
+        )
 
 
 class FavoriteRecipe(models.Model):
@@ -148,6 +233,10 @@ class FavoriteRecipe(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепты'
     )
+    created = models.DateTimeField(
+        'Время добавления',
+        auto_now_add=True
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -179,6 +268,10 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        'Время добавления',
+        auto_now_add=True
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -193,3 +286,198 @@ class ShoppingCart(models.Model):
     def str(self):
         return f'ShoppingCart >>> Пользователь {self.user.username} - ' \
                f'рецепт {self.recipe.name}'
+
+
+class SimilarRecipe(models.Model):
+
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='similar_recipes',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similar_recipe_score_idx'
+            )
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} ~ {self.similar_id} ({self.score:.3f})'
+
+
+class SimilarRecipeUpdate(models.Model):
+    """Recipe whose similar recipes the process_similar_recipes worker
+    is to recompute. A recipe is queued once however often it is saved
+    before the worker gets to it."""
+
+    recipe_id = models.PositiveBigIntegerField('id рецепта', unique=True)
+    created = models.DateTimeField(
+        'Время постановки в очередь', auto_now_add=True, db_index=True
+    )
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Пересчёт похожих рецептов'
+        verbose_name_plural = 'Очередь пересчёта похожих рецептов'
+
+    def __str__(self):
+        return str(self.recipe_id)
+
+
+class TimelineEntry(models.Model):
+
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='timeline_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} <- {self.recipe_id}'
+
+
+class DeletionJob(models.Model):
+    RECIPE = 'recipe'
+    USER = 'user'
+    KINDS = (
+        (RECIPE, 'Рецепт'),
+        (USER, 'Пользователь'),
+    )
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Завершено'),
+        (FAILED, 'Ошибка'),
+    )
+
+    kind = models.CharField('Объект', max_length=10, choices=KINDS)
+    object_id = models.PositiveBigIntegerField('id объекта')
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,
+        db_index=True
+    )
+    deleted_rows = models.PositiveBigIntegerField('Удалено строк', default=0)
+    error = models.TextField('Ошибка', blank=True)
+    created = models.DateTimeField('Время создания', auto_now_add=True)
+    heartbeat = models.DateTimeField('Последний прогресс', null=True)
+    finished = models.DateTimeField('Время завершения', null=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Задача удаления'
+        verbose_name_plural = 'Задачи удаления'
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}: {self.status}'
+
+
+def make_upload_token():
+    return secrets.token_urlsafe(32)
+
+
+class RecipeImageUpload(models.Model):
+
+    user = models.ForeignKey(
+        User,
+        related_name='image_uploads',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='recipes/',
+        db_index=True
+    )
+    token = models.CharField(
+        'Токен',
+        max_length=64,
+        unique=True,
+        default=make_upload_token,
+        editable=False
+    )
+    created = models.DateTimeField(
+        'Время загрузки',
+        auto_now_add=True,
+        db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'Загруженная картинка'
+        verbose_name_plural = 'Загруженные картинки'
+
+    def __str__(self):
+        return self.image.name
+
+
+class IngredientChange(models.Model):
+    """Change log of the ingredient catalog: the id is the catalog
+    revision. Deleted ingredients are those missing from the table."""
+
+    ingredient_id = models.PositiveBigIntegerField('id ингредиента')
+    created = models.DateTimeField('Время изменения', auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Изменение ингредиента'
+        verbose_name_plural = 'Изменения ингредиентов'
+
+    def __str__(self):
+        return f'{self.pk}: {self.ingredient_id}'
+
+
+class MediaFile(models.Model):
+    """Number of rows referring to a file of the content-addressed
+    storage; the file is removed when it drops to zero."""
+
+    name = models.CharField('Файл', max_length=255, unique=True)
+    references = models.PositiveIntegerField('Ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+    def __str__(self):
+        return f'{self.name}: {self.references}'
@@ -0,0 +1,229 @@
+import threading
+import time
+from datetime import timedelta
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Recipe, RecipeIngredient
+
+CHUNK_SIZE = 10000
+EMPTY = np.array([], dtype=np.int64)
+
+
+def load_pairs(queryset):
+    pairs = queryset.values_list('ingredient_id', 'recipe_id')
+    flat = np.fromiter(
+        chain.from_iterable(pairs.iterator(chunk_size=CHUNK_SIZE)),
+        dtype=np.int64
+    )
+    return flat.reshape(-1, 2)
+
+
+def group(keys, values):
+    """Splits values into sorted arrays per key."""
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    unique, starts = np.unique(keys, return_index=True)
+    return dict(zip(unique.tolist(), np.split(values, starts[1:])))
+
+
+def sorted_sizes(sizes):
+    keys = np.fromiter(sizes, dtype=np.int64, count=len(sizes))
+    values = np.fromiter(
+        sizes.values(), dtype=np.int64, count=len(sizes)
+    )
+    order = np.argsort(keys)
+    return keys[order], values[order]
+
+
+def lookup(keys, values, ids, out):
+    """Sets out to the values of ids found in the sorted keys."""
+    if not len(keys):
+        return
+    positions = np.minimum(np.searchsorted(keys, ids), len(keys) - 1)
+    found = keys[positions] == ids
+    out[found] = values[positions[found]]
+
+
+class PantryIndex:
+    """Process-local inverted index ingredient -> sorted recipe ids.
+
+    Each query picks up recipes whose `updated` moved since the last
+    refresh (with a small overlap for transactions that committed late)
+    and patches only their postings; changes already applied are
+    skipped. Ingredient counts of the recipes changed since the last
+    full rebuild, every PANTRY_INDEX_TTL seconds, are kept apart from
+    the rebuilt ones so a change never copies the whole index.
+
+    Searches read self.snapshot, which is replaced as a whole under the
+    lock and never modified, so they need no lock themselves. A full
+    rebuild reads the database without the lock and only swaps its
+    result in under it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Held by the one caller rebuilding the index.
+        self.building = threading.Lock()
+        self.postings = {}
+        self.recipe_ingredients = {}
+        self.changed_sizes = {}
+        self.applied = {}
+        self.snapshot = ({}, EMPTY, EMPTY, EMPTY, EMPTY)
+        self.watermark = None
+        self.built_at = 0
+
+    def publish(self, base_keys=None, base_values=None):
+        _, keys, values, _, _ = self.snapshot
+        if base_keys is not None:
+            keys, values = base_keys, base_values
+        changed_keys, changed_values = sorted_sizes(self.changed_sizes)
+        self.snapshot = (
+            self.postings, keys, values, changed_keys, changed_values
+        )
+
+    def rebuild(self):
+        """Builds the index from scratch outside the lock, then swaps it
+        in. Changes applied to the old index meanwhile are read again
+        from the new watermark."""
+        watermark = Recipe.all_objects.aggregate(
+            Max('updated')
+        )['updated__max']
+        pairs = load_pairs(
+            RecipeIngredient.objects.filter(recipe__is_deleted=False)
+        )
+        postings = group(pairs[:, 0], pairs[:, 1])
+        recipe_ingredients = group(pairs[:, 1], pairs[:, 0])
+        keys, values = np.unique(pairs[:, 1], return_counts=True)
+        with self.lock:
+            self.postings = postings
+            self.recipe_ingredients = recipe_ingredients
+            self.changed_sizes = {}
+            self.applied = {}
+            self.publish(keys, values.astype(np.int64))
+            self.watermark = watermark
+            self.built_at = time.monotonic()
+
+    def apply_changes(self):
+        since = self.watermark - timedelta(
+            seconds=settings.PANTRY_INDEX_OVERLAP
+        )
+        window = dict(
+            Recipe.all_objects.filter(updated__gte=since).values_list(
+                'id', 'updated'
+            )
+        )
+        changed = [
+            recipe_id for recipe_id, updated in window.items()
+            if self.applied.get(recipe_id) != updated
+        ]
+        # Only the overlap window can be seen again.
+        self.applied = window
+        if not changed:
+            return
+        pairs = load_pairs(
+            RecipeIngredient.objects.filter(
+                recipe_id__in=changed, recipe__is_deleted=False
+            )
+        )
+        current = group(pairs[:, 1], pairs[:, 0]) if len(pairs) else {}
+        self.replace(
+            {recipe_id: current.get(recipe_id, EMPTY)
+             for recipe_id in changed}
+        )
+        self.watermark = max(self.watermark, max(window.values()))
+
+    def replace(self, ingredients):
+        """Sets the ingredients of recipes; hidden and deleted recipes
+        have none and leave the index."""
+        touched = {}
+        for recipe_id, new in ingredients.items():
+            old = self.recipe_ingredients.get(recipe_id, EMPTY)
+            for ingredient_id in np.setdiff1d(old, new).tolist():
+                touched.setdefault(ingredient_id, [set(), set()])[0].add(
+                    recipe_id
+                )
+            for ingredient_id in np.setdiff1d(new, old).tolist():
+                touched.setdefault(ingredient_id, [set(), set()])[1].add(
+                    recipe_id
+                )
+            if len(new):
+                self.recipe_ingredients[recipe_id] = new
+            else:
+                self.recipe_ingredients.pop(recipe_id, None)
+            self.changed_sizes[recipe_id] = len(new)
+        # Searches may still hold the previous dict: copy, never mutate.
+        self.postings = dict(self.postings)
+        for ingredient_id, (removed, added) in touched.items():
+            posting = self.postings.get(ingredient_id, EMPTY)
+            posting = np.setdiff1d(
+                posting, np.fromiter(removed, dtype=np.int64)
+            )
+            posting = np.union1d(posting, np.fromiter(added, dtype=np.int64))
+            if len(posting):
+                self.postings[ingredient_id] = posting
+            else:
+                self.postings.pop(ingredient_id, None)
+        self.publish()
+
+    def discard(self, recipe_ids):
+        """Drops recipes deleted outright, which leaves no change to
+        pick up. Called by the post_delete signal of Recipe."""
+        with self.lock:
+            gone = [
+                recipe_id for recipe_id in recipe_ids
+                if recipe_id in self.recipe_ingredients
+            ]
+            if gone:
+                self.replace({recipe_id: EMPTY for recipe_id in gone})
+
+    def expired(self):
+        return time.monotonic() - self.built_at > settings.PANTRY_INDEX_TTL
+
+    def refresh(self):
+        """Before the first build every caller waits for it. Later, once
+        PANTRY_INDEX_TTL has passed, one caller rebuilds the index while
+        the others keep applying changes to the current one."""
+        if self.watermark is None:
+            with self.building:
+                if self.watermark is None:
+                    self.rebuild()
+            return
+        if self.expired() and self.building.acquire(blocking=False):
+            try:
+                if self.expired():
+                    self.rebuild()
+                    return
+            finally:
+                self.building.release()
+        with self.lock:
+            self.apply_changes()
+
+    def search(self, ingredient_ids, limit=None):
+        """Returns (recipe_id, missing ingredients) pairs, fully makeable
+        recipes first, then by fewest missing and most matched."""
+        self.refresh()
+        postings, keys, values, changed_keys, changed_values = (
+            self.snapshot
+        )
+        postings = [
+            postings[ingredient_id]
+            for ingredient_id in set(ingredient_ids)
+            if ingredient_id in postings
+        ]
+        if not postings:
+            return []
+        recipe_ids, matched = np.unique(
+            np.concatenate(postings), return_counts=True
+        )
+        sizes = np.zeros(len(recipe_ids), dtype=np.int64)
+        lookup(keys, values, recipe_ids, sizes)
+        lookup(changed_keys, changed_values, recipe_ids, sizes)
+        missing = sizes - matched
+        order = np.lexsort((-matched, missing))[:limit]
+        return list(zip(recipe_ids[order].tolist(), missing[order].tolist()))
+
+
+index = PantryIndex()
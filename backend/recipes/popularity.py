@@ -0,0 +1,96 @@
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Exp, Greatest, Least, Ln
+from django.utils import timezone
+
+from .models import FavoriteRecipe, Recipe, ShoppingCart
+
+# Popularity is kept as the log of sum(weight * 2 ** (age / half-life))
+# measured from a fixed epoch. Adding an event is a log-sum-exp update
+# and ordering by the stored value equals ordering by the decayed score
+# at any moment, so scores never have to be re-decayed row by row.
+# Removing an event subtracts the same term, dated by the created field
+# of its row; 0 means no events.
+EPOCH = datetime(2023, 1, 1)
+
+EVENT_WEIGHTS = {
+    FavoriteRecipe: 1.0,
+    ShoppingCart: 0.5,
+}
+# Scores this close are taken as equal when an event is removed.
+ROUNDING = 1e-9
+
+
+def decay_rate():
+    return math.log(2) / (settings.POPULARITY_HALF_LIFE_DAYS * 24 * 3600)
+
+
+def event_score(weight, moment=None):
+    moment = moment or timezone.now()
+    if timezone.is_aware(moment):
+        moment = timezone.make_naive(moment, dt_timezone.utc)
+    return decay_rate() * (moment - EPOCH).total_seconds() + math.log(weight)
+
+
+def record_event(recipe_id, weight, moment=None):
+    current = F('popularity')
+    score = Value(event_score(weight, moment), output_field=FloatField())
+    high, low = Greatest(current, score), Least(current, score)
+    Recipe.objects.filter(pk=recipe_id).update(
+        popularity=high + Ln(1 + Exp(low - high))
+    )
+
+
+def forget_event(recipe_id, weight, moment):
+    """Subtracts an event recorded at moment, down to no events at all
+    when it was the only one left up to rounding."""
+    current = F('popularity')
+    score = event_score(weight, moment)
+    Recipe.all_objects.filter(pk=recipe_id).update(popularity=Case(
+        When(popularity__lte=score + ROUNDING, then=Value(0.0)),
+        default=current + Ln(1 - Exp(Value(score) - current)),
+        output_field=FloatField()
+    ))
+
+
+def log_sum(scores):
+    high = max(scores)
+    return high + math.log(sum(math.exp(score - high) for score in scores))
+
+
+def rebuild_popularity(batch_size=1000):
+    """Recomputes every score from the current favorites and carts and
+    the favorites_count counters along the way."""
+    recipe_ids = Recipe.objects.values_list('pk', flat=True).order_by('pk')
+    fields = ['popularity', 'favorites_count']
+    batch = []
+    for recipe_id in recipe_ids.iterator(chunk_size=batch_size):
+        batch.append(recipe_id)
+        if len(batch) >= batch_size:
+            Recipe.objects.bulk_update(score_recipes(batch), fields)
+            batch = []
+    Recipe.objects.bulk_update(score_recipes(batch), fields)
+
+
+def score_recipes(recipe_ids):
+    scores = {recipe_id: [] for recipe_id in recipe_ids}
+    favorites = dict.fromkeys(recipe_ids, 0)
+    for model, weight in EVENT_WEIGHTS.items():
+        events = model.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'created')
+        for recipe_id, created in events.iterator():
+            scores[recipe_id].append(event_score(weight, created))
+            if model is FavoriteRecipe:
+                favorites[recipe_id] += 1
+    return [
+        Recipe(
+            pk=recipe_id,
+            popularity=log_sum(scores[recipe_id]) if scores[recipe_id] else 0,
+            favorites_count=favorites[recipe_id]
+        )
+        for recipe_id in recipe_ids
+    ]
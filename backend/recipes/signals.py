@@ -0,0 +1,173 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (FavoriteRecipe, Ingredient, IngredientChange, Recipe,
+                     RecipeImageUpload, RecipeIngredient, ShoppingCart, Tag)
+from users.models import Follow
+from . import media, pantry, similarity, timeline
+from .popularity import EVENT_WEIGHTS, forget_event, record_event
+
+User = get_user_model()
+
+# Fields of the author shown in a recipe.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+def touch_recipes(**lookup):
+    Recipe.objects.filter(**lookup).update(updated=timezone.now())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        touch_recipes(pk=instance.pk)
+    elif pk_set:
+        touch_recipes(pk__in=pk_set)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    touch_recipes(pk=instance.recipe_id)
+
+
+@receiver(post_save, sender=Tag)
+def tag_changed(sender, instance, created, **kwargs):
+    if not created:
+        touch_recipes(tags=instance)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    touch_recipes(tags=instance)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        touch_recipes(ingredients=instance)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_revision(sender, instance, **kwargs):
+    IngredientChange.objects.create(ingredient_id=instance.pk)
+
+
+@receiver(pre_save, sender=User)
+def author_saving(sender, instance, update_fields, **kwargs):
+    instance._author_changed = False
+    if instance.pk is None or (
+        update_fields is not None
+        and not set(AUTHOR_FIELDS) & set(update_fields)
+    ):
+        return
+    stored = User.objects.filter(pk=instance.pk).values_list(
+        *AUTHOR_FIELDS
+    ).first()
+    instance._author_changed = stored is not None and stored != tuple(
+        getattr(instance, field) for field in AUTHOR_FIELDS
+    )
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, **kwargs):
+    if instance._author_changed:
+        touch_recipes(author=instance)
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        Recipe.all_objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+def favorite_removed(sender, instance, **kwargs):
+    Recipe.all_objects.filter(pk=instance.recipe_id).update(
+        favorites_count=Greatest(F('favorites_count') - 1, 0)
+    )
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_popularity_event(sender, instance, created, **kwargs):
+    if created:
+        record_event(
+            instance.recipe_id, EVENT_WEIGHTS[sender], instance.created
+        )
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_popularity_event_removed(sender, instance, **kwargs):
+    forget_event(instance.recipe_id, EVENT_WEIGHTS[sender], instance.created)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: timeline.fan_out(instance))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        timeline.count_followers(instance.author_id, 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timeline.count_followers(instance.author_id, -1)
+    timeline.trim(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=RecipeImageUpload)
+def image_saving(sender, instance, update_fields, **kwargs):
+    instance._stored_image = None
+    if instance.pk is not None and (
+        update_fields is None or 'image' in update_fields
+    ):
+        instance._stored_image = sender._base_manager.filter(
+            pk=instance.pk
+        ).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=RecipeImageUpload)
+def image_saved(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_image', None)
+    if instance.image.name != stored:
+        media.retain(instance.image.name)
+        media.release(stored)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    similarity.forget([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: pantry.index.discard([recipe_id]))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=RecipeImageUpload)
+def image_deleted(sender, instance, **kwargs):
+    media.release(instance.image.name)
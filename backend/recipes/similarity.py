@@ -0,0 +1,380 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from scipy import sparse
+
+from .models import (Recipe, RecipeIngredient, SimilarRecipe,
+                     SimilarRecipeUpdate)
+
+logger = logging.getLogger(__name__)
+
+# Tags are coarse (breakfast, lunch...), so they only nudge the ranking.
+TAG_WEIGHT = 0.5
+# Upper bound of recipes compared against on an incremental update.
+MAX_CANDIDATES = 5000
+CHUNK_SIZE = 10000
+# Upper bound of similarity scores computed at once: the product of a
+# block with the whole matrix is taken this many entries at a time.
+PRODUCT_ENTRIES = 2 ** 22
+
+RecipeTag = Recipe.tags.through
+
+
+def idf(document_frequency, total):
+    return np.log((1 + total) / (1 + document_frequency)) + 1
+
+
+def build_matrix(recipe_ids, ingredient_pairs, tag_pairs, weights):
+    """Rows are recipe_ids, columns are ('i', id) / ('t', id) terms from
+    weights; the result is L2-normalised TF-IDF with binary TF."""
+    columns = {term: number for number, term in enumerate(weights)}
+    row_of = {
+        recipe_id: number for number, recipe_id in enumerate(recipe_ids)
+    }
+    rows, cols = [], []
+    for kind, pairs in (('i', ingredient_pairs), ('t', tag_pairs)):
+        for recipe_id, term_id in pairs:
+            column = columns.get((kind, term_id))
+            row = row_of.get(recipe_id)
+            if column is not None and row is not None:
+                rows.append(row)
+                cols.append(column)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(recipe_ids), len(columns))
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    matrix = matrix @ sparse.diags(
+        np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def term_weights(ingredient_df, tag_df, total):
+    weights = {}
+    for kind, frequencies, factor in (
+        ('i', ingredient_df, 1),
+        ('t', tag_df, TAG_WEIGHT),
+    ):
+        for term_id, frequency in frequencies.items():
+            weights[(kind, term_id)] = factor * idf(frequency, total)
+    return weights
+
+
+def top_neighbors(block, matrix, offset, count):
+    """Yields (row, neighbor columns, scores) for each row of a block
+    that starts at row offset of the matrix, skipping the row itself
+    and zero scores. Rows are multiplied by the matrix a few at a time
+    and ranked within their sparse product, so memory does not grow
+    with the number of recipes."""
+    if count <= 0:
+        return
+    step = max(1, PRODUCT_ENTRIES // max(1, matrix.shape[0]))
+    transposed = matrix.T.tocsc()
+    for first in range(0, block.shape[0], step):
+        scores = (block[first:first + step] @ transposed).tocsr()
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            neighbors = scores.indices[start:end]
+            values = scores.data[start:end]
+            keep = (values > 0) & (neighbors != offset + first + row)
+            neighbors, values = neighbors[keep], values[keep]
+            if len(values) > count:
+                best = np.argpartition(-values, count - 1)[:count]
+                neighbors, values = neighbors[best], values[best]
+            order = np.argsort(-values)
+            yield first + row, neighbors[order], values[order]
+
+
+def similar_rows(recipe_ids, ingredient_pairs, tag_pairs, batch_size,
+                 count):
+    """Yields (batch of recipe ids, their SimilarRecipe rows) for all
+    recipe_ids, from (recipe_id, ingredient_id) and (recipe_id, tag_id)
+    pairs. Pairs of other recipes are ignored, so document frequencies
+    count the same recipes as the IDF total."""
+    known = set(recipe_ids.tolist())
+    ingredient_df = defaultdict(int)
+    for recipe_id, ingredient_id in set(ingredient_pairs):
+        if recipe_id in known:
+            ingredient_df[ingredient_id] += 1
+    tag_df = defaultdict(int)
+    for recipe_id, tag_id in tag_pairs:
+        if recipe_id in known:
+            tag_df[tag_id] += 1
+
+    matrix = build_matrix(
+        recipe_ids,
+        ingredient_pairs,
+        tag_pairs,
+        term_weights(ingredient_df, tag_df, len(recipe_ids))
+    ).tocsr()
+    for start in range(0, len(recipe_ids), batch_size):
+        block = matrix[start:start + batch_size]
+        yield recipe_ids[start:start + batch_size].tolist(), [
+            SimilarRecipe(
+                recipe_id=int(recipe_ids[start + row]),
+                similar_id=int(recipe_ids[neighbor]),
+                score=float(score)
+            )
+            for row, neighbors, scores in top_neighbors(
+                block, matrix, start, count
+            )
+            for neighbor, score in zip(neighbors, scores)
+        ]
+
+
+def rebuild_similar_recipes(batch_size=500, count=None):
+    count = count or settings.SIMILAR_RECIPES_COUNT
+    recipe_ids = np.fromiter(
+        Recipe.objects.order_by('id').values_list(
+            'id', flat=True
+        ).iterator(chunk_size=CHUNK_SIZE),
+        dtype=np.int64
+    )
+    ingredient_pairs = list(
+        RecipeIngredient.objects.filter(
+            recipe__is_deleted=False
+        ).values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator(chunk_size=CHUNK_SIZE)
+    )
+    tag_pairs = list(
+        RecipeTag.objects.filter(
+            recipe__is_deleted=False
+        ).values_list(
+            'recipe_id', 'tag_id'
+        ).iterator(chunk_size=CHUNK_SIZE)
+    )
+    for batch, rows in similar_rows(
+        recipe_ids, ingredient_pairs, tag_pairs, batch_size, count
+    ):
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+            SimilarRecipe.objects.bulk_create(rows, batch_size=CHUNK_SIZE)
+    return len(recipe_ids)
+
+
+def document_frequencies(queryset, field, values):
+    """Number of visible recipes with each of values, as counted by the
+    IDF total."""
+    return dict(
+        queryset.filter(
+            **{f'{field}__in': values}, recipe__is_deleted=False
+        ).values_list(
+            field
+        ).annotate(Count('recipe_id', distinct=True))
+    )
+
+
+def update_similar_recipes(recipe_id, count=None, total=None):
+    """Recomputes neighbors of one recipe against the visible recipes
+    sharing its rarer ingredients or its tags and inserts it into their
+    lists where it ranks high enough. Lists already holding it get the
+    new score, or are queued to be filled up again when it is no longer
+    similar at all. total is the number of recipes for the IDF
+    weights; callers updating many recipes count them once."""
+    count = count or settings.SIMILAR_RECIPES_COUNT
+    if total is None:
+        total = Recipe.objects.count()
+    ingredient_ids = list(
+        RecipeIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', flat=True)
+    )
+    frequencies = document_frequencies(
+        RecipeIngredient.objects, 'ingredient_id', ingredient_ids
+    )
+    # Rare ingredients first: ubiquitous ones like salt would pull in
+    # every recipe while contributing almost nothing to the score.
+    selective, candidate_rows = [], 0
+    for ingredient_id in sorted(frequencies, key=frequencies.get):
+        if selective and candidate_rows + frequencies[ingredient_id] > (
+            MAX_CANDIDATES
+        ):
+            break
+        selective.append(ingredient_id)
+        candidate_rows += frequencies[ingredient_id]
+    candidates = list(
+        RecipeIngredient.objects.filter(
+            ingredient_id__in=selective, recipe__is_deleted=False
+        ).exclude(recipe_id=recipe_id).values_list(
+            'recipe_id', flat=True
+        ).distinct()[:MAX_CANDIDATES]
+    )
+    # Recipes sharing only tags fill the list when few share ingredients,
+    # as they do in a full rebuild.
+    tag_candidates = list(
+        RecipeTag.objects.filter(
+            tag__in=RecipeTag.objects.filter(
+                recipe_id=recipe_id
+            ).values('tag_id'),
+            recipe__is_deleted=False
+        ).exclude(recipe_id=recipe_id).values_list(
+            'recipe_id', flat=True
+        ).distinct()[:count]
+    )
+    # Lists the recipe is in now; they keep it with a fresh score.
+    holders = list(
+        SimilarRecipe.objects.filter(similar_id=recipe_id).values_list(
+            'recipe_id', flat=True
+        )
+    )
+    recipe_ids = [recipe_id, *(
+        dict.fromkeys([*candidates, *tag_candidates, *holders])
+    )]
+
+    ingredient_pairs = list(
+        RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id')
+    )
+    tag_pairs = list(
+        RecipeTag.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'tag_id')
+    )
+    ingredient_df = document_frequencies(
+        RecipeIngredient.objects,
+        'ingredient_id',
+        {pair[1] for pair in ingredient_pairs}
+    )
+    tag_df = document_frequencies(
+        RecipeTag.objects, 'tag_id', {pair[1] for pair in tag_pairs}
+    )
+    matrix = build_matrix(
+        recipe_ids,
+        ingredient_pairs,
+        tag_pairs,
+        term_weights(ingredient_df, tag_df, total)
+    ).tocsr()
+    all_scores = (matrix[:1] @ matrix.T).toarray()[0]
+    score_of = dict(zip(recipe_ids, all_scores.tolist()))
+    _, neighbors, scores = next(
+        top_neighbors(matrix[:1], matrix, 0, count),
+        (0, [], [])
+    )
+    neighbors = [recipe_ids[neighbor] for neighbor in neighbors]
+    scores = [float(score) for score in scores]
+
+    current = defaultdict(list)
+    for row in SimilarRecipe.objects.filter(
+        recipe_id__in=neighbors
+    ).exclude(similar_id=recipe_id):
+        current[row.recipe_id].append(row)
+
+    new_rows = [
+        SimilarRecipe(recipe_id=recipe_id, similar_id=neighbor, score=score)
+        for neighbor, score in zip(neighbors, scores)
+    ]
+    kept = {
+        holder for holder in holders
+        if holder != recipe_id and score_of[holder] > 0
+    }
+    new_rows.extend(
+        SimilarRecipe(
+            recipe_id=holder, similar_id=recipe_id, score=score_of[holder]
+        )
+        for holder in kept
+    )
+    displaced = []
+    for neighbor, score in zip(neighbors, scores):
+        if neighbor in kept:
+            continue
+        rows = current[neighbor]
+        weakest = min(rows, key=lambda row: row.score, default=None)
+        if len(rows) < count or score > weakest.score:
+            new_rows.append(SimilarRecipe(
+                recipe_id=neighbor, similar_id=recipe_id, score=score
+            ))
+            if len(rows) >= count:
+                displaced.append(weakest.pk)
+
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id=recipe_id).delete()
+        SimilarRecipe.objects.filter(similar_id=recipe_id).delete()
+        SimilarRecipe.objects.filter(pk__in=displaced).delete()
+        # A concurrent update of a neighbor may have inserted the same
+        # pair since it was read; its row is as good as ours.
+        SimilarRecipe.objects.bulk_create(new_rows, ignore_conflicts=True)
+        # Lists the recipe no longer fits in are filled up again.
+        schedule(*(set(holders) - kept - {recipe_id}))
+
+
+def schedule(*recipe_ids):
+    """Queues recipes for the process_similar_recipes worker. It runs in
+    the caller's transaction, so a rolled back save queues nothing."""
+    SimilarRecipeUpdate.objects.bulk_create(
+        [SimilarRecipeUpdate(recipe_id=recipe_id) for recipe_id in recipe_ids],
+        ignore_conflicts=True
+    )
+
+
+def forget(recipe_ids):
+    """Takes hidden or deleted recipes out of every list and queues the
+    recipes whose lists they were in, so that those are filled up again.
+    recipe_ids may be a queryset of ids."""
+    affected = set(
+        SimilarRecipe.objects.filter(similar_id__in=recipe_ids).values_list(
+            'recipe_id', flat=True
+        )
+    )
+    SimilarRecipe.objects.filter(
+        Q(recipe_id__in=recipe_ids) | Q(similar_id__in=recipe_ids)
+    ).delete()
+    SimilarRecipeUpdate.objects.filter(recipe_id__in=recipe_ids).delete()
+    schedule(*affected)
+
+
+def claim_updates(limit):
+    """Removes up to limit recipes from the queue and returns their ids.
+    Recipes queued in the last SIMILAR_RECIPES_DELAY seconds wait, so a
+    recipe edited several times in a row is computed once."""
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.SIMILAR_RECIPES_DELAY
+    )
+    with transaction.atomic():
+        claimed = list(
+            SimilarRecipeUpdate.objects.select_for_update(
+                skip_locked=True
+            ).filter(created__lte=cutoff).values_list('pk', 'recipe_id')[
+                :limit
+            ]
+        )
+        SimilarRecipeUpdate.objects.filter(
+            pk__in=[pk for pk, _ in claimed]
+        ).delete()
+    return [recipe_id for _, recipe_id in claimed]
+
+
+def process_updates(recipe_ids):
+    """Recomputes the lists of claimed recipes; recipes hidden or
+    deleted since they were queued are forgotten instead. A failure is
+    logged and left to the next build_similar_recipes. Returns the
+    number of recipes updated."""
+    visible = set(
+        Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True)
+    )
+    gone = [recipe_id for recipe_id in recipe_ids if recipe_id not in visible]
+    if gone:
+        forget(gone)
+    total = Recipe.objects.count()
+    updated = 0
+    for recipe_id in recipe_ids:
+        if recipe_id not in visible:
+            continue
+        try:
+            update_similar_recipes(recipe_id, total=total)
+        except Exception:
+            logger.exception('Similar recipes of %s failed', recipe_id)
+        else:
+            updated += 1
+    return updated
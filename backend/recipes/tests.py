@@ -0,0 +1,735 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from users.models import Follow, FollowerCount
+from . import (deletion, media, pantry, popularity, similarity, timeline,
+               transfer)
+from .admin import AuthorEmailFilter, NameFilter
+from .models import (DeletionJob, FavoriteRecipe, Ingredient, MediaFile,
+                     Recipe, RecipeIngredient, ShoppingCart, Tag,
+                     TimelineEntry)
+
+User = get_user_model()
+
+
+class SimilarityTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.recipe_ids = np.arange(1, 41, dtype=np.int64)
+        self.ingredient_pairs = [
+            (int(recipe_id), int(ingredient_id))
+            for recipe_id in self.recipe_ids
+            for ingredient_id in rng.choice(12, size=4, replace=False)
+        ]
+        self.tag_pairs = [
+            (int(recipe_id), int(recipe_id % 3)) for recipe_id in
+            self.recipe_ids
+        ]
+
+    def rows(self, recipe_ids, ingredient_pairs, count=5):
+        return {
+            (row.recipe_id, row.similar_id): row.score
+            for _, rows in similarity.similar_rows(
+                recipe_ids, ingredient_pairs, self.tag_pairs, 16, count
+            )
+            for row in rows
+        }
+
+    def test_top_neighbors_match_dense_ranking(self):
+        matrix = similarity.build_matrix(
+            self.recipe_ids, self.ingredient_pairs, self.tag_pairs,
+            similarity.term_weights({i: 5 for i in range(12)}, {}, 40)
+        ).tocsr()
+        dense = (matrix @ matrix.T).toarray()
+        np.fill_diagonal(dense, 0)
+        # A budget of a few rows forces the block to be split.
+        with mock.patch.object(similarity, 'PRODUCT_ENTRIES', 100):
+            neighbors = list(similarity.top_neighbors(
+                matrix[8:24], matrix, 8, 5
+            ))
+        self.assertEqual([row for row, _, _ in neighbors], list(range(16)))
+        for row, columns, scores in neighbors:
+            expected = np.sort(dense[8 + row])[::-1][:5]
+            np.testing.assert_allclose(scores, expected[expected > 0])
+            np.testing.assert_allclose(dense[8 + row, columns], scores)
+            self.assertNotIn(8 + row, columns)
+
+    def test_pairs_of_other_recipes_do_not_change_scores(self):
+        hidden = [(1000, ingredient_id) for ingredient_id in range(6)]
+        self.assertEqual(
+            self.rows(self.recipe_ids, self.ingredient_pairs),
+            self.rows(self.recipe_ids, self.ingredient_pairs + hidden)
+        )
+
+
+class PantryIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password-12345'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        cls.recipes = []
+        for number in range(1, 4):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10
+            )
+            for ingredient in cls.ingredients[:number]:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=100
+                )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        self.index = pantry.PantryIndex()
+        self.index.refresh()
+
+    def expire(self):
+        self.index.built_at = (
+            time.monotonic() - settings.PANTRY_INDEX_TTL - 1
+        )
+
+    def test_search(self):
+        first, second, _ = self.ingredients
+        self.assertEqual(
+            self.index.search([first.pk, second.pk]),
+            [(self.recipes[1].pk, 0), (self.recipes[0].pk, 0),
+             (self.recipes[2].pk, 1)]
+        )
+
+    def test_deleted_recipe_leaves_the_index(self):
+        recipe = self.recipes[2]
+        with mock.patch.object(pantry, 'index', self.index):
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.delete()
+        self.assertNotIn(
+            recipe.pk,
+            [pk for pk, _ in self.index.search([self.ingredients[0].pk])]
+        )
+
+    def test_rebuild_reads_without_the_lock(self):
+        previous = self.index.snapshot
+        load = pantry.load_pairs
+        seen = []
+
+        def load_pairs(queryset):
+            seen.append((self.index.lock.locked(),
+                         self.index.snapshot is previous))
+            return load(queryset)
+
+        self.expire()
+        with mock.patch.object(pantry, 'load_pairs', load_pairs):
+            self.index.refresh()
+        self.assertEqual(seen, [(False, True)])
+        self.assertIsNot(self.index.snapshot, previous)
+
+    def test_one_caller_rebuilds(self):
+        self.expire()
+        self.index.building.acquire()
+        try:
+            with mock.patch.object(self.index, 'rebuild') as rebuild:
+                self.assertEqual(len(self.index.search(
+                    [self.ingredients[0].pk]
+                )), 3)
+        finally:
+            self.index.building.release()
+        rebuild.assert_not_called()
+
+
+class PopularityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password-12345'
+        )
+        cls.readers = [
+            User.objects.create_user(
+                username=f'reader{number}',
+                email=f'reader{number}@example.com',
+                password='password-12345'
+            )
+            for number in range(2)
+        ]
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=10
+        )
+
+    def score(self):
+        self.recipe.refresh_from_db()
+        return self.recipe.popularity
+
+    def test_record_event(self):
+        moment = timezone.now()
+        popularity.record_event(self.recipe.pk, 1.0, moment)
+        popularity.record_event(self.recipe.pk, 0.5, moment)
+        self.assertAlmostEqual(
+            self.score(), popularity.event_score(1.5, moment)
+        )
+        popularity.forget_event(self.recipe.pk, 0.5, moment)
+        self.assertAlmostEqual(
+            self.score(), popularity.event_score(1.0, moment)
+        )
+
+    def test_event_halves_every_half_life(self):
+        moment = timezone.now()
+        self.assertAlmostEqual(
+            popularity.event_score(1.0, moment - timedelta(
+                days=settings.POPULARITY_HALF_LIFE_DAYS
+            )),
+            popularity.event_score(0.5, moment)
+        )
+
+    def test_favorite_round_trip(self):
+        FavoriteRecipe.objects.create(user=self.readers[0], recipe=self.recipe)
+        before = self.score()
+        for _ in range(3):
+            FavoriteRecipe.objects.create(
+                user=self.readers[1], recipe=self.recipe
+            )
+            ShoppingCart.objects.create(
+                user=self.readers[1], recipe=self.recipe
+            )
+            self.assertGreater(self.score(), before)
+            FavoriteRecipe.objects.filter(user=self.readers[1]).delete()
+            ShoppingCart.objects.filter(user=self.readers[1]).delete()
+            self.assertAlmostEqual(self.score(), before)
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+        FavoriteRecipe.objects.all().delete()
+        self.assertEqual(self.score(), 0)
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_rebuild_popularity(self):
+        for reader in self.readers:
+            FavoriteRecipe.objects.create(user=reader, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.readers[0], recipe=self.recipe)
+        expected = self.score()
+        Recipe.objects.update(popularity=1000, favorites_count=7)
+
+        popularity.rebuild_popularity(batch_size=1)
+        self.assertAlmostEqual(self.score(), expected)
+        self.assertEqual(self.recipe.favorites_count, 2)
+
+        FavoriteRecipe.objects.all().delete()
+        ShoppingCart.objects.all().delete()
+        Recipe.objects.update(popularity=1000)
+        popularity.rebuild_popularity()
+        self.assertEqual(self.score(), 0)
+
+
+class RecipeAdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com',
+            password='password-12345'
+        )
+        for name in ('Борщ', 'Блины'):
+            Recipe.objects.create(
+                author=cls.admin, name=name, text='Описание',
+                cooking_time=10
+            )
+
+    def test_input_filters(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            '/admin/recipes/recipe/', {'name': 'Бор'}
+        )
+        self.assertEqual(response.status_code, 200)
+        changelist = response.context['cl']
+        self.assertEqual(
+            {type(spec) for spec in changelist.filter_specs},
+            {AuthorEmailFilter, NameFilter}
+        )
+        self.assertEqual(
+            [recipe.name for recipe in changelist.result_list], ['Борщ']
+        )
+        self.assertContains(response, 'name="name"')
+
+
+@override_settings(TIMELINE_FANOUT_LIMIT=3, TIMELINE_FANOUT_WINDOW=1)
+class TimelineTests(TestCase):
+    """An author is pushed up to 3 followers, pulled above that and
+    pushed again only at 2."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password-12345'
+        )
+        cls.readers = [
+            User.objects.create_user(
+                username=f'reader{number}',
+                email=f'reader{number}@example.com',
+                password='password-12345'
+            )
+            for number in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def publish(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                author=self.author, name=name, text='Описание',
+                cooking_time=10
+            )
+
+    def follow(self, reader):
+        Follow.objects.create(user=reader, author=self.author)
+
+    def unfollow(self, reader):
+        Follow.objects.get(user=reader, author=self.author).delete()
+
+    def is_pulled(self):
+        return FollowerCount.objects.get(author=self.author).pulled
+
+    def pushed(self, recipe):
+        return set(
+            TimelineEntry.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True
+            )
+        )
+
+    def test_fan_out_with_hysteresis(self):
+        for reader in self.readers[:3]:
+            self.follow(reader)
+        first = self.publish('Первый')
+        self.assertFalse(self.is_pulled())
+        self.assertEqual(
+            self.pushed(first), {reader.pk for reader in self.readers[:3]}
+        )
+
+        self.follow(self.readers[3])
+        self.assertTrue(self.is_pulled())
+        second = self.publish('Второй')
+        self.assertEqual(self.pushed(second), set())
+        self.assertIn(second, timeline.feed(self.readers[0]))
+
+        # Back at the limit, still pulled.
+        self.unfollow(self.readers[3])
+        self.assertTrue(self.is_pulled())
+        self.assertEqual(self.pushed(self.publish('Третий')), set())
+
+        # Below the window, pushed again and backfilled.
+        self.unfollow(self.readers[2])
+        self.assertFalse(self.is_pulled())
+        self.assertEqual(
+            self.pushed(second), {reader.pk for reader in self.readers[:2]}
+        )
+        self.assertEqual(
+            set(timeline.feed(self.readers[0])),
+            set(Recipe.objects.filter(author=self.author))
+        )
+
+    def test_switch_by_another_worker(self):
+        self.follow(self.readers[0])
+        self.assertEqual(list(timeline.feed(self.readers[0])), [])
+        # Written by another process, whose caches this one cannot see.
+        FollowerCount.objects.filter(author=self.author).update(pulled=True)
+        recipe = self.publish('Рецепт')
+        self.assertEqual(self.pushed(recipe), set())
+        self.assertEqual(list(timeline.feed(self.readers[0])), [recipe])
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        recipe = self.publish('Рецепт')
+        self.follow(self.readers[0])
+        self.assertEqual(list(timeline.feed(self.readers[0])), [recipe])
+        self.unfollow(self.readers[0])
+        self.assertEqual(list(timeline.feed(self.readers[0])), [])
+        self.assertEqual(
+            FollowerCount.objects.get(author=self.author).followers, 0
+        )
+
+
+@override_settings(DELETION_SYNC_LIMIT=2)
+class DeletionTests(TestCase):
+    """Recipes and users with more than 2 dependent rows are hidden at
+    once and removed by a job in batches."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password-12345'
+        )
+        cls.readers = [
+            User.objects.create_user(
+                username=f'reader{number}',
+                email=f'reader{number}@example.com',
+                password='password-12345'
+            )
+            for number in range(3)
+        ]
+        large = Recipe.objects.create(
+            author=cls.author, name='Большой', text='Описание',
+            cooking_time=10
+        )
+        for reader in cls.readers:
+            FavoriteRecipe.objects.create(user=reader, recipe=large)
+            Follow.objects.create(user=reader, author=cls.author)
+        # Published after the follows, so in no timeline.
+        small = Recipe.objects.create(
+            author=cls.author, name='Маленький', text='Описание',
+            cooking_time=10
+        )
+        cls.recipes = [large, small]
+
+    def run_job(self):
+        job = deletion.claim_job()
+        self.assertIsNotNone(job)
+        deletion.JobRunner(job, batch_size=2).run()
+        job.refresh_from_db()
+        return job
+
+    def test_small_recipe_is_deleted_at_once(self):
+        deletion.delete_recipe(self.recipes[1])
+        self.assertFalse(
+            Recipe.all_objects.filter(pk=self.recipes[1].pk).exists()
+        )
+        self.assertFalse(DeletionJob.objects.exists())
+
+    def test_large_recipe(self):
+        recipe = self.recipes[0]
+        deletion.delete_recipe(recipe)
+        self.assertFalse(Recipe.objects.filter(pk=recipe.pk).exists())
+        self.assertTrue(Recipe.all_objects.filter(pk=recipe.pk).exists())
+
+        job = self.run_job()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertGreaterEqual(job.deleted_rows, 4)
+        self.assertFalse(Recipe.all_objects.filter(pk=recipe.pk).exists())
+        self.assertFalse(FavoriteRecipe.objects.filter(recipe=recipe).exists())
+        self.assertIsNone(deletion.claim_job())
+
+    def test_large_user(self):
+        deletion.delete_user(self.author)
+        self.author.refresh_from_db()
+        self.assertFalse(self.author.is_active)
+        self.assertFalse(Recipe.objects.filter(author=self.author).exists())
+
+        self.assertEqual(self.run_job().status, DeletionJob.DONE)
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Recipe.all_objects.exists())
+        self.assertFalse(Follow.objects.exists())
+
+    def test_stale_job_is_picked_up_again(self):
+        deletion.delete_recipe(self.recipes[0])
+        job = deletion.claim_job()
+        self.assertIsNone(deletion.claim_job())
+        DeletionJob.objects.filter(pk=job.pk).update(
+            heartbeat=timezone.now() - timedelta(
+                seconds=settings.DELETION_JOB_TIMEOUT + 1
+            )
+        )
+        self.assertEqual(deletion.claim_job(), job)
+
+    def test_failed_job(self):
+        deletion.delete_recipe(self.recipes[0])
+        with mock.patch.object(
+            deletion.JobRunner, 'delete_in_batches',
+            side_effect=RuntimeError('boom')
+        ), self.assertLogs('recipes.deletion', 'ERROR'):
+            job = self.run_job()
+        self.assertEqual(job.status, DeletionJob.FAILED)
+        self.assertIn('boom', job.error)
+        self.assertTrue(
+            Recipe.all_objects.filter(pk=self.recipes[0].pk).exists()
+        )
+
+
+class MediaTests(TestCase):
+    """Recipes with the same picture share one file, counted in
+    MediaFile and removed with its last reference."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password-12345'
+        )
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, MEDIA_REMOVE_GRACE=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create(self, content=b'picture'):
+        return Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10,
+            image=SimpleUploadedFile('photo.PNG', content)
+        )
+
+    def references(self, name):
+        return MediaFile.objects.filter(name=name).values_list(
+            'references', flat=True
+        ).first()
+
+    def test_same_content_is_stored_once(self):
+        first, second = self.create(), self.create()
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertTrue(name.startswith('recipes/'))
+        self.assertTrue(name.endswith('.png'))
+        self.assertEqual(self.references(name), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.references(name), 1)
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertIsNone(self.references(name))
+        self.assertFalse(default_storage.exists(name))
+
+    def test_replaced_image_is_released(self):
+        recipe = self.create(b'old')
+        old = recipe.image.name
+        recipe.image = SimpleUploadedFile('photo.png', b'new')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        self.assertEqual(self.references(recipe.image.name), 1)
+        self.assertFalse(default_storage.exists(old))
+
+    @override_settings(MEDIA_REMOVE_GRACE=60)
+    def test_recently_saved_file_is_kept(self):
+        recipe = self.create()
+        name = recipe.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(self.references(name), 0)
+
+    def test_collect_garbage(self):
+        kept = self.create(b'kept').image.name
+        stray = default_storage.save(
+            'recipes/stray.png', SimpleUploadedFile('stray.png', b'stray')
+        )
+        past = time.time() - 10
+        for name in (kept, stray):
+            os.utime(default_storage.path(name), (past, past))
+
+        self.assertEqual(
+            list(media.collect_garbage(grace=5, dry_run=True)),
+            [(stray, 5)]
+        )
+        self.assertTrue(default_storage.exists(stray))
+        self.assertEqual(list(media.collect_garbage(grace=5)), [(stray, 5)])
+        self.assertFalse(default_storage.exists(stray))
+        self.assertTrue(default_storage.exists(kept))
+
+
+@override_settings(TIMELINE_FANOUT_LIMIT=100)
+class TransferTests(TestCase):
+    """Two authors of three recipes each and two readers who follow
+    them, favorite and save them. Rows are compared by natural keys
+    since ids change on import."""
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='password-12345'
+            )
+            for number in range(2)
+        ]
+        readers = [
+            User.objects.create_user(
+                username=f'reader{number}',
+                email=f'reader{number}@example.com',
+                password='password-12345'
+            )
+            for number in range(2)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}'
+            )
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(5)
+        ]
+        for number in range(6):
+            recipe = Recipe.objects.create(
+                author=authors[number % 2], name=f'Рецепт {number}',
+                text='Описание', cooking_time=10 + number
+            )
+            recipe.tags.set(tags[number % 3:])
+            # The last recipe has no ingredients.
+            for amount, ingredient in enumerate(ingredients[number:], 1):
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+            FavoriteRecipe.objects.create(
+                user=readers[number % 2], recipe=recipe
+            )
+            if number % 3 == 0:
+                ShoppingCart.objects.create(user=readers[0], recipe=recipe)
+        for reader in readers:
+            for author in authors:
+                Follow.objects.create(user=reader, author=author)
+        Follow.objects.create(user=authors[0], author=authors[1])
+
+    def dataset(self):
+        return {
+            'tags': set(Tag.objects.values_list('name', 'color', 'slug')),
+            'ingredients': set(Ingredient.objects.values_list(
+                'name', 'measurement_unit'
+            )),
+            'users': set(User.objects.values_list(
+                'username', 'email', 'password', 'date_joined'
+            )),
+            'recipes': set(Recipe.objects.values_list(
+                'author__username', 'name', 'text', 'cooking_time',
+                'created'
+            )),
+            'amounts': set(RecipeIngredient.objects.values_list(
+                'recipe__name', 'ingredient__name', 'amount'
+            )),
+            'recipe_tags': set(Recipe.tags.through.objects.values_list(
+                'recipe__name', 'tag__slug'
+            )),
+            'favorites': set(FavoriteRecipe.objects.values_list(
+                'user__username', 'recipe__name', 'created'
+            )),
+            'carts': set(ShoppingCart.objects.values_list(
+                'user__username', 'recipe__name', 'created'
+            )),
+            'follows': set(Follow.objects.values_list(
+                'user__username', 'author__username'
+            )),
+            'followers': set(FollowerCount.objects.values_list(
+                'author__username', 'followers'
+            )),
+            'timelines': set(TimelineEntry.objects.values_list(
+                'user__username', 'recipe__name'
+            )),
+        }
+
+    def export(self):
+        return b''.join(transfer.export_records()).splitlines()
+
+    def wipe(self):
+        for model in (Recipe, User, Tag, Ingredient):
+            model.objects.all().delete()
+
+    def load(self, lines, batch_size=1000):
+        return transfer.Importer(batch_size).feed(
+            transfer.loads(line) for line in lines
+        )
+
+    def test_round_trip(self):
+        expected = self.dataset()
+        self.assertTrue(expected['timelines'])
+        lines = self.export()
+        self.wipe()
+        self.assertEqual(
+            self.load(lines),
+            {'tag': 3, 'ingredient': 5, 'user': 4, 'recipe': 6,
+             'favorite': 6, 'cart': 2, 'follow': 5}
+        )
+        self.assertEqual(self.dataset(), expected)
+
+    def test_existing_rows_are_matched(self):
+        expected = self.dataset()
+        lines = self.export()
+        self.wipe()
+        # Rows that take the ids of the export and rows of the same
+        # natural keys under other ids.
+        for number in range(10):
+            Ingredient.objects.create(
+                name=f'Соль {number}', measurement_unit='г'
+            )
+        Ingredient.objects.create(name='Ингредиент 4', measurement_unit='г')
+        Tag.objects.create(name='Тег 2', color='#000002', slug='tag2')
+        reader = User.objects.create_user(
+            username='reader1', email='reader1@example.com',
+            password='password-12345'
+        )
+        counts = self.load(lines)
+        self.assertEqual(
+            (counts['tag'], counts['ingredient'], counts['user']), (2, 4, 3)
+        )
+        self.assertEqual(Ingredient.objects.count(), 15)
+        self.assertEqual(
+            User.objects.get(username='reader1').pk, reader.pk
+        )
+        imported = self.dataset()
+        for key in ('recipes', 'amounts', 'recipe_tags', 'favorites',
+                    'carts', 'follows', 'followers', 'timelines'):
+            self.assertEqual(imported[key], expected[key], key)
+
+    def test_groups_across_batches(self):
+        expected = self.dataset()
+        with mock.patch.object(transfer, 'CHUNK_SIZE', 2):
+            lines = self.export()
+        self.assertEqual(lines, self.export())
+        self.wipe()
+        counts = self.load(lines, batch_size=2)
+        self.assertEqual(counts['recipe'], 6)
+        self.assertEqual(self.dataset(), expected)
+
+    def test_commands(self):
+        expected = self.dataset()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'export.jsonl.gz')
+        call_command('export_foodgram', path, stderr=io.StringIO())
+        self.wipe()
+        output = io.StringIO()
+        call_command('import_foodgram', path, batch_size=3, stdout=output)
+        self.assertIn('recipe: 6', output.getvalue())
+        self.assertEqual(self.dataset(), expected)
+
+    def test_merge_join(self):
+        self.assertEqual(
+            list(transfer.merge_join(
+                [(1,), (2,), (4,)],
+                [(1, 'a'), (1, 'b'), (3, 'c'), (4, 'd')],
+                []
+            )),
+            [((1,), [[('a',), ('b',)], []]), ((2,), [[], []]),
+             ((4,), [[('d',)], []])]
+        )
@@ -0,0 +1,169 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import Greatest, RowNumber
+
+from users.models import Follow, FollowerCount
+from .models import Recipe, TimelineEntry
+
+BATCH_SIZE = 1000
+
+
+def pulled(author_ids):
+    return set(
+        FollowerCount.objects.filter(
+            author_id__in=author_ids, pulled=True
+        ).values_list('author_id', flat=True)
+    )
+
+
+def count_followers(author_id, delta):
+    updated = FollowerCount.objects.filter(author_id=author_id).update(
+        followers=Greatest(F('followers') + delta, 0)
+    )
+    if not updated and delta > 0:
+        FollowerCount.objects.bulk_create(
+            [FollowerCount(author_id=author_id)], ignore_conflicts=True
+        )
+        FollowerCount.objects.filter(author_id=author_id).update(
+            followers=F('followers') + delta
+        )
+    settle([author_id])
+
+
+def recount_followers(author_ids):
+    """Counts followers of the authors anew, for follows created in
+    bulk."""
+    author_ids = set(author_ids)
+    counts = dict(
+        Follow.objects.filter(author_id__in=author_ids).values(
+            'author'
+        ).annotate(followers=Count('id')).values_list('author', 'followers')
+    )
+    FollowerCount.objects.bulk_create(
+        [
+            FollowerCount(
+                author_id=author_id, followers=counts.get(author_id, 0)
+            )
+            for author_id in author_ids
+        ],
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['author'],
+        update_fields=['followers']
+    )
+    settle(author_ids)
+
+
+def settle(author_ids):
+    """Authors above TIMELINE_FANOUT_LIMIT followers become pulled. They
+    are pushed again only below TIMELINE_FANOUT_LIMIT -
+    TIMELINE_FANOUT_WINDOW, so an author hovering at the limit does not
+    switch back and forth; their followers are then backfilled with the
+    recipes published while nothing was pushed."""
+    FollowerCount.objects.filter(
+        author_id__in=author_ids,
+        pulled=False,
+        followers__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).update(pulled=True)
+    released = []
+    for author_id in FollowerCount.objects.filter(
+        author_id__in=author_ids,
+        author__is_active=True,
+        pulled=True,
+        followers__lte=(
+            settings.TIMELINE_FANOUT_LIMIT - settings.TIMELINE_FANOUT_WINDOW
+        )
+    ).values_list('author_id', flat=True):
+        if FollowerCount.objects.filter(
+            author_id=author_id, pulled=True
+        ).update(pulled=False):
+            released.append(author_id)
+    for author_id in released:
+        push_to_followers(
+            author_id,
+            list(
+                Recipe.objects.filter(author_id=author_id).order_by(
+                    '-created'
+                ).values_list('id', flat=True)[:settings.TIMELINE_BACKFILL]
+            )
+        )
+
+
+def push(entries):
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def push_to_followers(author_id, recipe_ids):
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    batch = []
+    for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+        batch.extend(
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in recipe_ids
+        )
+        if len(batch) >= BATCH_SIZE:
+            push(batch)
+            batch = []
+    push(batch)
+
+
+def fan_out(recipe):
+    if not pulled([recipe.author_id]):
+        push_to_followers(recipe.author_id, [recipe.pk])
+
+
+def backfill(user_id, author_id):
+    backfill_many([(user_id, author_id)])
+
+
+def backfill_many(pairs):
+    """Puts the TIMELINE_BACKFILL latest recipes of each author into the
+    timelines of the (user_id, author_id) pairs, reading the recipes of
+    all authors with one query."""
+    followers = defaultdict(list)
+    for user_id, author_id in pairs:
+        followers[author_id].append(user_id)
+    for author_id in pulled(followers):
+        del followers[author_id]
+    if not followers:
+        return
+    recipes = Recipe.objects.filter(author_id__in=followers).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=F('created').desc()
+        )
+    ).filter(position__lte=settings.TIMELINE_BACKFILL).values_list(
+        'author_id', 'id'
+    )
+    push([
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+        for author_id, recipe_id in recipes
+        for user_id in followers[author_id]
+    ])
+
+
+def trim(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def feed(user):
+    # Read from FollowerCount on every request, so all workers see an
+    # author switch at once.
+    pulled = list(
+        Follow.objects.filter(
+            user=user, author__follower_count__pulled=True
+        ).values_list('author_id', flat=True)
+    )
+    if not pulled:
+        return Recipe.objects.filter(timeline_entries__user=user)
+    pushed = TimelineEntry.objects.filter(user=user).values('recipe_id')
+    return Recipe.objects.filter(Q(pk__in=pushed) | Q(author_id__in=pulled))
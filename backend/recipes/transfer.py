@@ -0,0 +1,328 @@
+import json
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+
+from users.models import Follow
+from . import media, timeline
+from .models import (FavoriteRecipe, Ingredient, IngredientChange, Recipe,
+                     RecipeIngredient, ShoppingCart, Tag)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+User = get_user_model()
+RecipeTag = Recipe.tags.through
+
+CHUNK_SIZE = 2000
+
+# Record types in the order they are written; every type only refers to
+# ids of the types before it.
+USER_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'password',
+    'is_active', 'is_staff', 'is_superuser', 'date_joined'
+)
+RECIPE_FIELDS = (
+    'id', 'author_id', 'name', 'image', 'text', 'cooking_time', 'created',
+    'updated'
+)
+SOURCES = (
+    ('tag', Tag.objects, ('id', 'name', 'color', 'slug')),
+    ('ingredient', Ingredient.objects, ('id', 'name', 'measurement_unit')),
+    ('user', User.objects, USER_FIELDS),
+    # Recipes pending deletion are not exported, nor is what refers to
+    # them.
+    ('favorite', FavoriteRecipe.objects.filter(recipe__is_deleted=False),
+     ('user_id', 'recipe_id', 'created')),
+    ('cart', ShoppingCart.objects.filter(recipe__is_deleted=False),
+     ('user_id', 'recipe_id', 'created')),
+    ('follow', Follow.objects, (
+        'user_id', 'author_id', 'following_id', 'created_at'
+    )),
+)
+# Dates that the import keeps instead of stamping the load time.
+AUTO_DATE_FIELDS = (
+    Recipe._meta.get_field('created'),
+    Recipe._meta.get_field('updated'),
+    Follow._meta.get_field('created_at'),
+    FavoriteRecipe._meta.get_field('created'),
+    ShoppingCart._meta.get_field('created'),
+)
+
+
+def dumps(record):
+    if orjson is not None:
+        return orjson.dumps(record) + b'\n'
+    return (json.dumps(record, ensure_ascii=False) + '\n').encode()
+
+
+def loads(line):
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+def stream(queryset, fields, order_by='id'):
+    return queryset.order_by(order_by).values_list(*fields).iterator(
+        chunk_size=CHUNK_SIZE
+    )
+
+
+def merge_join(rows, *children):
+    """Attaches to every row sorted by id the groups of child rows
+    (parent_id, ...) sorted by parent_id, reading each input once."""
+    children = [iter(child) for child in children]
+    heads = [next(child, None) for child in children]
+    for row in rows:
+        groups = []
+        for number, child in enumerate(children):
+            group = []
+            while heads[number] is not None and heads[number][0] <= row[0]:
+                if heads[number][0] == row[0]:
+                    group.append(heads[number][1:])
+                heads[number] = next(child, None)
+            groups.append(group)
+        yield row, groups
+
+
+def serialize(values):
+    return {
+        name: value.isoformat() if isinstance(value, datetime) else value
+        for name, value in values
+    }
+
+
+def export_records():
+    """Yields JSON Lines of the whole dataset with constant memory."""
+    for kind, manager, fields in SOURCES[:3]:
+        for row in stream(manager, fields):
+            yield dumps({'type': kind, **serialize(zip(fields, row))})
+    recipes = merge_join(
+        stream(Recipe.objects, RECIPE_FIELDS),
+        stream(
+            RecipeIngredient.objects,
+            ('recipe_id', 'ingredient_id', 'amount'),
+            order_by='recipe_id'
+        ),
+        stream(RecipeTag.objects, ('recipe_id', 'tag_id'), 'recipe_id')
+    )
+    for row, (ingredients, tags) in recipes:
+        record = serialize(zip(RECIPE_FIELDS, row))
+        record['ingredients'] = [list(pair) for pair in ingredients]
+        record['tags'] = [tag_id for tag_id, in tags]
+        yield dumps({'type': 'recipe', **record})
+    for kind, manager, fields in SOURCES[3:]:
+        for row in stream(manager, fields):
+            yield dumps({'type': kind, **serialize(zip(fields, row))})
+
+
+@contextmanager
+def keep_auto_dates():
+    flags = [
+        (field.auto_now, field.auto_now_add) for field in AUTO_DATE_FIELDS
+    ]
+    for field in AUTO_DATE_FIELDS:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(AUTO_DATE_FIELDS, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Importer:
+    """Bulk-loads export records in batches. Ids of the file are mapped
+    to ids of this database: tags, ingredients and users are matched by
+    slug, (name, unit) and username, recipes are always created."""
+
+    def __init__(self, batch_size=1000):
+        # Recipes are always created and their new ids are needed for
+        # ingredients, tags, favorites and carts.
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError(
+                f'Импорт не поддерживается для {connection.vendor}: СУБД '
+                'должна возвращать id строк, добавленных bulk_create '
+                '(PostgreSQL, SQLite 3.35+, MariaDB 10.5+).'
+            )
+        self.batch_size = batch_size
+        self.ids = {'tag': {}, 'ingredient': {}, 'user': {}, 'recipe': {}}
+        self.counts = {}
+        self.kind = None
+        self.batch = []
+
+    def feed(self, records):
+        with keep_auto_dates():
+            for record in records:
+                kind = record.pop('type')
+                if kind != self.kind or len(self.batch) >= self.batch_size:
+                    self.flush()
+                    self.kind = kind
+                self.batch.append(record)
+            self.flush()
+        return self.counts
+
+    def flush(self):
+        if not self.batch:
+            return
+        with transaction.atomic():
+            created = getattr(self, f'load_{self.kind}')(self.batch)
+        self.counts[self.kind] = self.counts.get(self.kind, 0) + created
+        self.batch = []
+
+    def match(self, kind, records, existing, key, create):
+        """Maps records to existing rows by natural key and creates the
+        rest; returns how many rows were created."""
+        found = existing(records)
+        missing = {
+            key(record): record for record in records
+            if key(record) not in found
+        }
+        if missing:
+            create(list(missing.values()))
+            found = existing(records)
+        for record in records:
+            self.ids[kind][record['id']] = found[key(record)]
+        return len(missing)
+
+    def load_tag(self, records):
+        return self.match(
+            'tag',
+            records,
+            lambda records: dict(Tag.objects.filter(
+                slug__in=[record['slug'] for record in records]
+            ).values_list('slug', 'id')),
+            lambda record: record['slug'],
+            lambda records: Tag.objects.bulk_create(
+                [Tag(**self.fields(record)) for record in records],
+                ignore_conflicts=True
+            )
+        )
+
+    def load_ingredient(self, records):
+        def create(records):
+            ingredients = Ingredient.objects.bulk_create(
+                [Ingredient(**self.fields(record)) for record in records]
+            )
+            # Revisions of the catalog, normally written by post_save.
+            IngredientChange.objects.bulk_create(
+                IngredientChange(ingredient_id=ingredient.pk)
+                for ingredient in ingredients
+            )
+
+        def existing(records):
+            return {
+                (name, unit): pk
+                for pk, name, unit in Ingredient.objects.filter(
+                    name__in={record['name'] for record in records}
+                ).values_list('id', 'name', 'measurement_unit')
+            }
+
+        return self.match(
+            'ingredient',
+            records,
+            existing,
+            lambda record: (record['name'], record['measurement_unit']),
+            create
+        )
+
+    def load_user(self, records):
+        for record in records:
+            record['date_joined'] = datetime.fromisoformat(
+                record['date_joined']
+            )
+        return self.match(
+            'user',
+            records,
+            lambda records: dict(User.objects.filter(
+                username__in=[record['username'] for record in records]
+            ).values_list('username', 'id')),
+            lambda record: record['username'],
+            lambda records: User.objects.bulk_create(
+                [User(**self.fields(record)) for record in records],
+                ignore_conflicts=True
+            )
+        )
+
+    def load_recipe(self, records):
+        recipes = [
+            Recipe(
+                author_id=self.ids['user'][record['author_id']],
+                name=record['name'],
+                image=record['image'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                created=datetime.fromisoformat(record['created']),
+                updated=datetime.fromisoformat(record['updated'])
+            )
+            for record in records
+        ]
+        Recipe.objects.bulk_create(recipes)
+        # bulk_create skips the signals that count image references.
+        media.retain(*(recipe.image.name for recipe in recipes))
+        ingredients, tags = [], []
+        for recipe, record in zip(recipes, records):
+            self.ids['recipe'][record['id']] = recipe.pk
+            ingredients.extend(
+                RecipeIngredient(
+                    recipe_id=recipe.pk,
+                    ingredient_id=self.ids['ingredient'][ingredient_id],
+                    amount=amount
+                )
+                for ingredient_id, amount in record['ingredients']
+            )
+            tags.extend(
+                RecipeTag(recipe_id=recipe.pk, tag_id=self.ids['tag'][tag_id])
+                for tag_id in record['tags']
+            )
+        RecipeIngredient.objects.bulk_create(ingredients)
+        RecipeTag.objects.bulk_create(tags, ignore_conflicts=True)
+        return len(recipes)
+
+    def relations(self, model, records):
+        model.objects.bulk_create(
+            [
+                model(
+                    user_id=self.ids['user'][record['user_id']],
+                    recipe_id=self.ids['recipe'][record['recipe_id']],
+                    created=datetime.fromisoformat(record['created'])
+                )
+                for record in records
+            ],
+            ignore_conflicts=True
+        )
+        return len(records)
+
+    def load_favorite(self, records):
+        return self.relations(FavoriteRecipe, records)
+
+    def load_cart(self, records):
+        return self.relations(ShoppingCart, records)
+
+    def load_follow(self, records):
+        users = self.ids['user']
+        follows = [
+            Follow(
+                user_id=users[record['user_id']],
+                author_id=users[record['author_id']],
+                following_id=users.get(record['following_id']),
+                created_at=datetime.fromisoformat(record['created_at'])
+            )
+            for record in records
+        ]
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        # bulk_create does not send post_save, so follower counts and
+        # timelines are updated here, for the whole batch at once.
+        timeline.recount_followers(follow.author_id for follow in follows)
+        timeline.backfill_many(
+            (follow.user_id, follow.author_id) for follow in follows
+        )
+        return len(follows)
+
+    @staticmethod
+    def fields(record):
+        return {
+            name: value for name, value in record.items() if name != 'id'
+        }
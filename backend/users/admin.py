@@ -1,16 +1,55 @@
 from django.contrib import admin
+from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
 
-from.models import Follow
+from recipes.admin_utils import EstimatedCountPaginator, InputFilter
+from .models import Follow
+
+User = get_user_model()
+
+
+class EmailFilter(InputFilter):
+    title = 'email'
+    parameter_name = 'email'
+    lookup = 'email__istartswith'
+
+
+class UsernameFilter(InputFilter):
+    title = 'имени пользователя'
+    parameter_name = 'username'
+    lookup = 'username__istartswith'
+
+
+class FollowUserFilter(InputFilter):
+    title = 'подписчику'
+    parameter_name = 'user'
+    lookup = 'user__username__istartswith'
+
+
+class FollowAuthorFilter(InputFilter):
+    title = 'автору'
+    parameter_name = 'author'
+    lookup = 'author__username__istartswith'
 
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('email', 'username')
-    list_filter = ('email', 'username')
+    list_filter = (EmailFilter, UsernameFilter)
+    search_fields = ('username', 'email')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+admin.site.unregister(User)
+admin.site.register(User, CustomUserAdmin)
 
 
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'following')
-    list_filter = ('user', 'following')
-    search_fields = ('user__username', 'following__username')
+    list_display = ('id', 'user', 'author')
+    list_filter = (FollowUserFilter, FollowAuthorFilter)
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    raw_id_fields = ('author', 'user', 'following')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# Same expression as the lhs of istartswith on PostgreSQL; text_pattern_ops
+# lets LIKE 'prefix%' use the index under any collation.
+INDEXES = {
+    'users_username_prefix_idx': 'username',
+    'users_email_prefix_idx': 'email',
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON auth_user '
+            f'(UPPER({column}::text) text_pattern_ops) WHERE is_active'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
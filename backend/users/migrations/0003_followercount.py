@@ -0,0 +1,50 @@
+# Generated by Django 4.2.6 on 2026-10-19 09:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_followers(apps, schema_editor):
+    Follow = apps.get_model('users', 'Follow')
+    FollowerCount = apps.get_model('users', 'FollowerCount')
+    counts = Follow.objects.values('author').annotate(
+        followers=models.Count('id')
+    ).values_list('author', 'followers')
+    FollowerCount.objects.bulk_create(
+        (
+            FollowerCount(
+                author_id=author_id,
+                followers=followers,
+                pulled=followers > settings.TIMELINE_FANOUT_LIMIT
+            )
+            for author_id, followers in counts.iterator()
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0002_user_prefix_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowerCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('followers', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('pulled', models.BooleanField(default=False, verbose_name='Читается при запросе')),
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='follower_count', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Число подписчиков',
+                'verbose_name_plural': 'Числа подписчиков',
+                'indexes': [models.Index(condition=models.Q(('pulled', True)), fields=['author'], name='users_followercount_pulled')],
+            },
+        ),
+        migrations.RunPython(count_followers, migrations.RunPython.noop),
+    ]
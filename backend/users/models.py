@@ -40,3 +40,32 @@ class Follow(models.Model):
 
     def __str__(self):
         return f"{self.user} подписан на {self.following}"
+
+
+class FollowerCount(models.Model):
+    """Followers of an author, kept up to date by the Follow signals.
+    pulled marks authors whose recipes the followed-authors feed reads at
+    request time instead of pushing them to timelines."""
+
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='follower_count',
+        verbose_name='Автор'
+    )
+    followers = models.PositiveIntegerField('Подписчиков', default=0)
+    pulled = models.BooleanField('Читается при запросе', default=False)
+
+    class Meta:
+        verbose_name = 'Число подписчиков'
+        verbose_name_plural = 'Числа подписчиков'
+        indexes = [
+            models.Index(
+                fields=['author'],
+                name='users_followercount_pulled',
+                condition=models.Q(pulled=True)
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.author}: {self.followers}'